@@ -169,6 +169,10 @@ KB_SUFFIX = '_240625'
 MILVUS_HOST_LOCAL = GATEWAY_IP
 MILVUS_PORT = 19540
 MILVUS_COLLECTION_NAME = 'qanything_collection' + KB_SUFFIX
+# Milvus flush调度：同一collection的插入合并后统一flush（group commit），不再每次插入都flush，避免产生大量小segment
+MILVUS_FLUSH_ROWS = 10000  # 未flush的行数达到该值时立即flush
+MILVUS_FLUSH_INTERVAL = 600  # 有未flush的数据时最长等待时间（秒），到时flush
+MILVUS_FLUSH_TIMEOUT = 120  # 强制flush时最长等待时间（秒）
 
 # ES_URL = 'http://es-container-local:9200/'
 ES_URL = f'http://{GATEWAY_IP}:9210/'
@@ -184,10 +188,38 @@ MYSQL_PORT_LOCAL = 3316
 MYSQL_USER_LOCAL = 'root'
 MYSQL_PASSWORD_LOCAL = '123456'
 MYSQL_DATABASE_LOCAL = 'qanything'
+# 异步MySQL连接池（qanything_server的handler使用）
+MYSQL_ASYNC_POOL_SIZE = 16
+MYSQL_ASYNC_MAX_WAITING = 256  # 等待连接和等待数据库线程的请求数上限，超出后直接失败，避免请求无限堆积
+MYSQL_ASYNC_ACQUIRE_TIMEOUT = 10  # 等待空闲连接的最长时间（秒）
+MYSQL_SLOW_QUERY_THRESHOLD = 0.5  # 超过该耗时（秒）的查询记录到日志
+LIST_DOCS_MAX_PAGE_LIMIT = 100  # list_docs每次请求最多读取的文件数
+# 问答记录后台批量写入
+QALOG_QUEUE_SIZE = 2000  # 待写入的问答记录数上限，队列满时请求等待（背压）
+QALOG_QUEUE_PUT_TIMEOUT = 5  # 队列满时最多等待的时间（秒），超时后在请求内直接写入
+QALOG_BATCH_SIZE = 50  # 每条INSERT语句最多写入的记录数
+QALOG_BATCH_MAX_BYTES = 8 * 1024 * 1024  # 每条INSERT语句的最大字节数，需小于MySQL的max_allowed_packet
+QALOG_FLUSH_INTERVAL = 0.5  # 凑批的最长等待时间（秒）
+QALOG_EXPORT_BATCH_SIZE = 500  # 导出问答记录时每批从数据库读取的行数
+FILE_DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 下载原始文件时每次读取发送的字节数
+FILE_BASE64_MAX_SIZE = 20 * 1024 * 1024  # get_file_base64允许的最大文件，更大的文件请使用download_file
+UPLOAD_WORKERS = 4  # 上传文件写盘、估算字符数的线程数
+# 内容哈希和解析配置（扩展名、chunk_size、PDF解析器版本）都相同的文件，直接复制已入库文件的chunk、向量和ES记录，不再解析和embedding
+FILE_DEDUP_ENABLED = True
+# 删除文件/知识库的后台任务
+DELETE_JOB_BATCH_SIZE = 200  # 每批清理的文件数，Milvus、ES、MySQL各执行一次批量删除
+DELETE_JOB_BATCH_INTERVAL = 0.2  # 两批之间的间隔（秒），大批量删除时不占满Milvus和ES，避免影响检索
+DELETE_JOB_POLL_INTERVAL = 5  # 没有新任务通知时检查待执行任务的间隔（秒），进程重启后据此继续未完成的任务
+DELETE_JOB_LEASE = 300  # 执行中的任务超过该时间（秒）没有更新进度，视为执行进程已退出，由其他进程接管
+DELETE_JOB_MAX_ATTEMPTS = 5  # 任务最多执行的次数，超过后标记为failed
 
 LOCAL_OCR_SERVICE_URL = "localhost:7001"
 
 LOCAL_PDF_PARSER_SERVICE_URL = "localhost:9009"
+# PDF解析结果缓存：以文件内容哈希+解析器版本为key，升级解析代码或模型后需修改PDF_PARSER_VERSION使旧缓存失效
+PDF_PARSER_VERSION = 'pdf_parser_v1'
+PDF_PARSE_CACHE_PATH = os.path.join(root_path, "QANY_DB", "pdf_parse_cache")
+PDF_PARSE_CACHE_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 缓存目录最大占用空间（字节），超出后按最近使用时间淘汰
 
 LOCAL_RERANK_SERVICE_URL = "localhost:8001"
 LOCAL_RERANK_MODEL_NAME = 'rerank'
@@ -0,0 +1,163 @@
+from qanything_kernel.configs.model_config import (MYSQL_HOST_LOCAL, MYSQL_PORT_LOCAL, MYSQL_USER_LOCAL,
+                                                   MYSQL_PASSWORD_LOCAL, MYSQL_DATABASE_LOCAL,
+                                                   MYSQL_ASYNC_POOL_SIZE, MYSQL_ASYNC_MAX_WAITING,
+                                                   MYSQL_ASYNC_ACQUIRE_TIMEOUT, MYSQL_SLOW_QUERY_THRESHOLD)
+from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager, is_acl_write
+from qanything_kernel.utils.custom_log import debug_logger
+from pymysql.err import MySQLError
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import aiomysql
+import asyncio
+import inspect
+import time
+
+
+class _BridgedKnowledgeBaseManager(KnowledgeBaseManager):
+    """
+    复用KnowledgeBaseManager中的业务方法，但把其中的execute_query_转发到异步连接池。
+    只在工作线程中使用：方法体在线程里同步执行，每条SQL提交到事件循环上由aiomysql执行并等待结果。
+    """
+
+    def __init__(self, async_manager):
+        # 不调用父类__init__，表结构由同步的KnowledgeBaseManager负责创建
+        self.async_manager = async_manager
+
+    def execute_query_(self, query, params, commit=False, fetch=False, check=False, user_dict=False):
+        future = asyncio.run_coroutine_threadsafe(
+            self.async_manager.execute_query_(query, params, commit=commit, fetch=fetch, check=check,
+                                              user_dict=user_dict), self.async_manager.loop)
+        return future.result()
+
+
+class AsyncKnowledgeBaseManager:
+    """
+    KnowledgeBaseManager的异步版本，供Sanic handler使用，查询不会阻塞事件循环。
+    execute_query_基于aiomysql实现，参数与返回值与同步版本一致（失败时返回None）；
+    KnowledgeBaseManager上的其他方法（get_files、check_kb_exist等）同名可用，调用时需要await，
+    在专用的线程池（线程数与连接数相同）中执行，不占用asyncio.to_thread的默认线程池。
+    连接池满时请求排队等待，排队数量（包括等待线程池的方法调用）和等待时间都有上限；
+    每条查询记录等待连接和执行的耗时，慢查询写入日志。
+    """
+
+    def __init__(self, pool_size=MYSQL_ASYNC_POOL_SIZE, max_waiting=MYSQL_ASYNC_MAX_WAITING,
+                 acquire_timeout=MYSQL_ASYNC_ACQUIRE_TIMEOUT, slow_query_threshold=MYSQL_SLOW_QUERY_THRESHOLD):
+        self.pool_size = pool_size
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self.slow_query_threshold = slow_query_threshold
+        self.pool = None
+        self.loop = None
+        self.waiting = 0
+        # 已提交到bridge_executor、尚未完成的方法调用数，超过pool_size的部分在线程池中排队
+        self.bridge_calls = 0
+        self.bridge_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='mysql_bridge')
+        # 本进程最近一次修改权限相关数据的时间，权限缓存据此立即重新检查版本号
+        self.acl_changed_time = 0
+        self.bridged = _BridgedKnowledgeBaseManager(self)
+
+    async def init(self, loop=None):
+        # 使用autocommit，只读查询不会在归还的连接上留下打开的事务（旧快照）
+        self.loop = loop or asyncio.get_running_loop()
+        self.pool = await aiomysql.create_pool(host=MYSQL_HOST_LOCAL, port=MYSQL_PORT_LOCAL, user=MYSQL_USER_LOCAL,
+                                               password=MYSQL_PASSWORD_LOCAL, db=MYSQL_DATABASE_LOCAL,
+                                               minsize=1, maxsize=self.pool_size, charset='utf8mb4',
+                                               autocommit=True, pool_recycle=3600)
+        debug_logger.info("[SUCCESS] 异步数据库连接池创建成功，连接数上限 {}".format(self.pool_size))
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+        self.bridge_executor.shutdown(wait=False)
+
+    async def acquire_(self):
+        if self.waiting >= self.max_waiting:
+            debug_logger.error("等待数据库连接的请求数已达上限 {}，拒绝本次查询".format(self.max_waiting))
+            return None
+        self.waiting += 1
+        try:
+            return await asyncio.wait_for(self.pool.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            debug_logger.error("等待数据库连接超时（{}秒），当前连接池状态：空闲连接数 {}，总连接数 {}，等待数 {}".format(
+                self.acquire_timeout, self.pool.freesize, self.pool.size, self.waiting))
+            return None
+        except MySQLError as err:
+            debug_logger.error("从连接池获取连接失败：{}".format(err))
+            return None
+        finally:
+            self.waiting -= 1
+
+    async def execute_query_(self, query, params, commit=False, fetch=False, check=False, user_dict=False):
+        start = time.perf_counter()
+        conn = await self.acquire_()
+        if conn is None:
+            return None
+        acquired = time.perf_counter()
+
+        result = None
+        acl_changed = False
+        try:
+            async with conn.cursor(aiomysql.DictCursor if user_dict else aiomysql.Cursor) as cursor:
+                await cursor.execute(query, params)
+
+                if commit:
+                    await conn.commit()
+                    acl_changed = is_acl_write(query)
+
+                if fetch:
+                    result = list(await cursor.fetchall())
+                elif check:
+                    result = cursor.rowcount
+        except MySQLError as err:
+            if err.args and err.args[0] == 1061:
+                debug_logger.info(f"Index already exists (this is okay): {query}")
+            else:
+                debug_logger.error("执行数据库操作失败：{}，SQL：{}".format(err, query))
+            if commit:
+                await conn.rollback()
+        finally:
+            self.pool.release(conn)
+
+        if acl_changed:
+            await self.execute_query_("UPDATE AclVersion SET version = version + 1 WHERE id = 1", (), commit=True)
+            self.acl_changed_time = time.time()
+
+        end = time.perf_counter()
+        if end - start > self.slow_query_threshold:
+            debug_logger.warning("慢查询：等待连接 {:.2f} 毫秒，执行 {:.2f} 毫秒，SQL：{}".format(
+                (acquired - start) * 1000, (end - acquired) * 1000, ' '.join(query.split())[:500]))
+        return result
+
+    def __getattr__(self, name):
+        # 只在实例属性中找不到时调用：把KnowledgeBaseManager的业务方法包装成协程，在工作线程中执行
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            attr = inspect.getattr_static(KnowledgeBaseManager, name)
+        except AttributeError:
+            raise AttributeError(name) from None
+        if isinstance(attr, staticmethod):
+            # 静态方法不访问数据库，也不接收实例，按原样同步调用
+            return attr.__func__
+        method = getattr(KnowledgeBaseManager, name)
+        if not inspect.isfunction(method):
+            raise AttributeError(name)
+
+        @functools.wraps(method)
+        async def async_method(*args, **kwargs):
+            queued = max(0, self.bridge_calls - self.pool_size)
+            if self.waiting + queued >= self.max_waiting:
+                debug_logger.error("等待数据库的请求数已达上限 {}（等待连接 {}，等待线程 {}），拒绝本次调用 {}".format(
+                    self.max_waiting, self.waiting, queued, name))
+                return None
+            self.bridge_calls += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.bridge_executor, functools.partial(method, self.bridged, *args, **kwargs))
+            finally:
+                self.bridge_calls -= 1
+
+        setattr(self, name, async_method)
+        return async_method
@@ -0,0 +1,58 @@
+"""
+Documents表父文档的紧凑存储格式。
+
+旧格式：json_data列保存完整的langchain Document JSON，每个chunk都重复存储user_id、kb_id、file_name、faq_dict等文件级元数据。
+新格式：文件级元数据只在DocumentFileMeta表中按file_id存一份；chunk自身的JSON去掉这些字段后压缩存入compact_data列，
+第一个字节标记压缩算法（Z: zstd，z: zlib），安装了zstandard时使用zstd，否则退回zlib。
+"""
+import json
+import zlib
+
+try:
+    import zstandard
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+except ImportError:
+    zstandard = None
+
+# 同一文件所有chunk取值相同的元数据字段
+FILE_LEVEL_METADATA_KEYS = ('user_id', 'kb_id', 'file_id', 'file_name', 'nos_key', 'file_url', 'faq_dict')
+
+
+def split_file_metadata(doc_json):
+    """返回(file_id, 文件级元数据, 去掉文件级元数据后的doc_json)，不修改传入的doc_json"""
+    metadata = doc_json['kwargs'].get('metadata') or {}
+    file_meta = {k: metadata[k] for k in FILE_LEVEL_METADATA_KEYS if k in metadata}
+    chunk_metadata = {k: v for k, v in metadata.items() if k not in file_meta}
+    slim_json = dict(doc_json)
+    slim_json['kwargs'] = dict(doc_json['kwargs'], metadata=chunk_metadata)
+    return metadata.get('file_id'), file_meta, slim_json
+
+
+def encode_document(file_id, slim_json):
+    raw = json.dumps({'f': file_id, 'd': slim_json}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if zstandard is not None:
+        return b'Z' + _zstd_compressor.compress(raw)
+    return b'z' + zlib.compress(raw, 6)
+
+
+def decode_document(compact_data):
+    """返回(file_id, 去掉文件级元数据的doc_json)"""
+    compact_data = bytes(compact_data)
+    codec, body = compact_data[:1], compact_data[1:]
+    if codec == b'Z':
+        if zstandard is None:
+            raise RuntimeError('document is compressed with zstd, please install zstandard')
+        raw = _zstd_decompressor.decompress(body)
+    elif codec == b'z':
+        raw = zlib.decompress(body)
+    else:
+        raise ValueError(f'unknown document codec: {codec}')
+    payload = json.loads(raw)
+    return payload['f'], payload['d']
+
+
+def merge_file_metadata(slim_json, file_meta):
+    """把文件级元数据合并回chunk的metadata，chunk自身的字段优先"""
+    slim_json['kwargs']['metadata'] = {**(file_meta or {}), **slim_json['kwargs'].get('metadata', {})}
+    return slim_json
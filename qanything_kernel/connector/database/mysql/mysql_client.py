@@ -1,7 +1,10 @@
 from qanything_kernel.configs.model_config import (MYSQL_HOST_LOCAL, MYSQL_PORT_LOCAL, MYSQL_USER_LOCAL,
                                                    MYSQL_PASSWORD_LOCAL,
-                                                   MYSQL_DATABASE_LOCAL, KB_SUFFIX, MILVUS_HOST_LOCAL)
+                                                   MYSQL_DATABASE_LOCAL, KB_SUFFIX, MILVUS_HOST_LOCAL,
+                                                   QALOG_BATCH_SIZE, QALOG_BATCH_MAX_BYTES)
 from qanything_kernel.utils.custom_log import debug_logger, insert_logger
+from qanything_kernel.connector.database.mysql.document_codec import (split_file_metadata, encode_document,
+                                                                      decode_document, merge_file_metadata)
 import mysql.connector
 from mysql.connector import pooling
 import json
@@ -10,10 +13,43 @@ import uuid
 from datetime import datetime, timedelta
 from collections import defaultdict
 from mysql.connector.errors import Error as MySQLError
+import threading
+import random
 import bcrypt
+import time
+import re
+
+# 写入这些表会改变用户的有效知识库权限，需要递增AclVersion使各进程的权限缓存失效
+ACL_TABLES = {'KnowledgeBaseAccess', 'GroupMember', 'UserGroup', 'Department', 'User'}
+ACL_WRITE_PATTERN = re.compile(r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)`?(.*)',
+                               re.I | re.S)
+# KnowledgeBase表只更新名称、最近问答/入库时间时不影响权限
+KB_NON_ACL_UPDATE_PATTERN = re.compile(r'\s*SET\s+(?:kb_name|latest_qa_time|latest_insert_time)\s*=\s*%s\s+WHERE', re.I)
+PERMISSION_LEVELS = {'read': 1, 'write': 2, 'admin': 3}
+
+
+def is_acl_write(query):
+    match = ACL_WRITE_PATTERN.match(query)
+    if not match:
+        return False
+    table, rest = match.group(1), match.group(2)
+    if table in ACL_TABLES:
+        return True
+    return table == 'KnowledgeBase' and not KB_NON_ACL_UPDATE_PATTERN.match(rest)
 
 
 class KnowledgeBaseManager:
+    # 知识库快照导出/导入的File表字段
+    FILE_RECORD_COLUMNS = ('file_id', 'user_id', 'kb_id', 'file_name', 'status', 'msg', 'file_size', 'content_length',
+                           'chunks_number', 'file_location', 'file_url', 'upload_infos', 'chunk_size', 'timestamp',
+                           'content_hash', 'parse_config')
+    # Documents表的file_id/chunk_index列回填完成后才能按列查询，回填期间仍使用doc_id前缀匹配
+    documents_file_id_ready = False
+    documents_file_id_check_time = 0
+    # QaLogKb映射表回填完成后才能按kb_id查询问答记录，回填期间仍使用kb_ids LIKE匹配
+    qalog_kb_ready = False
+    qalog_kb_check_time = 0
+
     def __init__(self, pool_size=8):
         host = MYSQL_HOST_LOCAL
         port = MYSQL_PORT_LOCAL
@@ -75,6 +111,7 @@ class KnowledgeBaseManager:
 
         result = None
         cursor = None
+        acl_changed = False
         try:
             if user_dict:
                 cursor = conn.cursor(dictionary=True)
@@ -84,6 +121,7 @@ class KnowledgeBaseManager:
 
             if commit:
                 conn.commit()
+                acl_changed = is_acl_write(query)
 
             if fetch:
                 result = cursor.fetchall()
@@ -106,9 +144,21 @@ class KnowledgeBaseManager:
                 debug_logger.info("连接关闭，返回连接池。当前连接池状态：空闲连接数 {}，已使用连接数 {}".format(
                     self.free_cnx, self.used_cnx))
 
+        if acl_changed:
+            self.bump_acl_version()
         return result
 
     def create_tables_(self):
+        # 权限版本号，任何影响知识库权限的写入都会递增，用于使权限缓存失效
+        query = """
+            CREATE TABLE IF NOT EXISTS AclVersion (
+                id INT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
+        self.execute_query_(query, (), commit=True)
+        self.execute_query_("INSERT IGNORE INTO AclVersion (id, version) VALUES (1, 0)", (), commit=True)
+
         query = """
             CREATE TABLE IF NOT EXISTS User (
                 id INT AUTO_INCREMENT PRIMARY KEY,
@@ -185,7 +235,9 @@ class KnowledgeBaseManager:
                 file_url VARCHAR(2048) DEFAULT '',
                 upload_infos TEXT,
                 chunk_size INT DEFAULT -1,
-                timestamp VARCHAR(255) DEFAULT '197001010000'
+                timestamp VARCHAR(255) DEFAULT '197001010000',
+                content_hash CHAR(64) DEFAULT NULL,
+                parse_config VARCHAR(255) DEFAULT NULL
             );
 
         """
@@ -213,10 +265,57 @@ class KnowledgeBaseManager:
             CREATE TABLE IF NOT EXISTS Documents (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 doc_id VARCHAR(255) UNIQUE,
-                json_data LONGTEXT
+                file_id VARCHAR(255) DEFAULT NULL,
+                chunk_index INT DEFAULT NULL,
+                json_data LONGTEXT,
+                compact_data LONGBLOB DEFAULT NULL
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
 
+        self.execute_query_(query, (), commit=True)
+
+        # 复制/移动知识库时新文件与源文件的对应关系，入库服务据此直接复制源文件的向量、ES记录和父文档，处理完成后删除
+        query = """
+            CREATE TABLE IF NOT EXISTS FileClone (
+                file_id VARCHAR(255) PRIMARY KEY,
+                src_file_id VARCHAR(255) NOT NULL,
+                src_kb_id VARCHAR(255) NOT NULL,
+                move BOOL DEFAULT 0,
+                creation_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
+        self.execute_query_(query, (), commit=True)
+
+        # 删除文件/知识库的后台任务：请求内只把记录标记为删除，向量、ES、父文档和磁盘文件由DeleteJobWorker分批清理，
+        # progress是已处理的文件数，进程重启后从progress继续；running状态超过租期没有更新的任务由其他进程接管
+        query = """
+            CREATE TABLE IF NOT EXISTS DeleteJob (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                job_id VARCHAR(64) UNIQUE,
+                user_id VARCHAR(255),
+                kb_id VARCHAR(255),
+                job_type VARCHAR(16),
+                file_ids LONGTEXT,
+                status VARCHAR(16) DEFAULT 'pending',
+                total INT DEFAULT 0,
+                progress INT DEFAULT 0,
+                attempts INT DEFAULT 0,
+                owner VARCHAR(255),
+                msg TEXT,
+                creation_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_status_update_time (status, update_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
+        self.execute_query_(query, (), commit=True)
+
+        # 父文档的文件级元数据，每个文件一行，Documents中的紧凑格式chunk不再重复存储
+        query = """
+            CREATE TABLE IF NOT EXISTS DocumentFileMeta (
+                file_id VARCHAR(255) PRIMARY KEY,
+                metadata MEDIUMTEXT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
         self.execute_query_(query, (), commit=True)
         # 创建一个QaLogs表，用于记录用户的操作日志
         """
@@ -344,13 +443,82 @@ class KnowledgeBaseManager:
         """
         self.execute_query_(query, (), commit=True)
         
+        # 记录已完成的数据迁移
+        query = """
+            CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                name VARCHAR(255) PRIMARY KEY,
+                finished_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
+        self.execute_query_(query, (), commit=True)
+
+        # 问答记录与知识库的映射，QaLogs.kb_ids是JSON数组，无法走索引按知识库筛选
+        query = """
+            CREATE TABLE IF NOT EXISTS QaLogKb (
+                kb_id VARCHAR(255) NOT NULL,
+                qa_id VARCHAR(255) NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                PRIMARY KEY (kb_id, qa_id),
+                INDEX idx_kb_timestamp (kb_id, timestamp),
+                INDEX idx_qa_id (qa_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """
+        self.execute_query_(query, (), commit=True)
+
+        # 旧版本的Documents表没有file_id/chunk_index列，在线添加（不锁表），之后由后台线程分批回填
+        check_documents_file_id = """
+            SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE table_schema=DATABASE() 
+            AND table_name='Documents' 
+            AND column_name='file_id'
+        """
+        result = self.execute_query_(check_documents_file_id, (), fetch=True)
+        if result and result[0][0] == 0:
+            self.execute_query_("ALTER TABLE Documents ADD COLUMN file_id VARCHAR(255) DEFAULT NULL, "
+                                "ADD COLUMN chunk_index INT DEFAULT NULL, ALGORITHM=INPLACE, LOCK=NONE",
+                                (), commit=True)
+            debug_logger.info("Columns file_id, chunk_index added to Documents successfully")
+
+        check_documents_compact_data = """
+            SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE table_schema=DATABASE() 
+            AND table_name='Documents' 
+            AND column_name='compact_data'
+        """
+        result = self.execute_query_(check_documents_compact_data, (), fetch=True)
+        if result and result[0][0] == 0:
+            # 旧数据保留json_data，读取时兼容两种格式
+            self.execute_query_("ALTER TABLE Documents ADD COLUMN compact_data LONGBLOB DEFAULT NULL, "
+                                "ALGORITHM=INPLACE, LOCK=NONE", (), commit=True)
+            debug_logger.info("Column compact_data added to Documents successfully")
+
+        check_file_content_hash = """
+            SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE table_schema=DATABASE() 
+            AND table_name='File' 
+            AND column_name='content_hash'
+        """
+        result = self.execute_query_(check_file_content_hash, (), fetch=True)
+        if result and result[0][0] == 0:
+            # 旧文件没有哈希，不参与去重
+            self.execute_query_("ALTER TABLE File ADD COLUMN content_hash CHAR(64) DEFAULT NULL, "
+                                "ADD COLUMN parse_config VARCHAR(255) DEFAULT NULL, ALGORITHM=INPLACE, LOCK=NONE",
+                                (), commit=True)
+            debug_logger.info("Columns content_hash, parse_config added to File successfully")
+
         # 修改索引创建方式
         index_queries = [
+            "CREATE INDEX idx_file_id_chunk_index ON Documents (file_id, chunk_index)",
             "CREATE INDEX index_kb_id_deleted ON File (kb_id, deleted)",
+            "CREATE INDEX idx_kb_deleted_timestamp ON File (kb_id, deleted, timestamp)",
+            "CREATE INDEX idx_kb_deleted_status ON File (kb_id, deleted, status)",
             "CREATE INDEX idx_user_id_status ON File (user_id, status)",
+            "CREATE INDEX idx_content_hash ON File (content_hash, parse_config)",
             "CREATE INDEX index_bot_id ON QaLogs (bot_id)",
             "CREATE INDEX index_query ON QaLogs (query)",
             "CREATE INDEX index_timestamp ON QaLogs (timestamp)",
+            "CREATE INDEX idx_user_timestamp ON QaLogs (user_id, timestamp)",
+            "CREATE INDEX idx_bot_timestamp ON QaLogs (bot_id, timestamp)",
             "CREATE INDEX idx_user_dept ON User(dept_id)",
             "CREATE INDEX idx_user_email ON User(email)",
         ]
@@ -399,6 +567,79 @@ class KnowledgeBaseManager:
 
         debug_logger.info("All tables and indexes checked/created successfully.")
 
+        if not self.check_documents_file_id_ready():
+            threading.Thread(target=self.backfill_documents_file_id, daemon=True).start()
+        if not self.check_qalog_kb_ready():
+            threading.Thread(target=self.backfill_qalog_kb, daemon=True).start()
+
+    @staticmethod
+    def parse_doc_id(doc_id):
+        """父文档的doc_id形如file_id_i，返回(file_id, i)；表格等其他文档的doc_id不符合该格式，返回(None, None)"""
+        file_id, _, chunk_index = doc_id.rpartition('_')
+        if file_id and chunk_index.isdigit():
+            return file_id, int(chunk_index)
+        return None, None
+
+    def check_documents_file_id_ready(self):
+        # 其他进程可能已经完成回填，最多每分钟查询一次迁移记录
+        if not self.documents_file_id_ready and time.time() - self.documents_file_id_check_time > 60:
+            self.documents_file_id_check_time = time.time()
+            query = "SELECT 1 FROM SchemaMigrations WHERE name = 'documents_file_id'"
+            self.documents_file_id_ready = bool(self.execute_query_(query, (), fetch=True))
+        return self.documents_file_id_ready
+
+    def backfill_documents_file_id(self, batch_size=5000):
+        """按主键范围分批回填Documents表的file_id/chunk_index，每批是一个短事务，不影响线上读写"""
+        result = self.execute_query_("SELECT MAX(id) FROM Documents", (), fetch=True)
+        max_id = result[0][0] if result and result[0][0] else 0
+        debug_logger.info(f"backfill Documents file_id start, max id: {max_id}")
+        query = """
+            UPDATE Documents SET file_id = SUBSTRING_INDEX(doc_id, '_', 1),
+                chunk_index = CAST(SUBSTRING_INDEX(doc_id, '_', -1) AS UNSIGNED)
+            WHERE id > %s AND id <= %s AND file_id IS NULL AND doc_id REGEXP '^[^_]+_[0-9]+$'
+        """
+        updated = 0
+        for start_id in range(0, max_id, batch_size):
+            res = self.execute_query_(query, (start_id, start_id + batch_size), commit=True, check=True)
+            if res is None:
+                debug_logger.error(f"backfill Documents file_id failed at id {start_id}, will retry on next start")
+                return
+            updated += res
+        self.execute_query_("INSERT IGNORE INTO SchemaMigrations (name) VALUES ('documents_file_id')", (), commit=True)
+        self.documents_file_id_ready = True
+        debug_logger.info(f"backfill Documents file_id finished, updated rows: {updated}")
+
+    def check_qalog_kb_ready(self):
+        if not self.qalog_kb_ready and time.time() - self.qalog_kb_check_time > 60:
+            self.qalog_kb_check_time = time.time()
+            query = "SELECT 1 FROM SchemaMigrations WHERE name = 'qalog_kb'"
+            self.qalog_kb_ready = bool(self.execute_query_(query, (), fetch=True))
+        return self.qalog_kb_ready
+
+    # 把QaLogs.kb_ids展开成QaLogKb的行，调用方补充WHERE条件
+    QALOG_KB_INSERT = """
+        INSERT IGNORE INTO QaLogKb (kb_id, qa_id, timestamp)
+        SELECT jt.kb_id, q.qa_id, q.timestamp
+        FROM QaLogs q, JSON_TABLE(q.kb_ids, '$[*]' COLUMNS (kb_id VARCHAR(255) PATH '$')) jt
+    """
+
+    def backfill_qalog_kb(self, batch_size=5000):
+        """按主键范围分批为已有的问答记录生成QaLogKb映射"""
+        result = self.execute_query_("SELECT MAX(id) FROM QaLogs", (), fetch=True)
+        max_id = result[0][0] if result and result[0][0] else 0
+        debug_logger.info(f"backfill QaLogKb start, max id: {max_id}")
+        query = self.QALOG_KB_INSERT + " WHERE q.id > %s AND q.id <= %s AND JSON_VALID(q.kb_ids)"
+        inserted = 0
+        for start_id in range(0, max_id, batch_size):
+            res = self.execute_query_(query, (start_id, start_id + batch_size), commit=True, check=True)
+            if res is None:
+                debug_logger.error(f"backfill QaLogKb failed at id {start_id}, will retry on next start")
+                return
+            inserted += res
+        self.execute_query_("INSERT IGNORE INTO SchemaMigrations (name) VALUES ('qalog_kb')", (), commit=True)
+        self.qalog_kb_ready = True
+        debug_logger.info(f"backfill QaLogKb finished, inserted rows: {inserted}")
+
     def update_file_msg(self, file_id, msg):
         query = "UPDATE File SET msg = %s WHERE file_id = %s"
         insert_logger.info(f"Update file msg: {file_id} {msg}")
@@ -551,6 +792,65 @@ class KnowledgeBaseManager:
         query = "SELECT user_id FROM User"
         return self.execute_query_(query, (), fetch=True)
 
+    def query_by_ids_(self, query, ids, params=(), batch_size=1000):
+        """query中的{}替换为IN列表的占位符，ids分批查询后合并结果"""
+        rows = []
+        ids = list(ids)
+        for i in range(0, len(ids), batch_size):
+            batch_ids = ids[i:i + batch_size]
+            batch_query = query.format(','.join(['%s'] * len(batch_ids)))
+            rows.extend(self.execute_query_(batch_query, list(params) + batch_ids, fetch=True) or [])
+        return rows
+
+    def get_groups_by_user_ids(self, user_ids) -> Dict[str, List]:
+        """批量获取用户所属的用户组，返回{user_id: [(group_id, group_name, join_time)]}"""
+        query = """
+            SELECT gm.user_id, g.group_id, g.group_name, gm.creation_time
+            FROM GroupMember gm
+            JOIN UserGroup g ON gm.group_id = g.group_id
+            WHERE gm.user_id IN ({})
+            ORDER BY gm.creation_time DESC
+        """
+        groups = defaultdict(list)
+        for row in self.query_by_ids_(query, user_ids):
+            groups[row[0]].append(row[1:])
+        return groups
+
+    def get_owned_kbs_by_user_ids(self, user_ids) -> Dict[str, List]:
+        """批量获取用户拥有的知识库，返回{user_id: [(kb_id, kb_name, latest_insert_time)]}"""
+        query = """
+            SELECT user_id, kb_id, kb_name, latest_insert_time
+            FROM KnowledgeBase
+            WHERE user_id IN ({}) AND deleted = 0
+            ORDER BY latest_insert_time DESC
+        """
+        owned_kbs = defaultdict(list)
+        for row in self.query_by_ids_(query, user_ids):
+            owned_kbs[row[0]].append(row[1:])
+        return owned_kbs
+
+    def get_kb_access_by_subject_ids(self, subject_type, subject_ids) -> Dict[str, List]:
+        """
+        批量获取用户/部门/用户组被授予的知识库权限，
+        返回{subject_id: [(kb_id, kb_name, permission_type, granted_by, granted_by_name, granted_at)]}
+        """
+        query = """
+            SELECT kba.subject_id, kb.kb_id, kb.kb_name, kba.permission_type,
+                   kba.granted_by, u.user_name as granted_by_name,
+                   kba.granted_at
+            FROM KnowledgeBaseAccess kba
+            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
+            LEFT JOIN User u ON kba.granted_by = u.user_id
+            WHERE kba.subject_type = %s
+            AND kba.subject_id IN ({})
+            AND kb.deleted = 0
+            ORDER BY kba.granted_at DESC
+        """
+        kb_access = defaultdict(list)
+        for row in self.query_by_ids_(query, subject_ids, params=(subject_type,)):
+            kb_access[row[0]].append(row[1:])
+        return kb_access
+
     def get_user_by_kb_id(self, kb_id):
         query = "SELECT user_id FROM KnowledgeBase WHERE kb_id = %s"
         result = self.execute_query_(query, (kb_id,), fetch=True)
@@ -561,10 +861,10 @@ class KnowledgeBaseManager:
 
     # [知识库] 获取指定kb_ids的知识库
     def get_knowledge_base_name(self, kb_ids):
-        kb_ids_str = ','.join("'{}'".format(str(x)) for x in kb_ids)
-        query = "SELECT user_id, kb_id, kb_name FROM KnowledgeBase WHERE kb_id IN ({}) AND deleted = 0".format(
-            kb_ids_str)
-        return self.execute_query_(query, (), fetch=True)
+        if not kb_ids:
+            return []
+        query = "SELECT user_id, kb_id, kb_name FROM KnowledgeBase WHERE kb_id IN ({}) AND deleted = 0"
+        return self.query_by_ids_(query, kb_ids)
 
     # [知识库] 删除指定知识库
     def delete_knowledge_base(self, user_id, kb_ids):
@@ -603,6 +903,158 @@ class KnowledgeBaseManager:
         )
         return "success"
 
+    def add_files(self, files, batch_size=100):
+        """
+        多行INSERT批量登记文件，files中每项为
+        (file_id, user_id, kb_id, file_name, file_size, file_location, chunk_size, timestamp, file_url, status,
+         content_hash, parse_config)
+        """
+        files = list(files)
+        columns = ("(file_id, user_id, kb_id, file_name, file_size, file_location, chunk_size, timestamp, file_url, "
+                   "status, content_hash, parse_config)")
+        placeholder = "(" + ", ".join(["%s"] * 12) + ")"
+        for i in range(0, len(files), batch_size):
+            batch = files[i:i + batch_size]
+            query = "INSERT INTO File {} VALUES {}".format(columns, ", ".join([placeholder] * len(batch)))
+            self.execute_query_(query, [v for file in batch for v in file], commit=True)
+        return "success"
+
+    def get_dedup_source_files(self, content_hash, parse_config, exclude_file_id, limit=10):
+        """
+        查找内容哈希和解析配置都相同、已入库成功的文件，返回[(file_id, chunks_number, content_length)]，最近入库的在前。
+        通过update_chunks修改过的文件已由mark_file_edited清空content_hash，不会被选为来源，只复用解析服务的原始结果
+        """
+        query = """
+            SELECT file_id, chunks_number, content_length FROM File
+            WHERE content_hash = %s AND parse_config = %s AND status = 'green' AND deleted = 0 AND file_id != %s
+            ORDER BY id DESC LIMIT %s
+        """
+        return self.execute_query_(query, (content_hash, parse_config, exclude_file_id, limit), fetch=True) or []
+
+    def mark_file_edited(self, file_id):
+        # 手动修改过chunk的文件内容不再等于解析结果，清空content_hash使其不再作为去重来源（包括复制出的文件）
+        query = "UPDATE File SET content_hash = NULL WHERE file_id = %s"
+        self.execute_query_(query, (file_id,), commit=True)
+
+    def get_files_for_copy(self, kb_id, file_ids=None):
+        """
+        获取知识库中入库成功、可以复制的文件，file_ids为None时返回全部，
+        返回[(file_id, file_name, file_size, content_length, file_location, file_url, content_hash, parse_config)]
+        """
+        columns = "file_id, file_name, file_size, content_length, file_location, file_url, content_hash, parse_config"
+        if file_ids is None:
+            query = f"SELECT {columns} FROM File WHERE kb_id = %s AND status = 'green' AND deleted = 0 ORDER BY id"
+            return self.execute_query_(query, (kb_id,), fetch=True) or []
+        query = (f"SELECT {columns} FROM File WHERE kb_id = %s AND status = 'green' AND deleted = 0 "
+                 "AND file_id IN ({})")
+        return self.query_by_ids_(query, file_ids, params=(kb_id,))
+
+    def get_file_records(self, kb_id):
+        """获取知识库中入库成功的文件的完整记录，返回FILE_RECORD_COLUMNS为key的dict列表"""
+        query = "SELECT {} FROM File WHERE kb_id = %s AND status = 'green' AND deleted = 0 ORDER BY id".format(
+            ', '.join(self.FILE_RECORD_COLUMNS))
+        return self.execute_query_(query, (kb_id,), fetch=True, user_dict=True) or []
+
+    def add_file_records(self, records, batch_size=100):
+        """按FILE_RECORD_COLUMNS批量写入get_file_records格式的文件记录，返回写入的行数"""
+        records = list(records)
+        placeholder = "(" + ", ".join(["%s"] * len(self.FILE_RECORD_COLUMNS)) + ")"
+        inserted = 0
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            query = "INSERT INTO File ({}) VALUES {}".format(', '.join(self.FILE_RECORD_COLUMNS),
+                                                             ", ".join([placeholder] * len(batch)))
+            params = [record[column] for record in batch for column in self.FILE_RECORD_COLUMNS]
+            inserted += self.execute_query_(query, params, commit=True, check=True) or 0
+        return inserted
+
+    def get_existing_file_ids(self, file_ids):
+        return [row[0] for row in self.query_by_ids_("SELECT file_id FROM File WHERE file_id IN ({})", file_ids)]
+
+    def delete_file_records(self, file_ids, batch_size=100):
+        # 物理删除文件记录，只用于清理导入失败的知识库，正常删除文件用delete_files
+        for i in range(0, len(file_ids), batch_size):
+            batch_file_ids = list(file_ids[i:i + batch_size])
+            query = "DELETE FROM File WHERE file_id IN ({})".format(','.join(['%s'] * len(batch_file_ids)))
+            self.execute_query_(query, batch_file_ids, commit=True)
+
+    def add_file_clones(self, clones, batch_size=500):
+        """clones中每项为(file_id, src_file_id, src_kb_id, move)"""
+        clones = list(clones)
+        for i in range(0, len(clones), batch_size):
+            batch = clones[i:i + batch_size]
+            query = "INSERT INTO FileClone (file_id, src_file_id, src_kb_id, move) VALUES {}".format(
+                ','.join(['(%s, %s, %s, %s)'] * len(batch)))
+            self.execute_query_(query, [v for clone in batch for v in clone], commit=True)
+
+    def get_file_clone(self, file_id):
+        """
+        返回(src_file_id, src_kb_id, move, 源文件的file_location, status, deleted, chunks_number, content_length)，
+        源文件记录不存在时后五项为None；file_id不是复制出的文件时返回None
+        """
+        query = """
+            SELECT c.src_file_id, c.src_kb_id, c.move, f.file_location, f.status, f.deleted, f.chunks_number,
+                   f.content_length
+            FROM FileClone c LEFT JOIN File f ON f.file_id = c.src_file_id
+            WHERE c.file_id = %s
+        """
+        result = self.execute_query_(query, (file_id,), fetch=True)
+        return result[0] if result else None
+
+    def delete_file_clone(self, file_id):
+        self.execute_query_("DELETE FROM FileClone WHERE file_id = %s", (file_id,), commit=True)
+
+    def delete_file_clones(self, file_ids, batch_size=100):
+        for i in range(0, len(file_ids), batch_size):
+            batch_file_ids = list(file_ids[i:i + batch_size])
+            query = "DELETE FROM FileClone WHERE file_id IN ({})".format(','.join(['%s'] * len(batch_file_ids)))
+            self.execute_query_(query, batch_file_ids, commit=True)
+
+    def add_delete_jobs(self, jobs, batch_size=100):
+        """jobs中每项为(job_id, user_id, kb_id, job_type, file_ids, total)，job_type为files时file_ids是JSON列表，kb时为None"""
+        jobs = list(jobs)
+        for i in range(0, len(jobs), batch_size):
+            batch = jobs[i:i + batch_size]
+            query = "INSERT INTO DeleteJob (job_id, user_id, kb_id, job_type, file_ids, total) VALUES {}".format(
+                ','.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch)))
+            self.execute_query_(query, [v for job in batch for v in job], commit=True)
+
+    def claim_delete_job(self, owner, lease):
+        """领取一个待执行或租期已过的任务，多个进程同时领取时只有一个能成功。返回任务的dict，没有任务时返回None"""
+        condition = "(status = 'pending' OR (status = 'running' AND update_time < NOW() - INTERVAL %s SECOND))"
+        query = f"SELECT job_id FROM DeleteJob WHERE {condition} ORDER BY id LIMIT 1"
+        result = self.execute_query_(query, (lease,), fetch=True)
+        if not result:
+            return None
+        job_id = result[0][0]
+        query = (f"UPDATE DeleteJob SET status = 'running', owner = %s, attempts = attempts + 1 "
+                 f"WHERE job_id = %s AND {condition}")
+        if not self.execute_query_(query, (owner, job_id, lease), commit=True, check=True):
+            return None
+        query = ("SELECT job_id, user_id, kb_id, job_type, file_ids, total, progress, attempts FROM DeleteJob "
+                 "WHERE job_id = %s")
+        result = self.execute_query_(query, (job_id,), fetch=True, user_dict=True)
+        return result[0] if result else None
+
+    def update_delete_job_progress(self, job_id, owner, progress, total):
+        """更新进度（同时刷新租期），任务已被其他进程接管时返回False"""
+        query = "UPDATE DeleteJob SET progress = %s, total = %s WHERE job_id = %s AND owner = %s AND status = 'running'"
+        return bool(self.execute_query_(query, (progress, total, job_id, owner), commit=True, check=True))
+
+    def finish_delete_job(self, job_id, owner, status, msg=''):
+        query = "UPDATE DeleteJob SET status = %s, msg = %s WHERE job_id = %s AND owner = %s AND status = 'running'"
+        self.execute_query_(query, (status, msg, job_id, owner), commit=True)
+
+    def get_delete_jobs(self, user_id, job_ids):
+        query = ("SELECT job_id, kb_id, job_type, status, total, progress, attempts, msg, creation_time, update_time "
+                 "FROM DeleteJob WHERE user_id = %s AND job_id IN ({})")
+        return self.query_by_ids_(query, job_ids, params=(user_id,))
+
+    def get_kb_file_ids(self, kb_id):
+        # 包括已标记删除的文件，删除知识库时按File表的顺序分批清理
+        query = "SELECT file_id FROM File WHERE kb_id = %s ORDER BY id"
+        return [row[0] for row in self.execute_query_(query, (kb_id,), fetch=True) or []]
+
     #  更新file中的content_length
     def update_content_length(self, file_id, content_length):
         query = "UPDATE File SET content_length = %s WHERE file_id = %s"
@@ -613,6 +1065,13 @@ class KnowledgeBaseManager:
         query = "UPDATE File SET chunk_size = %s WHERE file_id = %s"
         self.execute_query_(query, (chunks_number, file_id), commit=True)
 
+    def add_chunks_number(self, file_id, delta):
+        # update_chunks增删子chunk后同步修改子chunk数，复制/移动文件时按它校验复制出的向量条数
+        if not delta:
+            return
+        query = "UPDATE File SET chunks_number = chunks_number + %s WHERE file_id = %s"
+        self.execute_query_(query, (delta, file_id), commit=True)
+
     def update_file_status(self, file_id, status):
         query = "UPDATE File SET status = %s WHERE file_id = %s"
         self.execute_query_(query, (status, file_id), commit=True)
@@ -658,6 +1117,42 @@ class KnowledgeBaseManager:
 
         return all_files
 
+    def get_files_page(self, kb_id, page_limit, cursor=None, offset=0):
+        """
+        按上传时间倒序分页获取文件，返回(files, next_cursor)。
+        传入cursor（上一页返回的next_cursor，格式为"timestamp_id"）时使用keyset分页，否则按offset分页；
+        offset分页先在(kb_id, deleted, timestamp)索引上定位本页的id再回表，避免深分页时读取整行。
+        """
+        columns = """f.file_id, f.file_name, f.status, f.file_size, f.content_length, f.timestamp,
+                     f.file_location, f.file_url, f.chunk_size, f.msg, f.id"""
+        if cursor:
+            last_timestamp, last_id = cursor.rsplit('_', 1)
+            query = f"""
+                SELECT {columns} FROM File f
+                WHERE f.kb_id = %s AND f.deleted = 0
+                  AND (f.timestamp < %s OR (f.timestamp = %s AND f.id < %s))
+                ORDER BY f.timestamp DESC, f.id DESC LIMIT %s
+            """
+            params = (kb_id, last_timestamp, last_timestamp, int(last_id), page_limit)
+        else:
+            query = f"""
+                SELECT {columns} FROM File f
+                JOIN (SELECT id FROM File WHERE kb_id = %s AND deleted = 0
+                      ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s) page ON f.id = page.id
+                ORDER BY f.timestamp DESC, f.id DESC
+            """
+            params = (kb_id, page_limit, offset)
+        files = self.execute_query_(query, params, fetch=True) or []
+        next_cursor = None
+        if len(files) == page_limit:
+            next_cursor = f"{files[-1][5]}_{files[-1][10]}"
+        return [file[:10] for file in files], next_cursor
+
+    def get_file_status_count(self, kb_id):
+        query = "SELECT status, COUNT(*) FROM File WHERE kb_id = %s AND deleted = 0 GROUP BY status"
+        result = self.execute_query_(query, (kb_id,), fetch=True) or []
+        return {status: count for status, count in result}
+
     def get_total_status_by_date(self, user_id):
         # 查询指定用户上传的文件数量，按日期和状态分组
         query = """
@@ -715,17 +1210,75 @@ class KnowledgeBaseManager:
         self.execute_query_(query, (kb_id,), commit=True)
 
     def add_document(self, doc_id, json_data):
-        json_data = json.dumps(json_data, ensure_ascii=False)
         # insert_logger.info("add_document: {}".format(doc_id))
-        query = "INSERT IGNORE INTO Documents (doc_id, json_data) VALUES (%s, %s)"
-        self.execute_query_(query, (doc_id, json_data), commit=True, check=True)
+        self.add_documents([(doc_id, json_data)])
+
+    def add_file_metas_(self, file_metas):
+        if not file_metas:
+            return
+        query = ("INSERT INTO DocumentFileMeta (file_id, metadata) VALUES {} "
+                 "ON DUPLICATE KEY UPDATE metadata = VALUES(metadata)").format(','.join(['(%s, %s)'] * len(file_metas)))
+        params = []
+        for file_id, file_meta in file_metas.items():
+            params.extend([file_id, json.dumps(file_meta, ensure_ascii=False)])
+        self.execute_query_(query, params, commit=True)
+
+    def add_documents(self, doc_id_json_pairs, batch_size=100):
+        """
+        以紧凑格式批量写入父文档：文件级元数据写入DocumentFileMeta（每个文件一次），chunk去掉这些字段后压缩存入compact_data
+        """
+        file_metas = {}
+        rows = []
+        for doc_id, doc_json in doc_id_json_pairs:
+            meta_file_id, file_meta, slim_json = split_file_metadata(doc_json)
+            if meta_file_id is None:
+                # 没有file_id无法归一化，按原格式存储
+                rows.append((doc_id, None, None, json.dumps(doc_json, ensure_ascii=False), None))
+                continue
+            file_metas[meta_file_id] = file_meta
+            file_id, chunk_index = self.parse_doc_id(doc_id)
+            rows.append((doc_id, file_id, chunk_index, None, encode_document(meta_file_id, slim_json)))
+        # 先写文件级元数据，保证读到chunk时一定能读到对应的元数据
+        self.add_file_metas_(file_metas)
+        for i in range(0, len(rows), batch_size):
+            batch_rows = rows[i:i + batch_size]
+            query = ("INSERT IGNORE INTO Documents (doc_id, file_id, chunk_index, json_data, compact_data) "
+                     "VALUES {}").format(','.join(['(%s, %s, %s, %s, %s)'] * len(batch_rows)))
+            self.execute_query_(query, [v for row in batch_rows for v in row], commit=True, check=True)
 
     def update_document(self, doc_id, update_content):
         ori_doc_json = self.get_document_by_doc_id(doc_id)
         ori_doc_json['kwargs']['page_content'] = update_content
-        new_doc_json = json.dumps(ori_doc_json, ensure_ascii=False)
-        query = "UPDATE Documents SET json_data = %s WHERE doc_id = %s"
-        self.execute_query_(query, (new_doc_json, doc_id), commit=True, check=True)
+        meta_file_id, file_meta, slim_json = split_file_metadata(ori_doc_json)
+        if meta_file_id is None:
+            query = "UPDATE Documents SET json_data = %s, compact_data = NULL WHERE doc_id = %s"
+            self.execute_query_(query, (json.dumps(ori_doc_json, ensure_ascii=False), doc_id), commit=True, check=True)
+            return
+        self.add_file_metas_({meta_file_id: file_meta})
+        query = "UPDATE Documents SET json_data = NULL, compact_data = %s WHERE doc_id = %s"
+        self.execute_query_(query, (encode_document(meta_file_id, slim_json), doc_id), commit=True, check=True)
+
+    def decode_documents_(self, rows):
+        """rows为(json_data, compact_data)列表，返回完整的doc_json列表，兼容旧格式（json_data）和紧凑格式"""
+        decoded = []
+        meta_file_ids = set()
+        for json_data, compact_data in rows:
+            if compact_data is not None:
+                meta_file_id, slim_json = decode_document(compact_data)
+                meta_file_ids.add(meta_file_id)
+                decoded.append((meta_file_id, slim_json))
+            else:
+                decoded.append((None, json.loads(json_data)))
+        file_metas = {}
+        meta_file_ids = list(meta_file_ids)
+        for i in range(0, len(meta_file_ids), 100):
+            batch_file_ids = meta_file_ids[i:i + 100]
+            query = "SELECT file_id, metadata FROM DocumentFileMeta WHERE file_id IN ({})".format(
+                ','.join(['%s'] * len(batch_file_ids)))
+            for file_id, metadata in self.execute_query_(query, batch_file_ids, fetch=True) or []:
+                file_metas[file_id] = json.loads(metadata)
+        return [doc_json if meta_file_id is None else merge_file_metadata(doc_json, file_metas.get(meta_file_id))
+                for meta_file_id, doc_json in decoded]
 
     def add_faq(self, faq_id, user_id, kb_id, question, answer, nos_keys):
         # insert_logger.info(f"add_faq: {faq_id}, {user_id}, {kb_id}, {question}, {nos_keys}")
@@ -733,11 +1286,13 @@ class KnowledgeBaseManager:
         self.execute_query_(query, (faq_id, user_id, kb_id, question, answer, nos_keys), commit=True)
 
     def get_document_by_file_id(self, file_id, batch_size=100) -> Optional[List]:
+        if self.check_documents_file_id_ready():
+            return self.get_document_by_file_id_indexed(file_id, batch_size)
         # 初始化结果列表
         all_json_datas = []
 
         # 搜索doc_id中包含file_id的所有Doc
-        query = "SELECT doc_id, json_data FROM Documents WHERE doc_id LIKE %s"
+        query = "SELECT doc_id, json_data, compact_data FROM Documents WHERE doc_id LIKE %s"
         offset = 0
 
         while True:
@@ -749,7 +1304,7 @@ class KnowledgeBaseManager:
                 break  # 如果没有更多数据，跳出循环
 
             doc_ids = [doc[0].split('_')[1] for doc in doc_all]
-            json_datas = [json.loads(doc[1]) for doc in doc_all]
+            json_datas = self.decode_documents_([doc[1:] for doc in doc_all])
             for doc_id, json_data in zip(doc_ids, json_datas):
                 json_data['kwargs']['chunk_id'] = file_id + '_' + str(doc_id)
 
@@ -767,17 +1322,74 @@ class KnowledgeBaseManager:
             return sorted_json_datas
         return None
 
+    def get_document_by_file_id_indexed(self, file_id, batch_size=100) -> Optional[List]:
+        # 按(file_id, chunk_index)索引做keyset分页，每批都是一次索引范围扫描，结果天然有序
+        query = ("SELECT chunk_index, json_data, compact_data FROM Documents WHERE file_id = %s AND chunk_index > %s "
+                 "ORDER BY chunk_index LIMIT %s")
+        sorted_json_datas = []
+        last_index = -1
+        while True:
+            doc_all = self.execute_query_(query, (file_id, last_index, batch_size), fetch=True)
+            if not doc_all:
+                break
+            json_datas = self.decode_documents_([doc[1:] for doc in doc_all])
+            for (chunk_index, _, _), json_data in zip(doc_all, json_datas):
+                json_data['kwargs']['chunk_id'] = file_id + '_' + str(chunk_index)
+                sorted_json_datas.append(json_data)
+            last_index = doc_all[-1][0]
+            if len(doc_all) < batch_size:
+                break
+
+        debug_logger.info(f"get_document: file_id: {file_id}, mysql parent documents res: {len(sorted_json_datas)}")
+        return sorted_json_datas or None
+
+    def get_document_count_by_file_id(self, file_id) -> int:
+        if self.check_documents_file_id_ready():
+            query = "SELECT COUNT(*) FROM Documents WHERE file_id = %s"
+            result = self.execute_query_(query, (file_id,), fetch=True)
+            return result[0][0] if result else 0
+        return len(self.get_document_by_file_id(file_id) or [])
+
+    def get_document_page_by_file_id(self, file_id, offset, limit) -> List:
+        """按chunk顺序读取文件的第offset到offset+limit-1个父文档，读取量只与limit有关"""
+        if not self.check_documents_file_id_ready():
+            return (self.get_document_by_file_id(file_id) or [])[offset:offset + limit]
+        # 先在(file_id, chunk_index)索引上定位本页的id，再回表读取文档内容
+        query = """
+            SELECT d.chunk_index, d.json_data, d.compact_data FROM Documents d
+            JOIN (SELECT id FROM Documents WHERE file_id = %s ORDER BY chunk_index LIMIT %s OFFSET %s) page
+            ON d.id = page.id
+            ORDER BY d.chunk_index
+        """
+        doc_all = self.execute_query_(query, (file_id, limit, offset), fetch=True) or []
+        json_datas = self.decode_documents_([doc[1:] for doc in doc_all])
+        for (chunk_index, _, _), json_data in zip(doc_all, json_datas):
+            json_data['kwargs']['chunk_id'] = file_id + '_' + str(chunk_index)
+        return json_datas
+
     def get_document_by_doc_id(self, doc_id) -> Optional[Dict]:
-        query = "SELECT json_data FROM Documents WHERE doc_id = %s"
+        query = "SELECT json_data, compact_data FROM Documents WHERE doc_id = %s"
         doc_all = self.execute_query_(query, (doc_id,), fetch=True)
         if doc_all:
-            doc = json.loads(doc_all[0][0])
+            doc = self.decode_documents_(doc_all[:1])[0]
             # debug_logger.info(f"get_document: doc_id: {doc_id}")
             return doc
         else:
             debug_logger.error(f"get_document: doc_id: {doc_id} not found")
             return None
 
+    def get_documents_by_doc_ids(self, doc_ids, batch_size=100) -> List[Optional[Dict]]:
+        """批量读取父文档，返回与doc_ids一一对应的列表，不存在的为None"""
+        doc_jsons = {}
+        for i in range(0, len(doc_ids), batch_size):
+            batch_doc_ids = list(doc_ids[i:i + batch_size])
+            query = "SELECT doc_id, json_data, compact_data FROM Documents WHERE doc_id IN ({})".format(
+                ','.join(['%s'] * len(batch_doc_ids)))
+            doc_all = self.execute_query_(query, batch_doc_ids, fetch=True) or []
+            for doc, doc_json in zip(doc_all, self.decode_documents_([doc[1:] for doc in doc_all])):
+                doc_jsons[doc[0]] = doc_json
+        return [doc_jsons.get(doc_id) for doc_id in doc_ids]
+
     def get_faq(self, faq_id) -> tuple:
         query = "SELECT user_id, kb_id, question, answer, nos_keys FROM Faqs WHERE faq_id = %s"
         faq_all = self.execute_query_(query, (faq_id,), fetch=True)
@@ -789,7 +1401,36 @@ class KnowledgeBaseManager:
             debug_logger.error(f"get_faq: faq_id: {faq_id} not found")
             return None
 
+    def add_faqs(self, faqs, batch_size=100):
+        """faqs中每项为(faq_id, user_id, kb_id, question, answer, nos_keys)"""
+        faqs = list(faqs)
+        for i in range(0, len(faqs), batch_size):
+            batch = faqs[i:i + batch_size]
+            query = "INSERT INTO Faqs (faq_id, user_id, kb_id, question, answer, nos_keys) VALUES {}".format(
+                ','.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch)))
+            self.execute_query_(query, [v for faq in batch for v in faq], commit=True)
+
+    def get_faqs(self, faq_ids) -> Dict[str, tuple]:
+        """批量获取FAQ，返回{faq_id: (user_id, kb_id, question, answer, nos_keys)}"""
+        faqs = {}
+        for i in range(0, len(faq_ids), 100):
+            batch_faq_ids = list(faq_ids[i:i + 100])
+            query = "SELECT faq_id, user_id, kb_id, question, answer, nos_keys FROM Faqs WHERE faq_id IN ({})".format(
+                ','.join(['%s'] * len(batch_faq_ids)))
+            for faq in self.execute_query_(query, batch_faq_ids, fetch=True) or []:
+                faqs[faq[0]] = faq[1:]
+        return faqs
+
+    def delete_file_metas_(self, file_ids, batch_size=100):
+        # 文件级元数据与父文档一起删除，否则DocumentFileMeta只增不减
+        for i in range(0, len(file_ids), batch_size):
+            batch_file_ids = list(file_ids[i:i + batch_size])
+            query = "DELETE FROM DocumentFileMeta WHERE file_id IN ({})".format(','.join(['%s'] * len(batch_file_ids)))
+            self.execute_query_(query, batch_file_ids, commit=True)
+
     def delete_documents(self, file_ids):
+        if self.check_documents_file_id_ready():
+            return self.delete_documents_indexed(file_ids)
         #  获取所有形如"file_id_"开头的doc_id的documents，然后再删除
         total_deleted = 0
         for file_id in file_ids:
@@ -806,8 +1447,33 @@ class KnowledgeBaseManager:
                         ','.join(['%s'] * len(batch_doc_ids)))
                     res = self.execute_query_(delete_query, batch_doc_ids, commit=True, check=True)
                     total_deleted += res
+        self.delete_file_metas_(file_ids)
+        debug_logger.info(f"Deleted documents count: {total_deleted}")
+
+    def delete_documents_indexed(self, file_ids, batch_size=100, limit=5000):
+        # 按file_id索引删除，每次最多删除limit行，避免大文件产生长事务
+        total_deleted = 0
+        for i in range(0, len(file_ids), batch_size):
+            batch_file_ids = list(file_ids[i:i + batch_size])
+            query = "DELETE FROM Documents WHERE file_id IN ({}) LIMIT {}".format(
+                ','.join(['%s'] * len(batch_file_ids)), limit)
+            while True:
+                res = self.execute_query_(query, batch_file_ids, commit=True, check=True)
+                if not res:
+                    break
+                total_deleted += res
+                if res < limit:
+                    break
+        self.delete_file_metas_(file_ids, batch_size)
         debug_logger.info(f"Deleted documents count: {total_deleted}")
 
+    def delete_documents_by_doc_ids(self, doc_ids, batch_size=100):
+        # 表格文档的doc_id是uuid，不能按file_id删除
+        for i in range(0, len(doc_ids), batch_size):
+            batch_doc_ids = list(doc_ids[i:i + batch_size])
+            query = "DELETE FROM Documents WHERE doc_id IN ({})".format(','.join(['%s'] * len(batch_doc_ids)))
+            self.execute_query_(query, batch_doc_ids, commit=True)
+
     def delete_faqs(self, faq_ids):
         # 分批，因为多个faq_id的加一起可能会超过sql的最大长度
         batch_size = 100
@@ -820,61 +1486,156 @@ class KnowledgeBaseManager:
             total_deleted += res
         debug_logger.info(f"delete_faqs count: {total_deleted}")
 
+    QALOG_COLUMNS = ('qa_id', 'user_id', 'bot_id', 'kb_ids', 'query', 'model', 'product_source', 'time_record',
+                     'history', 'condense_question', 'prompt', 'result', 'retrieval_documents', 'source_documents')
+
+    @staticmethod
+    def qalog_row_(user_id, bot_id, kb_ids, query, model, product_source, time_record, history, condense_question,
+                   prompt, result, retrieval_documents, source_documents, qa_id=None):
+        # 顺序与QALOG_COLUMNS一致，kb_ids、time_record、history和文档列表序列化为JSON
+        return (qa_id or uuid.uuid4().hex, user_id, bot_id, json.dumps(kb_ids, ensure_ascii=False), query, model,
+                product_source, json.dumps(time_record, ensure_ascii=False), json.dumps(history, ensure_ascii=False),
+                condense_question, prompt, result, json.dumps(retrieval_documents, ensure_ascii=False),
+                json.dumps(source_documents, ensure_ascii=False))
+
     def add_qalog(self, user_id, bot_id, kb_ids, query, model, product_source, time_record, history, condense_question,
                   prompt, result, retrieval_documents, source_documents):
         debug_logger.info("add_qalog: {}".format(query))
-        qa_id = uuid.uuid4().hex
-        kb_ids = json.dumps(kb_ids, ensure_ascii=False)
-        retrieval_documents = json.dumps(retrieval_documents, ensure_ascii=False)
-        source_documents = json.dumps(source_documents, ensure_ascii=False)
-        history = json.dumps(history, ensure_ascii=False)
-        time_record = json.dumps(time_record, ensure_ascii=False)
-        insert_query = (
-            "INSERT INTO QaLogs (qa_id, user_id, bot_id, kb_ids, query, model, product_source, time_record, "
-            "history, condense_question, prompt, result, retrieval_documents, source_documents) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
-        self.execute_query_(insert_query, (qa_id, user_id, bot_id, kb_ids, query, model, product_source, time_record,
-                                           history, condense_question, prompt, result, retrieval_documents,
-                                           source_documents), commit=True)
-
-    def get_qalog_by_filter(self, need_info, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None, qa_ids=None):
-        # 判断哪些条件不是None，构建搜索query
-        need_info = ", ".join(need_info)
-        if qa_ids is not None:
-            mysql_query = f"SELECT {need_info} FROM QaLogs WHERE qa_id IN ({','.join(['%s'] * len(qa_ids))})"
-            qa_infos = self.execute_query_(mysql_query, qa_ids, fetch=True)
-        else:
-            mysql_query = f"SELECT {need_info} FROM QaLogs WHERE timestamp BETWEEN %s AND %s"
-            params = list(time_range)
-            if user_id:
-                mysql_query += " AND user_id = %s"
-                params.append(user_id)
-            if any_kb_id:
-                mysql_query += " AND kb_ids LIKE %s"
+        return self.add_qalogs([dict(user_id=user_id, bot_id=bot_id, kb_ids=kb_ids, query=query, model=model,
+                                     product_source=product_source, time_record=time_record, history=history,
+                                     condense_question=condense_question, prompt=prompt, result=result,
+                                     retrieval_documents=retrieval_documents, source_documents=source_documents)])
+
+    def add_qalogs(self, qalogs, batch_size=QALOG_BATCH_SIZE, max_bytes=QALOG_BATCH_MAX_BYTES):
+        """
+        多行INSERT批量写入问答记录，qalogs中每项是add_qalog的参数字典（可带qa_id）。
+        按记录数和字节数切分语句，避免超过max_allowed_packet；返回写入成功的记录数。
+        """
+        rows = [self.qalog_row_(**qalog) for qalog in qalogs]
+        batches, batch, batch_bytes = [], [], 0
+        for row in rows:
+            row_bytes = sum(len(v) for v in row if isinstance(v, str)) * 3
+            if batch and (len(batch) >= batch_size or batch_bytes + row_bytes > max_bytes):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        if batch:
+            batches.append(batch)
+
+        placeholder = '(' + ', '.join(['%s'] * len(self.QALOG_COLUMNS)) + ')'
+        inserted = 0
+        for batch in batches:
+            insert_query = "INSERT IGNORE INTO QaLogs ({}) VALUES {}".format(
+                ', '.join(self.QALOG_COLUMNS), ', '.join([placeholder] * len(batch)))
+            res = self.execute_query_(insert_query, [v for row in batch for v in row], commit=True, check=True)
+            if res is None:
+                debug_logger.error(f"add_qalogs failed, qa_ids: {[row[0] for row in batch]}")
+                continue
+            qa_ids = [row[0] for row in batch]
+            kb_query = self.QALOG_KB_INSERT + " WHERE q.qa_id IN ({})".format(','.join(['%s'] * len(qa_ids)))
+            if self.execute_query_(kb_query, qa_ids, commit=True, check=True) is None:
+                debug_logger.error(f"add QaLogKb failed, qa_ids: {qa_ids}")
+                continue
+            inserted += len(batch)
+        return inserted
+
+    QALOG_INFO_COLUMNS = QALOG_COLUMNS + ('timestamp',)
+    QALOG_JSON_COLUMNS = ('kb_ids', 'time_record', 'retrieval_documents', 'source_documents', 'history')
+
+    def check_qalog_need_info_(self, need_info):
+        invalid = [column for column in need_info if column not in self.QALOG_INFO_COLUMNS]
+        if invalid:
+            raise ValueError(f"invalid need_info: {invalid}")
+
+    def qalog_filter_(self, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None):
+        """构建问答记录的筛选条件，返回(where子句, 参数)"""
+        conditions = ["timestamp BETWEEN %s AND %s"]
+        params = list(time_range)
+        if user_id:
+            conditions.append("user_id = %s")
+            params.append(user_id)
+        if any_kb_id:
+            if self.check_qalog_kb_ready():
+                conditions.append("qa_id IN (SELECT qa_id FROM QaLogKb WHERE kb_id = %s AND timestamp BETWEEN %s AND %s)")
+                params.extend([any_kb_id, *time_range])
+            else:
+                conditions.append("kb_ids LIKE %s")
                 params.append(f'%{any_kb_id}%')
-            if bot_id:
-                mysql_query += " AND bot_id = %s"
-                params.append(bot_id)
-            if query:
-                mysql_query += " AND query = %s"
-                params.append(query)
-            debug_logger.info("get_qalog_by_filter: {}".format(params))
-            qa_infos = self.execute_query_(mysql_query, params, fetch=True)
-        # 根据need_info构建一个dict
-        qa_infos = [dict(zip(need_info.split(", "), qa_info)) for qa_info in qa_infos]
+        if bot_id:
+            conditions.append("bot_id = %s")
+            params.append(bot_id)
+        if query:
+            conditions.append("query = %s")
+            params.append(query)
+        return " AND ".join(conditions), params
+
+    def format_qalogs_(self, need_info, rows, decode_json=True):
+        """按need_info把查询结果转成dict，时间格式化为字符串，JSON列反序列化（导出时保持原始字符串）"""
+        qa_infos = [dict(zip(need_info, row)) for row in rows]
+        json_columns = [column for column in self.QALOG_JSON_COLUMNS if column in need_info] if decode_json else []
         for qa_info in qa_infos:
             if 'timestamp' in qa_info:
                 qa_info['timestamp'] = qa_info['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-            if 'kb_ids' in qa_info:
-                qa_info['kb_ids'] = json.loads(qa_info['kb_ids'])
-            if 'time_record' in qa_info:
-                qa_info['time_record'] = json.loads(qa_info['time_record'])
-            if 'retrieval_documents' in qa_info:
-                qa_info['retrieval_documents'] = json.loads(qa_info['retrieval_documents'])
-            if 'source_documents' in qa_info:
-                qa_info['source_documents'] = json.loads(qa_info['source_documents'])
-            if 'history' in qa_info:
-                qa_info['history'] = json.loads(qa_info['history'])
+            for column in json_columns:
+                qa_info[column] = json.loads(qa_info[column])
+        return qa_infos
+
+    def get_qalog_count(self, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None):
+        where, params = self.qalog_filter_(user_id, query, bot_id, time_range, any_kb_id)
+        result = self.execute_query_(f"SELECT COUNT(*) FROM QaLogs WHERE {where}", params, fetch=True)
+        return result[0][0] if result else 0
+
+    def get_qalog_count_by_day(self, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None):
+        """按天统计问答数量，返回{"YYYY-MM-DD": count}，按日期升序"""
+        where, params = self.qalog_filter_(user_id, query, bot_id, time_range, any_kb_id)
+        mysql_query = f"SELECT DATE(timestamp) AS day, COUNT(*) FROM QaLogs WHERE {where} GROUP BY day ORDER BY day"
+        result = self.execute_query_(mysql_query, params, fetch=True) or []
+        return {str(day): count for day, count in result}
+
+    def get_qalog_page(self, need_info, page_limit, cursor=None, offset=0, user_id=None, query=None, bot_id=None,
+                       time_range=None, any_kb_id=None, decode_json=True):
+        """
+        按时间倒序分页获取问答记录，只读取need_info中的列，返回(qa_infos, next_cursor)。
+        传入cursor（上一页返回的next_cursor，格式为"timestamp_id"）时使用keyset分页，否则先在索引上定位本页的id再回表。
+        """
+        self.check_qalog_need_info_(need_info)
+        where, params = self.qalog_filter_(user_id, query, bot_id, time_range, any_kb_id)
+        columns = ", ".join([f"q.{column}" for column in need_info] + ["q.timestamp", "q.id"])
+        if cursor:
+            last_timestamp, last_id = cursor.rsplit('_', 1)
+            mysql_query = f"""
+                SELECT {columns} FROM QaLogs q
+                WHERE {where} AND (timestamp < %s OR (timestamp = %s AND id < %s))
+                ORDER BY timestamp DESC, id DESC LIMIT %s
+            """
+            params += [last_timestamp, last_timestamp, int(last_id), page_limit]
+        else:
+            mysql_query = f"""
+                SELECT {columns} FROM QaLogs q
+                JOIN (SELECT id FROM QaLogs WHERE {where}
+                      ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s) page ON q.id = page.id
+                ORDER BY q.timestamp DESC, q.id DESC
+            """
+            params += [page_limit, offset]
+        rows = self.execute_query_(mysql_query, params, fetch=True) or []
+        next_cursor = None
+        if len(rows) == page_limit:
+            next_cursor = f"{rows[-1][-2]}_{rows[-1][-1]}"
+        return self.format_qalogs_(need_info, [row[:-2] for row in rows], decode_json), next_cursor
+
+    def get_qalog_by_filter(self, need_info, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None,
+                            qa_ids=None, decode_json=True):
+        self.check_qalog_need_info_(need_info)
+        columns = ", ".join(need_info)
+        if qa_ids is not None:
+            mysql_query = f"SELECT {columns} FROM QaLogs WHERE qa_id IN ({','.join(['%s'] * len(qa_ids))})"
+            qa_infos = self.execute_query_(mysql_query, qa_ids, fetch=True)
+        else:
+            where, params = self.qalog_filter_(user_id, query, bot_id, time_range, any_kb_id)
+            debug_logger.info("get_qalog_by_filter: {}".format(params))
+            qa_infos = self.execute_query_(f"SELECT {columns} FROM QaLogs WHERE {where}", params, fetch=True)
+        qa_infos = self.format_qalogs_(need_info, qa_infos or [], decode_json)
         if 'timestamp' in need_info:
             qa_infos = sorted(qa_infos, key=lambda x: x["timestamp"], reverse=True)
         return qa_infos
@@ -904,31 +1665,89 @@ class KnowledgeBaseManager:
         """
         return self.execute_query_(query, time_range, fetch=True, user_dict=True)[0]
 
-    def get_random_qa_infos(self, limit=10, time_range=None, need_info=None):
+    def get_qalog_id_bounds_(self, time_range):
+        """时间范围内问答记录的最小、最大id，自增id与写入时间同序，只需在时间索引两端各取一行"""
+        query = "SELECT id FROM QaLogs WHERE timestamp >= %s ORDER BY timestamp, id LIMIT 1"
+        low = self.execute_query_(query, (time_range[0],), fetch=True)
+        query = "SELECT id FROM QaLogs WHERE timestamp <= %s ORDER BY timestamp DESC, id DESC LIMIT 1"
+        high = self.execute_query_(query, (time_range[1],), fetch=True)
+        if not low or not high or low[0][0] > high[0][0]:
+            return None, None
+        return low[0][0], high[0][0]
+
+    def get_random_qa_infos(self, limit=10, time_range=None, need_info=None, max_rounds=3):
+        """
+        随机抽取时间范围内的问答记录。不再使用ORDER BY RAND()排序整个范围：
+        在[最小id, 最大id]中随机取点，每个点按主键向后定位一行，多个点合并为一条UNION ALL查询；
+        id有空洞或重复命中时补抽，最多max_rounds轮。范围内记录较少时直接全部读出再抽样。
+        """
         if need_info is None:
             need_info = ["qa_id", "user_id", "kb_ids", "query", "result", "timestamp"]
-        if "qa_id" not in need_info:
-            need_info.append("qa_id")
-        if "user_id" not in need_info:
-            need_info.append("user_id")
-        if "timestamp" not in need_info:
-            need_info.append("timestamp")
-        need_info = ", ".join(need_info)
-        query = f"SELECT {need_info} FROM QaLogs WHERE timestamp BETWEEN %s AND %s ORDER BY RAND() LIMIT %s"
-        qa_infos = self.execute_query_(query, (time_range[0], time_range[1], limit), fetch=True, user_dict=True)
+        for column in ("qa_id", "user_id", "timestamp"):
+            if column not in need_info:
+                need_info.append(column)
+        self.check_qalog_need_info_(need_info)
+        columns = ", ".join(need_info)
+        low, high = self.get_qalog_id_bounds_(time_range)
+        if low is None:
+            return []
+
+        if high - low + 1 <= limit * 4:
+            query = f"SELECT {columns} FROM QaLogs WHERE id BETWEEN %s AND %s AND timestamp BETWEEN %s AND %s"
+            qa_infos = self.execute_query_(query, (low, high, *time_range), fetch=True, user_dict=True) or []
+            qa_infos = random.sample(qa_infos, min(limit, len(qa_infos)))
+        else:
+            sampled = {}
+            sub_query = f"(SELECT {columns} FROM QaLogs WHERE id >= %s AND timestamp BETWEEN %s AND %s ORDER BY id LIMIT 1)"
+            for _ in range(max_rounds):
+                need = limit - len(sampled)
+                if need <= 0:
+                    break
+                # 多取一些点抵消空洞和重复
+                points = random.sample(range(low, high + 1), need + need // 2 + 1)
+                query = " UNION ALL ".join([sub_query] * len(points))
+                params = [v for point in points for v in (point, *time_range)]
+                for qa_info in self.execute_query_(query, params, fetch=True, user_dict=True) or []:
+                    if len(sampled) < limit:
+                        sampled.setdefault(qa_info['qa_id'], qa_info)
+            qa_infos = list(sampled.values())
         for qa_info in qa_infos:
             qa_info['timestamp'] = qa_info['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
         return qa_infos
 
-    def get_related_qa_infos(self, qa_id, need_info=None, need_more=False):
+    def get_user_qalog_page_(self, columns, user_id, time_condition, time_params, limit, cursor):
+        """按(timestamp, id)升序keyset分页读取用户的问答记录，返回(logs, next_cursor)"""
+        query = f"SELECT {columns}, id AS cursor_id FROM QaLogs WHERE user_id = %s AND {time_condition}"
+        params = [user_id, *time_params]
+        if cursor:
+            last_timestamp, last_id = cursor.rsplit('_', 1)
+            query += " AND (timestamp > %s OR (timestamp = %s AND id > %s))"
+            params += [last_timestamp, last_timestamp, int(last_id)]
+        query += " ORDER BY timestamp, id LIMIT %s"
+        params.append(limit)
+        logs = self.execute_query_(query, params, fetch=True, user_dict=True) or []
+        next_cursor = None
+        if len(logs) == limit:
+            next_cursor = f"{logs[-1]['timestamp']}_{logs[-1]['cursor_id']}"
+        for log in logs:
+            log.pop('cursor_id')
+            log['timestamp'] = log['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+        return logs, next_cursor
+
+    def get_related_qa_infos(self, qa_id, need_info=None, need_more=False, limit=50, recent_cursor=None,
+                             older_cursor=None):
+        """
+        返回(qa_log, recent_logs, older_logs, recent_next_cursor, older_next_cursor)。
+        recent_logs为同一用户7天以内的记录，older_logs为7天之前的记录，各自按时间升序keyset分页，每页最多limit条。
+        """
         if need_info is None:
             need_info = ["user_id", "kb_ids", "query", "condense_question", "result", "timestamp", "product_source"]
-        if "user_id" not in need_info:
-            need_info.append("user_id")
-        if "kb_ids" not in need_info:
-            need_info.append("kb_ids")
-        need_info = ", ".join(need_info)
-        query = f"SELECT {need_info} FROM QaLogs WHERE qa_id = %s"
+        for column in ("user_id", "kb_ids", "timestamp"):
+            if column not in need_info:
+                need_info.append(column)
+        self.check_qalog_need_info_(need_info)
+        columns = ", ".join(need_info)
+        query = f"SELECT {columns} FROM QaLogs WHERE qa_id = %s"
         qa_log = self.execute_query_(query, (qa_id,), fetch=True, user_dict=True)[0]
         qa_log['timestamp'] = qa_log['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
         user_id = qa_log['user_id']
@@ -936,53 +1755,15 @@ class KnowledgeBaseManager:
         current_time = datetime.utcnow()
         seven_days_ago = current_time - timedelta(days=7)
         if not need_more:
-            return qa_log, [], []
+            return qa_log, [], [], None, None
 
         # 查询7天以内的日志
-        recent_logs = []
-        offset = 0
-        limit = 50
-        while True:
-            query_recent_logs = f"""
-                SELECT {need_info}
-                FROM QaLogs
-                WHERE user_id = %s AND timestamp >= %s
-                ORDER BY timestamp
-                LIMIT %s OFFSET %s
-            """
-            logs = self.execute_query_(query_recent_logs, (user_id, seven_days_ago, limit, offset), fetch=True,
-                                       user_dict=True)
-            if not logs:
-                break
-            for log in logs:
-                log['timestamp'] = log['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-            recent_logs.extend(logs)
-            offset += limit
-            # TODO 最多返回50条，后续可以有翻页逻辑
-            break
-
+        recent_logs, recent_next_cursor = self.get_user_qalog_page_(columns, user_id, "timestamp >= %s",
+                                                                    (seven_days_ago,), limit, recent_cursor)
         # 查询7天之前的日志
-        older_logs = []
-        offset = 0
-        while True:
-            query_older_logs = f"""
-                SELECT {need_info}
-                FROM QaLogs
-                WHERE user_id = %s AND timestamp < %s
-                ORDER BY timestamp
-                LIMIT %s OFFSET %s
-            """
-            logs = self.execute_query_(query_older_logs, (user_id, seven_days_ago, limit, offset), fetch=True,
-                                       user_dict=True)
-            if not logs:
-                break
-            for log in logs:
-                log['timestamp'] = log['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-            older_logs.extend(logs)
-            offset += limit
-            # TODO 最多返回50条，后续可以有翻页逻辑
-            break
-        return qa_log, recent_logs, older_logs
+        older_logs, older_next_cursor = self.get_user_qalog_page_(columns, user_id, "timestamp < %s",
+                                                                  (seven_days_ago,), limit, older_cursor)
+        return qa_log, recent_logs, older_logs, recent_next_cursor, older_next_cursor
 
     def check_bot_is_exist(self, bot_id):
         # 使用参数化查询
@@ -1033,6 +1814,12 @@ class KnowledgeBaseManager:
         file_location = result[0][0] if result else None
         return file_location
 
+    def get_file_download_info(self, file_id):
+        """返回(kb_id, file_name, file_location)，文件不存在或已删除时返回None"""
+        query = "SELECT kb_id, file_name, file_location FROM File WHERE file_id = %s AND deleted = 0"
+        result = self.execute_query_(query, (file_id,), fetch=True)
+        return result[0] if result else None
+
     def check_kb_access(self, user_id: str, kb_id: str, required_permission: str) -> bool:
         """检查用户是否有权限访问知识库"""
         debug_logger.info(f"正在检查用户 {user_id} 对知识库 {kb_id} 的 {required_permission} 权限")
@@ -1111,6 +1898,43 @@ class KnowledgeBaseManager:
             if self._is_permission_sufficient(perm[0], required_permission):
                 return True
 
+    def get_acl_version(self) -> int:
+        result = self.execute_query_("SELECT version FROM AclVersion WHERE id = 1", (), fetch=True)
+        return result[0][0] if result else 0
+
+    def bump_acl_version(self):
+        self.execute_query_("UPDATE AclVersion SET version = version + 1 WHERE id = 1", (), commit=True)
+
+    def get_effective_kb_permissions(self, user_id: str) -> Optional[Dict]:
+        """
+        一次性计算用户对所有知识库的有效权限（所有者、直接授权、部门授权、用户组授权取最高级别），
+        返回{"role", "dept_id", "kb_permissions": {kb_id: 权限级别}}，用户不存在或未激活时返回None
+        """
+        query = "SELECT role, dept_id FROM User WHERE user_id = %s AND status = 'active'"
+        user_info = self.execute_query_(query, (user_id,), fetch=True)
+        if not user_info:
+            return None
+        role, dept_id = user_info[0]
+        kb_permissions = {}
+        if role != 'superadmin':
+            query = """
+                SELECT kb_id, 'admin' FROM KnowledgeBase WHERE user_id = %s AND deleted = 0
+                UNION ALL
+                SELECT kba.kb_id, kba.permission_type
+                FROM KnowledgeBaseAccess kba
+                JOIN KnowledgeBase kb ON kb.kb_id = kba.kb_id AND kb.deleted = 0
+                WHERE (kba.subject_type = 'user' AND kba.subject_id = %s)
+                   OR (kba.subject_type = 'department' AND kba.subject_id = %s)
+                   OR (kba.subject_type = 'group' AND kba.subject_id IN
+                       (SELECT group_id FROM GroupMember WHERE user_id = %s))
+            """
+            for kb_id, permission_type in self.execute_query_(query, (user_id, user_id, dept_id, user_id),
+                                                              fetch=True) or []:
+                level = PERMISSION_LEVELS.get(permission_type, 0)
+                if level > kb_permissions.get(kb_id, 0):
+                    kb_permissions[kb_id] = level
+        return {"role": role, "dept_id": dept_id, "kb_permissions": kb_permissions}
+
     def _is_permission_sufficient(self, granted_permission: str, required_permission: str) -> bool:
         """检查权限是否足够"""
         permission_levels = {
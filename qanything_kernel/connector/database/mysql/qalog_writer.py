@@ -0,0 +1,85 @@
+from qanything_kernel.configs.model_config import (QALOG_QUEUE_SIZE, QALOG_QUEUE_PUT_TIMEOUT, QALOG_BATCH_SIZE,
+                                                   QALOG_FLUSH_INTERVAL)
+from qanything_kernel.utils.custom_log import debug_logger, qa_logger
+import asyncio
+import uuid
+
+
+class QaLogWriter:
+    """
+    问答记录的后台批量写入器，handler调用submit把记录放入有界队列后立即返回，不再在请求路径上执行大字段的INSERT。
+    后台任务凑满batch_size条或等待flush_interval秒后，用一条多行INSERT写入（JSON序列化和SQL都不占用事件循环）。
+    队列满时submit等待（背压），超过put_timeout仍未入队则在当前请求内直接写入，保证记录不丢失；
+    close时把队列中剩余的记录全部写完。
+    """
+
+    def __init__(self, manager, queue_size=QALOG_QUEUE_SIZE, put_timeout=QALOG_QUEUE_PUT_TIMEOUT,
+                 batch_size=QALOG_BATCH_SIZE, flush_interval=QALOG_FLUSH_INTERVAL):
+        # manager为AsyncKnowledgeBaseManager
+        self.manager = manager
+        self.queue_size = queue_size
+        self.put_timeout = put_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = None
+        self.worker = None
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.worker = asyncio.create_task(self.run_())
+
+    async def submit(self, chat_data):
+        # 入队前分配qa_id，写入失败重试时INSERT IGNORE不会产生重复记录
+        chat_data = dict(chat_data, qa_id=uuid.uuid4().hex)
+        if self.worker is None or self.worker.done():
+            await self.write_([chat_data])
+            return
+        try:
+            await asyncio.wait_for(self.queue.put(chat_data), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            debug_logger.warning(f"qalog queue is full ({self.queue_size}), write in request: {chat_data['qa_id']}")
+            await self.write_([chat_data])
+
+    async def write_(self, batch):
+        inserted = await self.manager.add_qalogs(batch)
+        if inserted != len(batch):
+            # 部分语句失败，整批重试一次，已写入的记录会被INSERT IGNORE跳过
+            inserted = await self.manager.add_qalogs(batch)
+        if inserted != len(batch):
+            debug_logger.error(f"add qalogs failed, qa_ids: {[chat_data['qa_id'] for chat_data in batch]}")
+        for chat_data in batch:
+            qa_logger.info("chat_data: %s", chat_data)
+
+    async def next_batch_(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run_(self):
+        while True:
+            batch = await self.next_batch_()
+            try:
+                await self.write_(batch)
+            except Exception as e:
+                debug_logger.error(f"qalog writer error: {e}, dropped qa_ids: {[c['qa_id'] for c in batch]}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def close(self):
+        if self.worker is None:
+            return
+        if not self.worker.done():
+            await self.queue.join()
+            self.worker.cancel()
+        self.worker = None
+        debug_logger.info("qalog writer flushed and closed")
@@ -0,0 +1,124 @@
+from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
+from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
+from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
+from qanything_kernel.configs.model_config import (UPLOAD_ROOT_PATH, IMAGES_ROOT_PATH, DELETE_JOB_BATCH_SIZE,
+                                                   DELETE_JOB_BATCH_INTERVAL, DELETE_JOB_POLL_INTERVAL,
+                                                   DELETE_JOB_LEASE, DELETE_JOB_MAX_ATTEMPTS)
+from qanything_kernel.utils.custom_log import debug_logger
+import traceback
+import asyncio
+import socket
+import shutil
+import time
+import uuid
+import json
+import os
+
+
+class DeleteJobWorker:
+    """
+    删除文件/知识库的后台任务执行器。handler把File、KnowledgeBase记录标记为删除后写入DeleteJob并调用notify，立即返回；
+    执行器领取任务后在工作线程中按batch_size个文件一批清理：Milvus按file_id列表（删除知识库时按kb_id）执行一次删除，
+    ES执行一次delete_by_query，MySQL按file_id批量删除父文档、文件级元数据、FAQ和复制记录，最后删除磁盘上的上传文件和图片。
+    每批完成后记录进度，批次之间暂停batch_interval秒，不占满存储影响检索。
+    每一步都是幂等的，进程退出后未完成的任务在租期过后由任意进程从记录的进度继续执行
+    """
+
+    def __init__(self, mysql_client: KnowledgeBaseManager, milvus_kb: VectorStoreMilvusClient,
+                 es_client: StoreElasticSearchClient, batch_size=DELETE_JOB_BATCH_SIZE,
+                 batch_interval=DELETE_JOB_BATCH_INTERVAL, poll_interval=DELETE_JOB_POLL_INTERVAL,
+                 lease=DELETE_JOB_LEASE, max_attempts=DELETE_JOB_MAX_ATTEMPTS):
+        self.mysql_client = mysql_client
+        self.milvus_kb = milvus_kb
+        self.es_client = es_client
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.wakeup = None
+        self.worker = None
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.worker = asyncio.create_task(self.run_())
+
+    def notify(self):
+        # 有新任务时立即领取，不等下一次轮询
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def run_(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self.mysql_client.claim_delete_job, self.owner, self.lease)
+            except Exception as e:
+                debug_logger.error(f"claim delete job failed: {e}")
+                job = None
+            if job is not None:
+                await asyncio.to_thread(self.process_, job)
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def delete_files_(self, job, file_ids):
+        # 删除知识库时Milvus和ES按kb_id整体删除，这里只需清理MySQL和磁盘
+        if job['job_type'] == 'files':
+            self.milvus_kb.delete_expr(f'kb_id == "{job["kb_id"]}" and file_id in {file_ids}', raise_error=True)
+            self.es_client.delete_by_terms('file_id', file_ids)
+        # delete_documents同时删除DocumentFileMeta中的文件级元数据
+        self.mysql_client.delete_documents(file_ids)
+        self.mysql_client.delete_faqs(file_ids)
+        self.mysql_client.delete_file_clones(file_ids)
+        for file_id in file_ids:
+            shutil.rmtree(os.path.join(UPLOAD_ROOT_PATH, job['user_id'], job['kb_id'], file_id), ignore_errors=True)
+            shutil.rmtree(os.path.join(IMAGES_ROOT_PATH, file_id), ignore_errors=True)
+
+    def process_(self, job):
+        job_id = job['job_id']
+        start = time.perf_counter()
+        debug_logger.info(f"delete job {job_id} start: {job['job_type']} {job['kb_id']}, progress {job['progress']}, "
+                          f"attempts {job['attempts']}")
+        try:
+            if job['job_type'] == 'kb':
+                if self.mysql_client.get_knowledge_base_name([job['kb_id']]):
+                    # 只有所有者能删除知识库，标记删除没有生效时不能清理数据
+                    self.mysql_client.finish_delete_job(job_id, self.owner, 'failed', 'knowledge base is not deleted')
+                    return
+                # 先整体删除向量和ES记录，再分批清理父文档和磁盘文件
+                self.milvus_kb.delete_expr(f'kb_id == "{job["kb_id"]}"', raise_error=True)
+                self.es_client.delete_by_terms('kb_id', [job['kb_id']])
+                file_ids = self.mysql_client.get_kb_file_ids(job['kb_id'])
+            else:
+                file_ids = json.loads(job['file_ids'])
+            for i in range(job['progress'], len(file_ids), self.batch_size):
+                batch_file_ids = file_ids[i:i + self.batch_size]
+                self.delete_files_(job, batch_file_ids)
+                if not self.mysql_client.update_delete_job_progress(job_id, self.owner, i + len(batch_file_ids),
+                                                                    len(file_ids)):
+                    debug_logger.warning(f"delete job {job_id} was taken over by another worker")
+                    return
+                time.sleep(self.batch_interval)
+            if job['job_type'] == 'kb':
+                shutil.rmtree(os.path.join(UPLOAD_ROOT_PATH, job['user_id'], job['kb_id']), ignore_errors=True)
+            self.mysql_client.finish_delete_job(job_id, self.owner, 'done')
+            debug_logger.info(f"delete job {job_id} done: {len(file_ids)} files, "
+                              f"cost {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # 未超过最大次数时放回队列，下次从已记录的进度继续
+            status = 'failed' if job['attempts'] >= self.max_attempts else 'pending'
+            debug_logger.error(f"delete job {job_id} error, status -> {status}: {traceback.format_exc()}")
+            self.mysql_client.finish_delete_job(job_id, self.owner, status, str(e)[:1000])
+            time.sleep(self.poll_interval)
+
+    async def close(self):
+        if self.worker is None:
+            return
+        # 正在执行的批次在工作线程中继续完成，未完成的任务租期过后由其他进程或重启后的本进程接管
+        self.worker.cancel()
+        self.worker = None
+        debug_logger.info("delete job worker closed")
@@ -0,0 +1,373 @@
+from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
+from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
+from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
+from qanything_kernel.core.retriever.parent_retriever import rewrite_chunk, rekey_doc_id
+from qanything_kernel.core.local_file import LocalFile
+from qanything_kernel.configs.model_config import IMAGES_ROOT_PATH, UPLOAD_ROOT_PATH
+from qanything_kernel.utils.custom_log import debug_logger, insert_logger
+from qanything_kernel.utils.general_utils import get_time, correct_kb_id
+from datetime import datetime
+from array import array
+import tempfile
+import tarfile
+import shutil
+import json
+import gzip
+import uuid
+import sys
+import os
+
+SNAPSHOT_FORMAT = 'qanything-kb-snapshot'
+SNAPSHOT_VERSION = 1
+
+
+def write_jsonl(path, items):
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False, default=str) + '\n')
+            count += 1
+    return count
+
+
+def read_jsonl(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class KbSnapshot:
+    """
+    知识库快照的导出和导入，用于迁移、备份和环境间复制，导入时直接写入已有的向量，不调用解析和embedding服务。
+    快照是一个不压缩的tar包：
+        manifest.json        格式版本、源知识库、Milvus字段和向量维度、各部分的条数
+        files.jsonl.gz       File表记录，FAQ文件附带问题和答案
+        documents.jsonl.gz   父文档
+        table_documents.jsonl.gz  父文档引用的完整表格文档
+        chunks.jsonl.gz      Milvus中的子chunk，不含主键和向量
+        vectors.f32          与chunks逐行对应的向量，小端float32连续存储
+        es.jsonl.gz          ES中的记录
+        images/<file_id>/    解析出的图片
+        files/<file_id>/     上传的原始文件（可选）
+    问答记录和知识库授权不属于知识库内容，不导出
+    """
+
+    def __init__(self, mysql_client: KnowledgeBaseManager, milvus_kb: VectorStoreMilvusClient,
+                 es_client: StoreElasticSearchClient, batch_size=1000):
+        self.mysql_client = mysql_client
+        self.milvus_kb = milvus_kb
+        self.es_client = es_client
+        self.batch_size = batch_size
+
+    def iter_documents_(self, files, table_doc_ids):
+        for file in files:
+            for doc_json in self.mysql_client.get_document_by_file_id(file['file_id']) or []:
+                doc_id = doc_json['kwargs'].pop('chunk_id')
+                table_doc_id = doc_json['kwargs']['metadata'].get('table_doc_id')
+                if table_doc_id:
+                    table_doc_ids.add(table_doc_id)
+                yield {'doc_id': doc_id, 'doc_json': doc_json}
+
+    def iter_table_documents_(self, table_doc_ids):
+        table_doc_ids = sorted(table_doc_ids)
+        for i in range(0, len(table_doc_ids), self.batch_size):
+            batch_doc_ids = table_doc_ids[i:i + self.batch_size]
+            for doc_id, doc_json in zip(batch_doc_ids, self.mysql_client.get_documents_by_doc_ids(batch_doc_ids)):
+                if doc_json is not None:
+                    yield {'doc_id': doc_id, 'doc_json': doc_json, 'table': True}
+
+    def write_chunks_(self, kb_id, file_ids, chunks_path, vectors_path):
+        """
+        file_ids中文件的子chunk写入chunks.jsonl.gz，向量按相同顺序写入vectors.f32，返回(条数, 向量维度)。
+        解析中、失败或待清理的文件没有导出File记录，它们的chunk也不导出
+        """
+        vector_field = self.milvus_kb.local_vectorstore._vector_field
+        count, dim = 0, 0
+        with gzip.open(chunks_path, 'wt', encoding='utf-8') as chunks_file, open(vectors_path, 'wb') as vectors_file:
+            for rows in self.milvus_kb.iter_chunks(f'kb_id == "{kb_id}"', self.batch_size):
+                rows = [row for row in rows if row.get('file_id') in file_ids]
+                vectors = array('f')
+                for row in rows:
+                    vector = row.pop(vector_field)
+                    dim = dim or len(vector)
+                    if len(vector) != dim:
+                        raise ValueError(f"inconsistent vector dim: {len(vector)} != {dim}")
+                    vectors.extend(vector)
+                    chunks_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                if sys.byteorder == 'big':
+                    vectors.byteswap()
+                vectors.tofile(vectors_file)
+                count += len(rows)
+        return count, dim
+
+    @get_time
+    def export_kb(self, kb_id, archive_path, include_files=True):
+        kb_info = self.mysql_client.get_knowledge_base_name([kb_id])
+        if not kb_info:
+            raise ValueError(f"knowledge base {kb_id} not found")
+        user_id, _, kb_name = kb_info[0]
+        files = self.mysql_client.get_file_records(kb_id)
+        faq_ids = [file['file_id'] for file in files if file['file_location'] == 'FAQ']
+        faqs = self.mysql_client.get_faqs(faq_ids) if faq_ids else {}
+        for file in files:
+            if file['file_id'] in faqs:
+                _, _, question, answer, nos_keys = faqs[file['file_id']]
+                file['faq'] = {'question': question, 'answer': answer, 'nos_keys': nos_keys}
+
+        archive_path = os.path.abspath(archive_path)
+        # 中间文件写在输出路径旁边，写完整个tar包后再改名，不会留下不完整的快照
+        staging_dir = tempfile.mkdtemp(prefix='.kb_snapshot_', dir=os.path.dirname(archive_path))
+        part_path = archive_path + '.part'
+        try:
+            counts = {'files': write_jsonl(os.path.join(staging_dir, 'files.jsonl.gz'), files)}
+            table_doc_ids = set()
+            documents_path = os.path.join(staging_dir, 'documents.jsonl.gz')
+            counts['documents'] = write_jsonl(documents_path, self.iter_documents_(files, table_doc_ids))
+            counts['table_documents'] = write_jsonl(os.path.join(staging_dir, 'table_documents.jsonl.gz'),
+                                                    self.iter_table_documents_(table_doc_ids))
+            file_ids = {file['file_id'] for file in files}
+            counts['chunks'], dim = self.write_chunks_(kb_id, file_ids, os.path.join(staging_dir, 'chunks.jsonl.gz'),
+                                                       os.path.join(staging_dir, 'vectors.f32'))
+            es_docs = (doc for doc in self.es_client.scan_kb(kb_id)
+                       if doc['_source'].get('metadata', {}).get('file_id') in file_ids)
+            counts['es'] = write_jsonl(os.path.join(staging_dir, 'es.jsonl.gz'), es_docs)
+            vectorstore = self.milvus_kb.local_vectorstore
+            manifest = {
+                'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'kb_id': kb_id, 'kb_name': kb_name,
+                'user_id': user_id, 'created_at': datetime.now().isoformat(timespec='seconds'),
+                'milvus': {'fields': self.milvus_kb.chunk_fields if vectorstore.col is not None else [],
+                           'text_field': vectorstore._text_field, 'vector_field': vectorstore._vector_field,
+                           'dim': dim},
+                'counts': counts, 'include_files': include_files
+            }
+            with open(os.path.join(staging_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            with tarfile.open(part_path, 'w') as tar:
+                for name in ('manifest.json', 'files.jsonl.gz', 'documents.jsonl.gz', 'table_documents.jsonl.gz',
+                             'chunks.jsonl.gz', 'vectors.f32', 'es.jsonl.gz'):
+                    tar.add(os.path.join(staging_dir, name), arcname=name)
+                for file in files:
+                    images_dir = os.path.join(IMAGES_ROOT_PATH, file['file_id'])
+                    if os.path.isdir(images_dir):
+                        tar.add(images_dir, arcname=f"images/{file['file_id']}")
+                    if include_files and os.path.isfile(file['file_location']):
+                        tar.add(file['file_location'],
+                                arcname=f"files/{file['file_id']}/{os.path.basename(file['file_location'])}")
+            os.replace(part_path, archive_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        debug_logger.info(f"export kb {kb_id} to {archive_path}: {counts}")
+        return manifest
+
+    @staticmethod
+    def extract_(archive_path, staging_dir):
+        with tarfile.open(archive_path, 'r') as tar:
+            members = tar.getmembers()
+            for member in members:
+                parts = member.name.replace('\\', '/').split('/')
+                if os.path.isabs(member.name) or '..' in parts or not (member.isfile() or member.isdir()):
+                    raise ValueError(f"unsafe member in snapshot: {member.name}")
+            tar.extractall(staging_dir, members=members)
+
+    def check_milvus_schema_(self, milvus_manifest):
+        if self.milvus_kb.local_vectorstore.col is None or not milvus_manifest['fields']:
+            return
+        if set(self.milvus_kb.chunk_fields) != set(milvus_manifest['fields']):
+            raise ValueError(f"milvus fields mismatch: {self.milvus_kb.chunk_fields} != {milvus_manifest['fields']}")
+        vector_field = self.milvus_kb.local_vectorstore._vector_field
+        for field in self.milvus_kb.local_vectorstore.col.schema.fields:
+            if field.name == vector_field and field.params.get('dim') != milvus_manifest['dim']:
+                raise ValueError(f"milvus vector dim mismatch: {field.params.get('dim')} != {milvus_manifest['dim']}")
+
+    @get_time
+    def import_kb(self, archive_path, kb_id=None, user_id=None, kb_name=None, new_ids=False):
+        """
+        把快照导入为一个新的知识库，kb_id、user_id、kb_name默认使用快照中的值。
+        new_ids为True时为知识库、文件和表格文档生成新的id，可以把同一个快照在同一环境中导入多次；
+        否则沿用原来的id，目标环境中已存在同名知识库或文件时报错。
+        向量、ES记录和父文档全部写入成功后才写入File和KnowledgeBase记录，导入失败时清理已写入的部分
+        """
+        os.makedirs(UPLOAD_ROOT_PATH, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.kb_snapshot_', dir=UPLOAD_ROOT_PATH)
+        try:
+            self.extract_(archive_path, staging_dir)
+            with open(os.path.join(staging_dir, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f"unsupported snapshot: {manifest.get('format')} {manifest.get('version')}")
+            self.check_milvus_schema_(manifest['milvus'])
+            if not kb_id:
+                kb_id = correct_kb_id('KB' + uuid.uuid4().hex) if new_ids else manifest['kb_id']
+            user_id = user_id or manifest['user_id']
+            kb_name = kb_name or manifest['kb_name']
+            if self.mysql_client.get_knowledge_base_name([kb_id]):
+                raise ValueError(f"knowledge base {kb_id} already exists")
+
+            files = list(read_jsonl(os.path.join(staging_dir, 'files.jsonl.gz')))
+            file_id_map = {file['file_id']: uuid.uuid4().hex if new_ids else file['file_id'] for file in files}
+            existing_file_ids = self.mysql_client.get_existing_file_ids(list(file_id_map.values()))
+            if existing_file_ids:
+                raise ValueError(f"file_ids already exist: {existing_file_ids[:10]}, use new_ids to import")
+            table_doc_id_map = {}
+            if new_ids:
+                for doc in read_jsonl(os.path.join(staging_dir, 'table_documents.jsonl.gz')):
+                    table_doc_id_map[doc['doc_id']] = str(uuid.uuid4())
+            self.import_(staging_dir, manifest, kb_id, user_id, kb_name, files, file_id_map, table_doc_id_map)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return kb_id
+
+    def import_(self, staging_dir, manifest, kb_id, user_id, kb_name, files, file_id_map, table_doc_id_map):
+        file_metas, headers = {}, {}
+        for file in files:
+            file_id = file_id_map[file['file_id']]
+            if file['file_location'] not in ('FAQ', 'URL') and os.path.isdir(
+                    os.path.join(staging_dir, 'files', file['file_id'])):
+                file['file_location'] = LocalFile.get_file_location(user_id, kb_id, file_id, file['file_name'])
+            file_metas[file['file_id']] = {'user_id': user_id, 'kb_id': kb_id, 'file_id': file_id,
+                                           'file_name': file['file_name'], 'nos_key': file['file_location'],
+                                           'file_url': file['file_url']}
+            headers[file['file_id']] = {"知识库名": kb_name, '文件名': file['file_name']}
+
+        def rewrite(metadata, page_content, parent=False):
+            src_file_id = metadata.get('file_id')
+            if metadata.get('table_doc_id') in table_doc_id_map:
+                metadata['table_doc_id'] = table_doc_id_map[metadata['table_doc_id']]
+            if src_file_id not in file_metas:
+                return page_content
+            if parent:
+                # 与clone_file_documents一致，父文档补全全部文件级元数据
+                metadata.update(file_metas[src_file_id])
+            return rewrite_chunk(metadata, page_content, file_metas[src_file_id], headers[src_file_id])
+
+        new_file_ids = list(file_id_map.values())
+        try:
+            chunks = self.import_chunks_(staging_dir, manifest['milvus'], manifest['counts']['chunks'], file_id_map,
+                                         rewrite)
+            es_docs = self.import_es_(staging_dir, file_id_map, rewrite)
+            documents = self.import_documents_(staging_dir, table_doc_id_map, rewrite)
+            os.makedirs(IMAGES_ROOT_PATH, exist_ok=True)
+            for file in files:
+                src_file_id, file_id = file['file_id'], file_id_map[file['file_id']]
+                images_dir = os.path.join(staging_dir, 'images', src_file_id)
+                if os.path.isdir(images_dir):
+                    shutil.move(images_dir, os.path.join(IMAGES_ROOT_PATH, file_id))
+                files_dir = os.path.join(staging_dir, 'files', src_file_id)
+                if os.path.isdir(files_dir) and os.listdir(files_dir):
+                    shutil.move(os.path.join(files_dir, os.listdir(files_dir)[0]), file['file_location'])
+            faqs = [(file_id_map[file['file_id']], user_id, kb_id, file['faq']['question'], file['faq']['answer'],
+                     file['faq']['nos_keys']) for file in files if file.get('faq')]
+            self.mysql_client.add_faqs(faqs)
+
+            records = []
+            for file in files:
+                file.pop('faq', None)
+                records.append(dict(file, file_id=file_id_map[file['file_id']], user_id=user_id, kb_id=kb_id))
+            inserted = self.mysql_client.add_file_records(records)
+            if inserted != len(records):
+                raise ValueError(f"add file records failed: {inserted} != {len(records)}")
+            self.mysql_client.new_milvus_base(kb_id, user_id, kb_name)
+        except Exception:
+            debug_logger.error(f"import kb {kb_id} failed, clean up imported data")
+            self.cleanup_(kb_id, user_id, new_file_ids, list(table_doc_id_map.values()) or
+                          [doc['doc_id'] for doc in read_jsonl(os.path.join(staging_dir, 'table_documents.jsonl.gz'))])
+            raise
+        insert_logger.info(f"import kb {kb_id}: files {len(files)}, documents {documents}, chunks {chunks}, "
+                           f"es {es_docs}")
+
+    def import_chunks_(self, staging_dir, milvus_manifest, expected_count, file_id_map, rewrite):
+        text_field, vector_field = milvus_manifest['text_field'], milvus_manifest['vector_field']
+        dim = milvus_manifest['dim']
+        row_bytes = dim * array('f').itemsize
+        count, skipped = 0, 0
+        with open(os.path.join(staging_dir, 'vectors.f32'), 'rb') as vectors_file:
+            for rows in batched(read_jsonl(os.path.join(staging_dir, 'chunks.jsonl.gz')), self.batch_size):
+                vectors = array('f')
+                vectors.frombytes(vectors_file.read(row_bytes * len(rows)))
+                if len(vectors) != dim * len(rows):
+                    raise ValueError("vectors.f32 is shorter than chunks.jsonl.gz")
+                if sys.byteorder == 'big':
+                    vectors.byteswap()
+                import_rows = []
+                for i, row in enumerate(rows):
+                    # 不属于导出文件的chunk（旧版本导出的快照中可能存在）不导入，否则会以源kb_id写回源知识库
+                    if row.get('file_id') not in file_id_map:
+                        continue
+                    row[text_field] = rewrite(row, row[text_field])
+                    row[vector_field] = vectors[i * dim:(i + 1) * dim].tolist()
+                    import_rows.append(row)
+                if import_rows:
+                    self.milvus_kb.insert_chunks(import_rows)
+                count += len(import_rows)
+                skipped += len(rows) - len(import_rows)
+        if count + skipped != expected_count:
+            raise ValueError(f"milvus chunks mismatch: {count + skipped} != {expected_count}")
+        if skipped:
+            insert_logger.warning(f"skip {skipped} milvus chunks of files not in the snapshot")
+        # 导入脚本随后退出，强制flush保证写入的数据已落盘
+        if count and not self.milvus_kb.flush():
+            raise ValueError("flush milvus collection timeout")
+        return count
+
+    def import_es_(self, staging_dir, file_id_map, rewrite):
+        def iter_docs():
+            for doc in read_jsonl(os.path.join(staging_dir, 'es.jsonl.gz')):
+                src_file_id = doc['_source']['metadata'].get('file_id')
+                if src_file_id not in file_id_map:
+                    continue
+                doc['_id'] = rekey_doc_id(doc['_id'], file_id_map[src_file_id])
+                doc['_source']['text'] = rewrite(doc['_source']['metadata'], doc['_source']['text'])
+                yield doc
+
+        try:
+            return self.es_client.bulk_import(iter_docs())
+        except Exception as e:
+            # 与正常入库一致，ES写入失败不影响向量检索
+            insert_logger.error(f"import es documents failed: {e}")
+            return 0
+
+    def import_documents_(self, staging_dir, table_doc_id_map, rewrite):
+        count = 0
+        for name in ('table_documents.jsonl.gz', 'documents.jsonl.gz'):
+            for batch in batched(read_jsonl(os.path.join(staging_dir, name)), self.batch_size):
+                doc_id_json_pairs = []
+                for doc in batch:
+                    kwargs = doc['doc_json']['kwargs']
+                    metadata = kwargs['metadata']
+                    if doc.get('table'):
+                        # 表格文档的内容没有headers前缀，只替换元数据
+                        rewrite(metadata, '')
+                        doc_id = table_doc_id_map.get(doc['doc_id'], doc['doc_id'])
+                    else:
+                        kwargs['page_content'] = rewrite(metadata, kwargs['page_content'], parent=True)
+                        doc_id = rekey_doc_id(doc['doc_id'], metadata['file_id'])
+                    doc_id_json_pairs.append((doc_id, doc['doc_json']))
+                self.mysql_client.add_documents(doc_id_json_pairs)
+                count += len(doc_id_json_pairs)
+        return count
+
+    def cleanup_(self, kb_id, user_id, file_ids, table_doc_ids):
+        self.milvus_kb.delete_expr(f'kb_id == "{kb_id}"')
+        self.es_client.delete_kb(kb_id)
+        self.mysql_client.delete_documents(file_ids)
+        self.mysql_client.delete_documents_by_doc_ids(table_doc_ids)
+        self.mysql_client.delete_faqs(file_ids)
+        self.mysql_client.delete_file_records(file_ids)
+        for file_id in file_ids:
+            shutil.rmtree(os.path.join(IMAGES_ROOT_PATH, file_id), ignore_errors=True)
+            shutil.rmtree(os.path.join(UPLOAD_ROOT_PATH, user_id, kb_id, file_id), ignore_errors=True)
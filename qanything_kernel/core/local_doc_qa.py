@@ -13,6 +13,9 @@ from langchain.schema import Document
 from langchain.schema.messages import AIMessage, HumanMessage
 from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
 from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
+from qanything_kernel.connector.database.mysql.async_mysql_client import AsyncKnowledgeBaseManager
+from qanything_kernel.connector.database.mysql.qalog_writer import QaLogWriter
+from qanything_kernel.core.delete_job_worker import DeleteJobWorker
 from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
 from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
 from qanything_kernel.core.retriever.parent_retriever import ParentRetriever
@@ -43,6 +46,9 @@ class LocalDocQA:
         self.milvus_kb: VectorStoreMilvusClient = None
         self.retriever: ParentRetriever = None
         self.milvus_summary: KnowledgeBaseManager = None
+        self.milvus_summary_async: AsyncKnowledgeBaseManager = None
+        self.qalog_writer: QaLogWriter = None
+        self.delete_job_worker: DeleteJobWorker = None
         self.es_client: StoreElasticSearchClient = None
         self.session = self.create_retry_session(retries=3, backoff_factor=1)
         self.doc_splitter = CharacterTextSplitter(
@@ -70,9 +76,15 @@ class LocalDocQA:
         self.embeddings = YouDaoEmbeddings()
         self.rerank = YouDaoRerank()
         self.milvus_summary = KnowledgeBaseManager()
+        # handler中使用异步连接池，连接池需要在事件循环中调用init创建
+        self.milvus_summary_async = AsyncKnowledgeBaseManager()
+        # 问答记录在后台批量写入，需要在事件循环中调用start
+        self.qalog_writer = QaLogWriter(self.milvus_summary_async)
         self.milvus_kb = VectorStoreMilvusClient()
         self.es_client = StoreElasticSearchClient()
         self.retriever = ParentRetriever(self.milvus_kb, self.milvus_summary, self.es_client)
+        # 删除文件/知识库的后台任务，需要在事件循环中调用start
+        self.delete_job_worker = DeleteJobWorker(self.milvus_summary, self.milvus_kb, self.es_client)
 
     @get_time
     def get_web_search(self, queries, top_k):
@@ -729,9 +741,11 @@ class LocalDocQA:
             yield response, history
 
     def get_completed_document(self, file_id, limit=None):
-        sorted_json_datas = self.milvus_summary.get_document_by_file_id(file_id)
         if limit:
-            sorted_json_datas = sorted_json_datas[limit[0]: limit[1] + 1]
+            sorted_json_datas = self.milvus_summary.get_document_page_by_file_id(file_id, limit[0],
+                                                                                limit[1] - limit[0] + 1)
+        else:
+            sorted_json_datas = self.milvus_summary.get_document_by_file_id(file_id)
 
         completed_content_with_figure = ''
         completed_content = ''
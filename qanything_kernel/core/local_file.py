@@ -1,27 +1,40 @@
 from typing import Union, Tuple, Dict
 from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
 from sanic.request import File
-from qanything_kernel.configs.model_config import UPLOAD_ROOT_PATH
+from qanything_kernel.configs.model_config import UPLOAD_ROOT_PATH, PDF_PARSER_VERSION
+import hashlib
 import uuid
 import os
 
 
 class LocalFile:
-    def __init__(self, user_id, kb_id, file: Union[File, str, Dict], file_name):
+    def __init__(self, user_id, kb_id, file: Union[File, str, Dict, None], file_name, file_id=None):
+        """file为None时表示文件已经按get_file_location的路径流式写入磁盘，此时需要传入写入时使用的file_id"""
         self.user_id = user_id
         self.kb_id = kb_id
-        self.file_id = uuid.uuid4().hex
+        self.file_id = file_id or uuid.uuid4().hex
         self.file_name = file_name
         self.file_url = ''
+        # 文件内容的sha256，FAQ和URL没有文件内容，为None，不参与去重
+        self.content_hash = None
         if isinstance(file, Dict):
             self.file_location = "FAQ"
             self.file_content = b''
+            self.file_size = 0
         elif isinstance(file, str):
             self.file_location = "URL"
             self.file_content = b''
             self.file_url = file
+            self.file_size = 0
+        elif file is None:
+            self.file_location = self.get_file_location(user_id, kb_id, self.file_id, file_name)
+            self.file_content = b''
+            self.file_size = os.path.getsize(self.file_location)
+            self.content_hash = self.file_hash(self.file_location)
         else:
             self.file_content = file.body
+            self.file_size = len(self.file_content)
+            self.content_hash = hashlib.sha256(self.file_content).hexdigest()
             # nos_key = construct_nos_key_for_local_file(user_id, kb_id, self.file_id, self.file_name)
             # debug_logger.info(f'file nos_key: {self.file_id}, {self.file_name}, {nos_key}')
             # self.file_location = nos_key
@@ -30,11 +43,34 @@ class LocalFile:
             #     debug_logger.error(f'failed init localfile {self.file_name}, {upload_res}')
             # else:
             #     debug_logger.info(f'success init localfile {self.file_name}, {upload_res}')
-            upload_path = os.path.join(UPLOAD_ROOT_PATH, user_id)
-            file_dir = os.path.join(upload_path, self.kb_id, self.file_id)
-            os.makedirs(file_dir, exist_ok=True)
-            self.file_location = os.path.join(file_dir, self.file_name)
+            self.file_location = self.get_file_location(user_id, kb_id, self.file_id, file_name)
             #  如果文件不存在：
             if not os.path.exists(self.file_location):
                 with open(self.file_location, 'wb') as f:
                     f.write(self.file_content)
+
+    @staticmethod
+    def get_file_location(user_id, kb_id, file_id, file_name):
+        """上传文件的保存路径：UPLOAD_ROOT_PATH/user_id/kb_id/file_id/file_name，目录不存在时创建"""
+        file_dir = os.path.join(UPLOAD_ROOT_PATH, user_id, kb_id, file_id)
+        os.makedirs(file_dir, exist_ok=True)
+        return os.path.join(file_dir, file_name)
+
+    @staticmethod
+    def file_hash(file_location, block_size=1024 * 1024):
+        sha256 = hashlib.sha256()
+        with open(file_location, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def get_parse_config(file_name, chunk_size):
+        """
+        影响解析和切分结果的配置：扩展名决定使用的解析器，chunk_size决定父文档切分，PDF还取决于解析器版本。
+        内容哈希和解析配置都相同的文件入库结果相同，可以直接复用
+        """
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext == '.pdf':
+            return f'{ext}:{int(chunk_size)}:{PDF_PARSER_VERSION}'
+        return f'{ext}:{int(chunk_size)}'
@@ -36,11 +36,13 @@ class MysqlStore(InMemoryStore):
         """
         doc_ids = [doc_id for doc_id, _ in key_value_pairs]
         insert_logger.info(f"add documents: {len(doc_ids)}")
+        doc_id_json_pairs = []
         for doc_id, doc in tqdm(key_value_pairs):
             doc_json = doc.to_json()
             if doc_json['kwargs'].get('metadata') is None:
                 doc_json['kwargs']['metadata'] = doc.metadata
-            self.mysql_client.add_document(doc_id, doc_json)
+            doc_id_json_pairs.append((doc_id, doc_json))
+        self.mysql_client.add_documents(doc_id_json_pairs)
 
     def mget(self, keys: Sequence[str]) -> List[Optional[V]]:
         """Get the values associated with the given keys.
@@ -54,8 +56,8 @@ class MysqlStore(InMemoryStore):
         """
        
         docs = []
-        for doc_id in keys:
-            doc_json = self.mysql_client.get_document_by_doc_id(doc_id)
+        doc_jsons = self.mysql_client.get_documents_by_doc_ids(keys)
+        for doc_id, doc_json in zip(keys, doc_jsons):
             if doc_json is None:
                 docs.append(None)
                 continue
@@ -1,6 +1,8 @@
 from qanything_kernel.utils.custom_log import debug_logger, insert_logger
 from qanything_kernel.configs.model_config import ES_USER, ES_PASSWORD, ES_URL, ES_INDEX_NAME
 from langchain_elasticsearch import ElasticsearchStore
+from elasticsearch import helpers
+import uuid
 
 
 class StoreElasticSearchClient:
@@ -28,3 +30,69 @@ class StoreElasticSearchClient:
             docs_ids.extend([file_id + '_' + str(i) for i in range(file_chunk)])
         if docs_ids:
             self.delete(docs_ids)
+
+    def delete_by_terms(self, key, values):
+        """按metadata中的字段批量删除，返回删除的条数，失败时抛出异常"""
+        res = self.es_store.client.delete_by_query(index=ES_INDEX_NAME, refresh=True, conflicts='proceed',
+                                                   query={"terms": {f"metadata.{key}.keyword": list(values)}})
+        debug_logger.info(f"Delete ES documents of {key}: {len(values)}, deleted: {res.get('deleted')}")
+        return res.get('deleted', 0)
+
+    def delete_by_term_(self, key, value):
+        # 不依赖chunk数量，按metadata中的字段删除
+        try:
+            self.delete_by_terms(key, [value])
+        except Exception as e:
+            debug_logger.error(f"Delete ES documents of {key} {value} failed with error: {e}")
+
+    def delete_file(self, file_id):
+        self.delete_by_term_('file_id', file_id)
+
+    def delete_kb(self, kb_id):
+        self.delete_by_term_('kb_id', kb_id)
+
+    def get_doc_chunks(self, doc_id):
+        """返回父文档doc_id的子chunk，[(_id, text)]"""
+        query = {"query": {"term": {"metadata.doc_id.keyword": doc_id}}}
+        return [(hit['_id'], hit['_source']['text'])
+                for hit in helpers.scan(self.es_store.client, index=ES_INDEX_NAME, query=query, _source=['text'])]
+
+    def update_doc_chunks(self, doc_id, delete_ids, texts, metadata):
+        """删除父文档doc_id的delete_ids，写入新的子chunk texts，在一次bulk请求中完成"""
+        actions = [{"_op_type": "delete", "_index": ES_INDEX_NAME, "_id": _id} for _id in delete_ids]
+        # 新增chunk的_id保持file_id_后缀的格式，复制文件时按最后一个'_'之后的部分换成新的file_id
+        actions += [{"_index": ES_INDEX_NAME, "_id": f"{doc_id}-{uuid.uuid4().hex[:12]}",
+                     "_source": {"text": text, "metadata": metadata}} for text in texts]
+        if actions:
+            helpers.bulk(self.es_store.client, actions, refresh=True)
+        debug_logger.info(f"Update ES chunks of {doc_id}: deleted {len(delete_ids)}, added {len(texts)}")
+
+    def scan_kb(self, kb_id):
+        """逐条读出知识库的全部ES记录（_id和_source）"""
+        query = {"query": {"term": {"metadata.kb_id.keyword": kb_id}}}
+        for hit in helpers.scan(self.es_store.client, index=ES_INDEX_NAME, query=query):
+            yield {"_id": hit['_id'], "_source": hit['_source']}
+
+    def bulk_import(self, docs, chunk_size=500):
+        """批量写入scan_kb格式的记录，写入过程中不刷新索引，全部写完后刷新一次。返回写入的条数"""
+        self.es_store._create_index_if_not_exists(index_name=ES_INDEX_NAME)
+        actions = ({"_index": ES_INDEX_NAME, "_id": doc['_id'], "_source": doc['_source']} for doc in docs)
+        success, _ = helpers.bulk(self.es_store.client, actions, chunk_size=chunk_size, refresh=False)
+        self.es_store.client.indices.refresh(index=ES_INDEX_NAME)
+        insert_logger.info(f"Bulk import ES documents: {success}")
+        return success
+
+    def clone_file(self, src_file_id, file_id, rewrite):
+        """
+        复制src_file_id的全部ES记录到file_id，doc id从src_file_id_i改为file_id_i（i不变，与delete_files保持一致），
+        _source经rewrite改写。返回复制的条数
+        """
+        def actions():
+            query = {"query": {"term": {"metadata.file_id.keyword": src_file_id}}}
+            for hit in helpers.scan(self.es_store.client, index=ES_INDEX_NAME, query=query):
+                chunk_index = hit['_id'].rsplit('_', 1)[-1]
+                yield {"_index": ES_INDEX_NAME, "_id": f"{file_id}_{chunk_index}", "_source": rewrite(hit['_source'])}
+
+        success, _ = helpers.bulk(self.es_store.client, actions(), refresh=True)
+        insert_logger.info(f"Clone ES documents: {src_file_id} -> {file_id}, number: {success}")
+        return success
@@ -15,10 +15,10 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from qanything_kernel.utils.loader.csv_loader import CSVLoader
 from qanything_kernel.utils.loader.json_loader import JSONLoader
 from qanything_kernel.utils.loader.markdown_parser import convert_markdown_to_langchaindoc
+from qanything_kernel.utils.pdf_parse_cache import PdfParseCache
 import asyncio
 import aiohttp
 import docx2txt
-import base64
 import pandas as pd
 import os
 import json
@@ -33,17 +33,18 @@ import shutil
 import time
 
 
-def get_ocr_result_sync(image_data):
+def get_ocr_batch_result_sync(images):
+    # images: [(file_name, image_bytes), ...]，以multipart二进制上传，一次请求识别多张图片
     try:
-        response = requests.post(f"http://{LOCAL_OCR_SERVICE_URL}/ocr", data=image_data, timeout=120)
+        files = [('images', (file_name, image_bytes)) for file_name, image_bytes in images]
+        response = requests.post(f"http://{LOCAL_OCR_SERVICE_URL}/ocr_batch", files=files, timeout=120)
         response.raise_for_status()  # 如果请求返回了错误状态码，将会抛出异常
-        ocr_res = response.text
-        ocr_res = json.loads(ocr_res)
-        return ocr_res['result']
-    except Exception as e:
-        insert_logger.warning(f"ocr error: {traceback.format_exc()}")
+        return response.json()['results']
+    except Exception:
+        insert_logger.warning(f"ocr batch error: {traceback.format_exc()}")
         return None
 
+
 def get_pdf_result_sync(file_path):
     try:
         data = {
@@ -57,11 +58,14 @@ def get_pdf_result_sync(file_path):
         response_json = response.json()
         markdown_file = response_json.get('markdown_file')
         return markdown_file
-    except Exception as e:
+    except Exception:
         insert_logger.warning(f"pdf parser error: {traceback.format_exc()}")
         return None
 
 
+pdf_parse_cache = PdfParseCache()
+
+
 class LocalFileForInsert:
     def __init__(self, user_id, kb_id, file_id, file_location, file_name, file_url, chunk_size, mysql_client):
         self.chunk_size = chunk_size
@@ -103,11 +107,8 @@ class LocalFileForInsert:
         # 读取图片
         img_np = open(filepath, 'rb').read()
 
-        img_data = {
-            "img64": base64.b64encode(img_np).decode("utf-8"),
-        }
-
-        result = get_ocr_result_sync(img_data)
+        results = get_ocr_batch_result_sync([(filename, img_np)])
+        result = results[0] if results else None
 
         ocr_result = [line for line in result if line]
         ocr_result = '\n'.join(ocr_result)
@@ -363,6 +364,24 @@ class LocalFileForInsert:
             insert_logger.info(f"copy image: {single_image_path} -> {output_dir}")
             shutil.copy(single_image_path, output_dir)
 
+    @staticmethod
+    def get_pdf_markdown(file_path):
+        # 先按文件内容哈希查解析缓存，未命中再调用pdf解析服务并写回缓存
+        try:
+            file_hash = pdf_parse_cache.file_hash(file_path)
+        except Exception:
+            insert_logger.warning(f"pdf file hash error: {file_path}, {traceback.format_exc()}")
+            return get_pdf_result_sync(file_path)
+        stem = os.path.basename(file_path)[:-4].split('.')[0]
+        output_dir = os.path.join(os.path.dirname(file_path), stem + '_md')
+        markdown_file = pdf_parse_cache.get(file_hash, output_dir, stem + '.md')
+        if markdown_file:
+            return markdown_file
+        markdown_file = get_pdf_result_sync(file_path)
+        if markdown_file:
+            pdf_parse_cache.put(file_hash, markdown_file)
+        return markdown_file
+
     @get_time
     def split_file_to_docs(self):
         insert_logger.info(f"start split file to docs, file_path: {self.file_name}")
@@ -392,7 +411,7 @@ class LocalFileForInsert:
         elif self.file_path.lower().endswith(".txt"):
             docs = self.load_text(self.file_path)
         elif self.file_path.lower().endswith(".pdf"):
-            markdown_file = get_pdf_result_sync(self.file_path)
+            markdown_file = self.get_pdf_markdown(self.file_path)
             if markdown_file:
                 docs = convert_markdown_to_langchaindoc(markdown_file)
                 docs = self.markdown_process(docs)
@@ -3,10 +3,12 @@ from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
 from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
 from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
 from qanything_kernel.core.retriever.docstrore import MysqlStore
-from qanything_kernel.configs.model_config import DEFAULT_CHILD_CHUNK_SIZE, DEFAULT_PARENT_CHUNK_SIZE, SEPARATORS
+from qanything_kernel.configs.model_config import DEFAULT_CHILD_CHUNK_SIZE, DEFAULT_PARENT_CHUNK_SIZE, SEPARATORS, \
+    IMAGES_ROOT_PATH
 from qanything_kernel.utils.custom_log import debug_logger, insert_logger
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from qanything_kernel.utils.general_utils import num_tokens_embed, get_time_async
+from collections import Counter
 import copy
 from typing import List, Optional, Tuple, Dict
 from langchain_core.documents import Document
@@ -15,8 +17,54 @@ from langchain_core.callbacks import (
 )
 from langchain_community.vectorstores.milvus import Milvus
 from langchain_elasticsearch import ElasticsearchStore
+import asyncio
+import shutil
 import time
 import traceback
+import os
+
+
+def strip_headers(page_content):
+    # 父文档和子chunk的内容都以"[headers](...)\n"开头，见SelfParentRetriever.aadd_documents
+    if page_content.startswith('[headers]('):
+        end = page_content.find(')\n')
+        if end >= 0:
+            return page_content[end + 2:]
+    return page_content
+
+
+def replace_headers(page_content, headers):
+    return f"[headers]({headers})\n" + strip_headers(page_content)
+
+
+def diff_chunks(stored_chunks, texts):
+    """
+    stored_chunks为已入库的[(key, text)]，texts为更新后的子chunk内容。
+    按内容比较（相同内容可以出现多次），返回(需要删除的key列表, 需要新增的text列表)，其余chunk原样保留
+    """
+    remaining = Counter(texts)
+    delete_keys = []
+    for key, text in stored_chunks:
+        if remaining[text] > 0:
+            remaining[text] -= 1
+        else:
+            delete_keys.append(key)
+    return delete_keys, list(remaining.elements())
+
+
+def rekey_doc_id(doc_id, file_id):
+    # file_id_i -> 新file_id_i
+    return file_id + '_' + doc_id.rsplit('_', 1)[-1]
+
+
+def rewrite_chunk(metadata, page_content, file_meta, headers):
+    """复制chunk到新文件：metadata中的文件级字段替换为file_meta，doc_id换成新的file_id，返回替换了headers的内容"""
+    metadata.update({k: v for k, v in file_meta.items() if k in metadata})
+    if 'doc_id' in metadata:
+        metadata['doc_id'] = rekey_doc_id(metadata['doc_id'], file_meta['file_id'])
+    if 'headers' in metadata:
+        metadata['headers'] = headers
+    return replace_headers(page_content, headers)
 
 
 class SelfParentRetriever(ParentDocumentRetriever):
@@ -180,9 +228,19 @@ class ParentRetriever:
             parent_splitter=init_parent_splitter,
         )
         self.backup_vectorstore: Optional[Milvus] = None
+        self.es_client = es_client
         self.es_store = es_client.es_store
         self.parent_chunk_size = DEFAULT_PARENT_CHUNK_SIZE
 
+    @staticmethod
+    def get_child_splitter(parent_chunk_size):
+        child_chunk_size = min(DEFAULT_CHILD_CHUNK_SIZE, int(parent_chunk_size / 2))
+        return RecursiveCharacterTextSplitter(
+            separators=SEPARATORS,
+            chunk_size=child_chunk_size,
+            chunk_overlap=int(child_chunk_size / 4),
+            length_function=num_tokens_embed)
+
     @get_time_async
     async def insert_documents(self, docs, parent_chunk_size, single_parent=False):
         insert_logger.info(f"Inserting {len(docs)} documents, parent_chunk_size: {parent_chunk_size}, single_parent: {single_parent}")
@@ -193,16 +251,10 @@ class ParentRetriever:
                 chunk_size=parent_chunk_size,
                 chunk_overlap=0,
                 length_function=num_tokens_embed)
-            child_chunk_size = min(DEFAULT_CHILD_CHUNK_SIZE, int(parent_chunk_size / 2))
-            child_splitter = RecursiveCharacterTextSplitter(
-                separators=SEPARATORS,
-                chunk_size=child_chunk_size,
-                chunk_overlap=int(child_chunk_size / 4),
-                length_function=num_tokens_embed)
             self.retriever = SelfParentRetriever(
                 vectorstore=self.vectorstore_client.local_vectorstore,
                 docstore=MysqlStore(self.mysql_client),
-                child_splitter=child_splitter,
+                child_splitter=self.get_child_splitter(parent_chunk_size),
                 parent_splitter=parent_splitter
             )
         # insert_logger.info(f'insert documents: {len(docs)}')
@@ -210,6 +262,111 @@ class ParentRetriever:
         return await self.retriever.aadd_documents(docs, parent_chunk_size=parent_chunk_size,
                                                    es_store=self.es_store, ids=ids, single_parent=single_parent)
 
+    @get_time_async
+    async def clone_file_documents(self, src_file_id, src_chunks_number, file_meta, headers):
+        """
+        内容和解析配置相同的文件复用已入库的结果：复制src_file_id的父文档、Milvus中的子chunk（含向量）、ES记录和解析出的图片，
+        file_id、kb_id等文件级元数据替换为file_meta，headers替换为新的知识库名和文件名，不调用解析和embedding服务。
+        返回(子chunk数, time_record)；复制失败或源文件在复制过程中被删除时，清理已写入的部分并抛出异常
+        """
+        file_id = file_meta['file_id']
+        time_record = {'dedup_source': src_file_id}
+        doc_jsons = await asyncio.to_thread(self.mysql_client.get_document_by_file_id, src_file_id)
+        if not doc_jsons:
+            raise ValueError(f"parent documents of {src_file_id} not found")
+
+        def rewrite_milvus_row(row):
+            text_field = self.vectorstore_client.local_vectorstore._text_field
+            row[text_field] = rewrite_chunk(row, row[text_field], file_meta, headers)
+            return row
+
+        def rewrite_es_source(source):
+            source['text'] = rewrite_chunk(source['metadata'], source['text'], file_meta, headers)
+            return source
+
+        full_docs = []
+        for doc_json in doc_jsons:
+            doc_id = rekey_doc_id(doc_json['kwargs'].pop('chunk_id'), file_id)
+            metadata = doc_json['kwargs']['metadata']
+            metadata.update(file_meta)
+            doc_json['kwargs']['page_content'] = rewrite_chunk(metadata, doc_json['kwargs']['page_content'], file_meta,
+                                                               headers)
+            full_docs.append((doc_id, doc_json))
+
+        try:
+            src_images_dir = os.path.join(IMAGES_ROOT_PATH, src_file_id)
+            if os.path.exists(src_images_dir):
+                await asyncio.to_thread(shutil.copytree, src_images_dir, os.path.join(IMAGES_ROOT_PATH, file_id),
+                                        dirs_exist_ok=True)
+            milvus_start = time.perf_counter()
+            chunks_number = await asyncio.to_thread(self.vectorstore_client.clone_file_chunks, src_file_id,
+                                                    rewrite_milvus_row)
+            time_record['milvus_insert_time'] = round(time.perf_counter() - milvus_start, 2)
+            if chunks_number != src_chunks_number:
+                raise ValueError(f"milvus chunks of {src_file_id} changed: {chunks_number} != {src_chunks_number}")
+            try:
+                es_start = time.perf_counter()
+                await asyncio.to_thread(self.es_client.clone_file, src_file_id, file_id, rewrite_es_source)
+                time_record['es_insert_time'] = round(time.perf_counter() - es_start, 2)
+            except Exception:
+                # 与正常入库一致，ES写入失败不影响向量检索
+                insert_logger.error(f"Error in clone_file on es_store: {traceback.format_exc()}")
+            await asyncio.to_thread(self.mysql_client.add_documents, full_docs)
+        except Exception:
+            await asyncio.to_thread(self.delete_file_documents, file_id)
+            raise
+        return chunks_number, time_record
+
+    @get_time_async
+    async def update_document_incremental(self, doc_id, doc_json, update_content, parent_chunk_size):
+        """
+        增量更新父文档doc_id：按入库时的规则重新切分子chunk，与Milvus、ES中已有的子chunk按内容比较，
+        只对新增的子chunk做embedding并插入，按主键/_id删除不再存在的子chunk，内容不变的子chunk保留原有向量，最后更新父文档。
+        返回time_record（包含新增、删除、保留的子chunk数）；doc_id在Milvus中没有子chunk时返回None，由调用方走完整的入库流程
+        """
+        vectorstore = self.vectorstore_client.local_vectorstore
+        text_field, pk_field = vectorstore._text_field, vectorstore._primary_field
+        headers = doc_json['kwargs']['metadata']['headers']
+        content = strip_headers(update_content)
+        child_splitter = self.get_child_splitter(parent_chunk_size)
+        texts = [f"[headers]({headers})\n" + text for text in child_splitter.split_text(content)]
+
+        stored_chunks = await asyncio.to_thread(self.vectorstore_client.get_doc_chunks, doc_id)
+        if not stored_chunks:
+            return None
+        delete_pks, add_texts = diff_chunks([(row[pk_field], row[text_field]) for row in stored_chunks], texts)
+        # 新增的子chunk沿用已有子chunk的元数据（user_id、kb_id、file_id、headers、doc_id等）
+        child_metadata = {k: v for k, v in stored_chunks[0].items() if k not in (pk_field, text_field)}
+        time_record = {'child_chunks': len(texts), 'reused_chunks': len(texts) - len(add_texts),
+                       'added_chunks': len(add_texts), 'deleted_chunks': len(delete_pks)}
+        # 先插入新chunk再删除旧chunk，更新过程中检索不会缺少这个父文档
+        if add_texts:
+            await vectorstore.aadd_texts(add_texts, [dict(child_metadata) for _ in add_texts], time_record=time_record)
+        if delete_pks:
+            await asyncio.to_thread(self.vectorstore_client.delete_expr, f'{pk_field} in {delete_pks}', True)
+
+        try:
+            es_start = time.perf_counter()
+            es_chunks = await asyncio.to_thread(self.es_client.get_doc_chunks, doc_id)
+            es_delete_ids, es_add_texts = diff_chunks(es_chunks, texts)
+            await asyncio.to_thread(self.es_client.update_doc_chunks, doc_id, es_delete_ids, es_add_texts,
+                                    child_metadata)
+            time_record['es_insert_time'] = round(time.perf_counter() - es_start, 2)
+        except Exception:
+            # 与正常入库一致，ES写入失败不影响向量检索
+            insert_logger.error(f"Error in update_doc_chunks on es_store: {traceback.format_exc()}")
+
+        await asyncio.to_thread(self.mysql_client.update_document, doc_id, f"[headers]({headers})\n" + content)
+        insert_logger.info(f"update document {doc_id} incrementally: {time_record}")
+        return time_record
+
+    def delete_file_documents(self, file_id):
+        """删除文件在Milvus、ES、Documents表中的数据和解析出的图片"""
+        self.vectorstore_client.delete_expr(f'file_id == "{file_id}"')
+        self.es_client.delete_file(file_id)
+        self.mysql_client.delete_documents([file_id])
+        shutil.rmtree(os.path.join(IMAGES_ROOT_PATH, file_id), ignore_errors=True)
+
     async def get_retrieved_documents(self, query: str, partition_keys: List[str], time_record: dict,
                                       hybrid_search: bool, top_k: int):
         milvus_start_time = time.perf_counter()
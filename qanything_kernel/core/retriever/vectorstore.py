@@ -2,35 +2,148 @@ from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from typing import Optional, List, Any, Iterable, Callable
 from qanything_kernel.utils.custom_log import debug_logger, insert_logger
-from qanything_kernel.configs.model_config import MILVUS_PORT, MILVUS_COLLECTION_NAME, MILVUS_HOST_LOCAL
+from qanything_kernel.configs.model_config import MILVUS_PORT, MILVUS_COLLECTION_NAME, MILVUS_HOST_LOCAL, \
+    MILVUS_FLUSH_ROWS, MILVUS_FLUSH_INTERVAL, MILVUS_FLUSH_TIMEOUT
 from qanything_kernel.connector.embedding.embedding_for_online_client import YouDaoEmbeddings
 from qanything_kernel.utils.general_utils import get_time, get_time_async
 from langchain_community.vectorstores.milvus import Milvus
 from pymilvus.orm.collection import MutationResult
+import threading
 import asyncio
 import time
 
 
+class MilvusFlushScheduler:
+    """
+    一个collection的flush调度器（group commit）。插入后调用record登记行数，不再每次插入都flush：
+    后台线程在未flush的行数达到max_rows，或最早一条未flush的数据已等待interval秒时，对collection执行一次flush，
+    把这段时间内所有文件的插入合并为一次，减少小segment和flush风暴。
+    只有需要保证已写入数据落盘（批量导入结束、进程退出）时才调用flush强制立即执行并等待完成
+    """
+
+    def __init__(self, collection_name, max_rows=MILVUS_FLUSH_ROWS, interval=MILVUS_FLUSH_INTERVAL):
+        self.collection_name = collection_name
+        self.max_rows = max_rows
+        self.interval = interval
+        self.cond = threading.Condition()
+        self.col = None
+        self.pending_rows = 0
+        self.pending_since = None
+        # 累计登记的行数和已flush覆盖的行数，强制flush时等待后者追上调用时的前者
+        self.recorded_rows = 0
+        self.flushed_rows = 0
+        self.force = False
+        self.force_waiters = 0
+        self.flushing = False
+        self.flush_count = 0
+        self.last_flush_cost = 0
+        self.thread = None
+
+    def record(self, col, rows):
+        with self.cond:
+            self.col = col
+            self.pending_rows += rows
+            self.recorded_rows += rows
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+                # 后台线程在没有待flush数据时无超时等待，需要唤醒它按interval重新计算等待时间
+                self.cond.notify_all()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run_, name=f'milvus-flush-{self.collection_name}',
+                                               daemon=True)
+                self.thread.start()
+            if self.pending_rows >= self.max_rows:
+                self.cond.notify_all()
+
+    def flush(self, timeout=MILVUS_FLUSH_TIMEOUT):
+        """立即flush已登记的插入并等待完成，没有未flush的数据时直接返回。超时返回False"""
+        with self.cond:
+            target = self.recorded_rows
+            if self.flushed_rows >= target:
+                return True
+            self.force = True
+            self.force_waiters += 1
+            self.cond.notify_all()
+            try:
+                return self.cond.wait_for(lambda: self.flushed_rows >= target, timeout=timeout)
+            finally:
+                self.force_waiters -= 1
+
+    def stats(self):
+        with self.cond:
+            return {'collection': self.collection_name, 'pending_rows': self.pending_rows,
+                    'pending_seconds': round(time.monotonic() - self.pending_since, 2) if self.pending_since else 0,
+                    'flushing': self.flushing, 'flush_count': self.flush_count,
+                    'last_flush_cost': self.last_flush_cost}
+
+    def due_(self):
+        if not self.pending_rows:
+            return False
+        return (self.force or self.pending_rows >= self.max_rows or
+                time.monotonic() - self.pending_since >= self.interval)
+
+    def run_(self):
+        while True:
+            with self.cond:
+                while not self.due_():
+                    timeout = None if not self.pending_rows else self.interval - (time.monotonic() - self.pending_since)
+                    self.cond.wait(timeout=timeout)
+                col, rows, covered = self.col, self.pending_rows, self.recorded_rows
+                self.pending_rows, self.pending_since, self.force = 0, None, False
+                self.flushing = True
+            start = time.perf_counter()
+            try:
+                col.flush()
+                cost = round(time.perf_counter() - start, 2)
+                insert_logger.info(f"Flushed Milvus collection {self.collection_name}: {rows} rows, cost {cost}s")
+                with self.cond:
+                    self.flushed_rows = max(self.flushed_rows, covered)
+                    self.flush_count += 1
+                    self.last_flush_cost = cost
+            except Exception as e:
+                insert_logger.error(f"Flush Milvus collection {self.collection_name} failed: {e}")
+                with self.cond:
+                    # 放回待flush的行数，等待下一个周期重试
+                    self.pending_rows += rows
+                    if self.pending_since is None:
+                        self.pending_since = time.monotonic()
+                    # 有强制flush在等待时立即重试，不等到下一个周期
+                    if self.force_waiters:
+                        self.force = True
+                time.sleep(1)
+            finally:
+                with self.cond:
+                    self.flushing = False
+                    self.cond.notify_all()
+
+
+# 同一进程中同一collection的多个SelfMilvus实例共用一个调度器
+flush_schedulers = {}
+flush_schedulers_lock = threading.Lock()
+
+
+def get_flush_scheduler(collection_name) -> MilvusFlushScheduler:
+    with flush_schedulers_lock:
+        if collection_name not in flush_schedulers:
+            flush_schedulers[collection_name] = MilvusFlushScheduler(collection_name)
+        return flush_schedulers[collection_name]
+
+
+def flush_all_collections(timeout=MILVUS_FLUSH_TIMEOUT):
+    """进程退出前调用，flush所有collection中未flush的插入"""
+    for scheduler in list(flush_schedulers.values()):
+        if not scheduler.flush(timeout=timeout):
+            insert_logger.warning(f"Flush Milvus collection {scheduler.collection_name} timeout")
+
+
+def flush_stats():
+    return [scheduler.stats() for scheduler in list(flush_schedulers.values())]
+
+
 class SelfMilvus(Milvus):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.last_flush_time = 0  # 初始化为0，确保首次调用_should_flush时返回True
-        self.inserted_since_last_flush = 0
-        self.flush_interval = 600  # 600 seconds
-        self.flush_threshold = 10000  # 10,000 entities
-
-    def _should_flush(self) -> bool:
-        current_time = time.time()
-        time_since_last_flush = current_time - self.last_flush_time
-        return (self.inserted_since_last_flush >= self.flush_threshold or
-                time_since_last_flush >= self.flush_interval or self.last_flush_time == 0)
-
-    @get_time
-    def _milvus_flush(self):
-        asyncio.create_task(asyncio.to_thread(self.col.flush))
-        self.last_flush_time = time.time()
-        self.inserted_since_last_flush = 0
-        insert_logger.info(f"Flushed Milvus collection at {self.last_flush_time}")
+        self.flush_scheduler = get_flush_scheduler(self.collection_name)
 
     def _create_collection(
             self, embeddings: list, metadatas: Optional[list[dict]] = None
@@ -250,15 +363,9 @@ class SelfMilvus(Milvus):
                     "Failed to insert batch starting at entity: %s/%s", i, total_count
                 )
                 raise e
-            self.inserted_since_last_flush += end - i
+            self.flush_scheduler.record(self.col, end - i)
 
         time_record['milvus_insert_time'] = round(time.perf_counter() - insert_start, 2)
-
-        asyncio.create_task(asyncio.to_thread(self.col.flush))
-        # if self._should_flush():
-        #     self._milvus_flush()
-
-        # self.col.flush()
         return pks
 
 
@@ -279,23 +386,84 @@ class VectorStoreMilvusClient:
         debug_logger.info(
             f'init vectorstore {self.host}, {MILVUS_COLLECTION_NAME}')
 
+    def flush(self, timeout=MILVUS_FLUSH_TIMEOUT):
+        """强制flush本进程已写入的数据并等待完成，只在需要保证写入已落盘时调用"""
+        return self.local_vectorstore.flush_scheduler.flush(timeout=timeout)
+
     def get_local_chunks(self, expr, timeout=10):
         future = self.executor.submit(
             partial(self.local_vectorstore.get_pks, expr=expr, timeout=timeout))
         return future.result()
 
+    @property
+    def chunk_fields(self):
+        """除自增主键外的全部字段（元数据、文本和向量），按collection schema中的顺序"""
+        vectorstore = self.local_vectorstore
+        return [x for x in vectorstore.fields if x != vectorstore._primary_field]
+
+    def iter_chunks(self, expr, batch_size=1000):
+        """按批读出满足expr的chunk（包括向量），每批是字段名为key的dict列表"""
+        if self.local_vectorstore.col is None:
+            return
+        iterator = self.local_vectorstore.col.query_iterator(batch_size=batch_size, expr=expr,
+                                                             output_fields=self.chunk_fields)
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                yield rows
+        finally:
+            iterator.close()
+
+    def insert_chunks(self, rows):
+        """
+        直接写入已有向量的chunk，不调用embedding服务，rows需要包含chunk_fields中的全部字段。
+        collection不存在时按第一条数据创建。写入后由flush调度器合并flush
+        """
+        vectorstore = self.local_vectorstore
+        if vectorstore.col is None:
+            text_field, vector_field = vectorstore._text_field, vectorstore._vector_field
+            vectorstore._init(embeddings=[rows[0][vector_field]],
+                              metadatas=[{k: v for k, v in rows[0].items() if k not in (text_field, vector_field)}])
+        fields = self.chunk_fields
+        vectorstore.col.insert([[row[x] for row in rows] for x in fields], timeout=60)
+        vectorstore.flush_scheduler.record(vectorstore.col, len(rows))
+
+    def get_doc_chunks(self, doc_id, timeout=10):
+        """返回父文档doc_id的全部子chunk，每项是包含主键、文本和元数据字段的dict，不含向量"""
+        vectorstore = self.local_vectorstore
+        if vectorstore.col is None:
+            return []
+        output_fields = [x for x in vectorstore.fields if x != vectorstore._vector_field]
+        return vectorstore.col.query(expr=f'doc_id == "{doc_id}"', output_fields=output_fields, timeout=timeout)
+
+    @get_time
+    def clone_file_chunks(self, src_file_id, rewrite, batch_size=1000):
+        """
+        按批读出src_file_id的全部chunk（包括向量），经rewrite改写file_id、kb_id等字段后插入，不调用embedding服务。
+        kb_id是partition key，插入时按改写后的kb_id自动落到对应分区。返回插入的条数
+        """
+        inserted = 0
+        for rows in self.iter_chunks(f'file_id == "{src_file_id}"', batch_size):
+            self.insert_chunks([rewrite(row) for row in rows])
+            inserted += len(rows)
+        insert_logger.info(f'milvus clone chunks: {src_file_id} -> {inserted}')
+        return inserted
+
     # def delete_chunks(self, chunk_ids):
     #     res = self.vectorstore.delete(expr=f"chunk_id in {chunk_ids}")
     #     debug_logger.info(f'milvus delete chunk number: {len(chunk_ids)} res: {res}')
 
     @get_time
-    def delete_expr(self, expr):
-        # 如果expr为空，则不执行删除操作
-        if len(self.get_local_chunks(expr)) == 0:
-            debug_logger.info(f'expr: {expr} not found in local milvus')
+    def delete_expr(self, expr, raise_error=False):
+        # 直接按表达式删除，没有匹配的数据时是空操作，不需要先查询一遍主键
+        if self.local_vectorstore.col is None:
             return
         try:
-            res = self.local_vectorstore.delete(expr=expr, timeout=10)
-            debug_logger.info(f'local milvus delete expr: {expr} res: {res}')
+            res = self.local_vectorstore.delete(expr=expr, timeout=60)
+            debug_logger.info(f'local milvus delete expr: {expr[:200]} res: {res}')
         except Exception as e:
-            debug_logger.error(f'local milvus delete expr: {expr} error: {e}')
+            debug_logger.error(f'local milvus delete expr: {expr[:200]} error: {e}')
+            if raise_error:
+                raise
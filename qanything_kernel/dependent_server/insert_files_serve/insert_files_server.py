@@ -14,17 +14,19 @@ from sanic import Sanic, response
 from qanything_kernel.utils.custom_log import insert_logger
 from qanything_kernel.utils.general_utils import get_time_async
 from qanything_kernel.core.retriever.general_document import LocalFileForInsert
-from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
+from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient, flush_all_collections, \
+    flush_stats
 from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
 from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
 from qanything_kernel.core.retriever.parent_retriever import ParentRetriever
 from qanything_kernel.configs.model_config import MYSQL_HOST_LOCAL, MYSQL_PORT_LOCAL, \
-    MYSQL_USER_LOCAL, MYSQL_PASSWORD_LOCAL, MYSQL_DATABASE_LOCAL, MAX_CHARS
+    MYSQL_USER_LOCAL, MYSQL_PASSWORD_LOCAL, MYSQL_DATABASE_LOCAL, MAX_CHARS, FILE_DEDUP_ENABLED
 from sanic.worker.manager import WorkerManager
 import asyncio
 import traceback
 import time
 import random
+import shutil
 import aiomysql
 import argparse
 import json
@@ -53,6 +55,81 @@ db_config = {
 }
 
 
+def copy_upload_file(src_location, file_location):
+    # 优先使用硬链接，不占用额外磁盘空间也不需要读写文件内容
+    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+    if os.path.exists(file_location):
+        return
+    try:
+        os.link(src_location, file_location)
+    except OSError:
+        shutil.copy2(src_location, file_location)
+
+
+def get_clone_sources(mysql_client, file_info):
+    """
+    返回可以直接复制入库结果的源文件[(file_id, chunks_number, content_length)]：
+    复制/移动知识库产生的文件使用FileClone中记录的源文件，其他文件按内容哈希和解析配置查找
+    """
+    _, file_id, _, _, _, file_location, _, _, _, content_hash, parse_config = file_info
+    clone = mysql_client.get_file_clone(file_id)
+    if clone is not None:
+        src_file_id, _, _, src_location, status, deleted, chunks_number, content_length = clone
+        if file_location not in ('FAQ', 'URL') and src_location and os.path.exists(src_location):
+            # 先复制原始文件，复制向量失败时仍可按正常流程重新解析，下载原文也不依赖源文件
+            copy_upload_file(src_location, file_location)
+        if status == 'green' and not deleted:
+            return [(src_file_id, chunks_number, content_length)]
+        return []
+    if FILE_DEDUP_ENABLED and content_hash:
+        return mysql_client.get_dedup_source_files(content_hash, parse_config, file_id)
+    return []
+
+
+def finish_file_clone(retriever, mysql_client, file_id, status):
+    """移动文件入库成功后删除源文件，入库失败时保留源文件"""
+    clone = mysql_client.get_file_clone(file_id)
+    if clone is None:
+        return
+    src_file_id, src_kb_id, move, src_location = clone[:4]
+    if move and status == 'green':
+        mysql_client.delete_files(src_kb_id, [src_file_id])
+        mysql_client.delete_faqs([src_file_id])
+        retriever.delete_file_documents(src_file_id)
+        if src_location and src_location not in ('FAQ', 'URL'):
+            shutil.rmtree(os.path.dirname(src_location), ignore_errors=True)
+        insert_logger.info(f'moved file {src_file_id} from {src_kb_id} deleted')
+    mysql_client.delete_file_clone(file_id)
+
+
+async def clone_file_from_sources(retriever, mysql_client, file_info, sources, time_record):
+    """
+    直接复制源文件已入库的父文档、向量和ES记录，跳过解析和embedding，依次尝试sources中的文件。
+    返回与process_data相同的结果；全部复制失败时返回None，由调用方走正常的解析入库流程
+    """
+    _, file_id, user_id, file_name, kb_id, file_location, file_size, file_url, chunk_size, _, _ = file_info
+    kb_name = mysql_client.get_knowledge_base_name([kb_id])[0][2]
+    file_meta = {'user_id': user_id, 'kb_id': kb_id, 'file_id': file_id, 'file_name': file_name,
+                 'nos_key': file_location, 'file_url': file_url}
+    headers = {"知识库名": kb_name, '文件名': file_name}
+    for src_file_id, src_chunks_number, content_length in sources:
+        start = time.perf_counter()
+        try:
+            chunks_number, clone_time_record = await retriever.clone_file_documents(src_file_id, src_chunks_number,
+                                                                                    file_meta, headers)
+        except Exception:
+            insert_logger.warning(f'clone {src_file_id} -> {file_id} failed: {traceback.format_exc()}')
+            continue
+        time_record.update(clone_time_record)
+        time_record['upload_total_time'] = round(time.perf_counter() - start, 2)
+        mysql_client.update_chunks_number(file_id, chunks_number)
+        mysql_client.update_file_upload_infos(file_id, time_record)
+        insert_logger.info(f'insert_files_to_milvus by clone: {user_id}, {kb_id}, {file_id}, {file_name}, '
+                           f'source: {src_file_id}')
+        return 'green', content_length, chunks_number, json.dumps(time_record, ensure_ascii=False)
+    return None
+
+
 @get_time_async
 async def process_data(retriever, milvus_kb, mysql_client, file_info, time_record):
     parse_timeout_seconds = 300
@@ -61,10 +138,15 @@ async def process_data(retriever, milvus_kb, mysql_client, file_info, time_recor
     status = 'green'
     process_start = time.perf_counter()
     insert_logger.info(f'Start insert file: {file_info}')
-    _, file_id, user_id, file_name, kb_id, file_location, file_size, file_url, chunk_size = file_info
+    _, file_id, user_id, file_name, kb_id, file_location, file_size, file_url, chunk_size, _, _ = file_info
     # 获取格式为'2021-08-01 00:00:00'的时间戳
     insert_timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
     mysql_client.update_knowlegde_base_latest_insert_time(kb_id, insert_timestamp)
+    sources = await asyncio.to_thread(get_clone_sources, mysql_client, file_info)
+    if sources:
+        result = await clone_file_from_sources(retriever, mysql_client, file_info, sources, time_record)
+        if result is not None:
+            return result
     local_file = LocalFileForInsert(user_id, kb_id, file_id, file_location, file_name, file_url, chunk_size, mysql_client)
     msg = "success"
     chunks_number = 0
@@ -184,7 +266,7 @@ async def check_and_process(pool):
 
                         await cur.execute(
                             "SELECT id, file_id, user_id, file_name, kb_id, file_location, file_size, file_url, "
-                            "chunk_size FROM File WHERE id=%s", (id,))
+                            "chunk_size, content_hash, parse_config FROM File WHERE id=%s", (id,))
                         file_info = await cur.fetchone()
                         insert_logger.info(f"Worker {worker_id} 获取文件详细信息: {file_info}")
 
@@ -204,6 +286,7 @@ async def check_and_process(pool):
                             (status, content_length, chunks_number, msg, file_info[0]))
                         await conn.commit()
                         insert_logger.info(f"Worker {worker_id} 文件处理完成并更新数据库: {timestamp}, {file_id}, {file_name}, 状态={status}")
+                        await asyncio.to_thread(finish_file_clone, retriever, mysql_client, file_id, status)
                         sleep_time = 0.1
                     else:
                         insert_logger.info(f"Worker {worker_id} 没有找到需要处理的文件")
@@ -239,8 +322,16 @@ async def check_and_process(pool):
             await asyncio.sleep(sleep_time)
 
 
+@app.route('/health_check', methods=['GET'])
+async def health_check(request):
+    # milvus_flush为处理本次请求的worker进程中各collection等待合并flush的行数和flush耗时，多worker时每个进程各自统计
+    return response.json({"code": 200, "msg": "success", "pid": os.getpid(), "milvus_flush": flush_stats()})
+
+
 @app.listener('after_server_stop')
 async def close_db(app, loop):
+    # 退出前flush合并中尚未flush的插入
+    await asyncio.to_thread(flush_all_collections)
     # 关闭数据库连接池
     app.ctx.pool.close()
     await app.ctx.pool.wait_closed()
@@ -22,14 +22,19 @@ import onnxruntime as ort
 from sanic import Sanic, response
 from sanic.request import Request
 from sanic.response import json
+from collections import OrderedDict
+import threading
+import hashlib
 import base64
 import argparse
+import asyncio
 
 # 接收外部参数mode
 parser = argparse.ArgumentParser()
 # mode必须是local或online
 parser.add_argument('--use_gpu', action="store_true", help='use gpu or not')
 parser.add_argument('--workers', type=int, default=1, help='workers')
+parser.add_argument('--cache_size', type=int, default=2000, help='max number of cached ocr results, 0 to disable')
 # 检查是否是local或online，不是则报错
 args = parser.parse_args()
 print("args:", args)
@@ -362,10 +367,14 @@ class TextRecognizer(object):
 
 
 class TextDetector(object):
+    # (文本密度上限, 检测分辨率)：大图中文字越稀疏，检测时缩放得越小
+    ADAPTIVE_LIMIT_SIDE_LENS = [(0.01, 640), (0.03, 800)]
+
     def __init__(self, model_dir, device):
+        self.limit_side_len = 960
         pre_process_list = [{
             'DetResizeForTest': {
-                'limit_side_len': 960,
+                'limit_side_len': self.limit_side_len,
                 'limit_type': "max",
             }
         }, {
@@ -389,9 +398,12 @@ class TextDetector(object):
         self.predictor, self.input_tensor = load_model(model_dir, 'det', device)
 
         img_h, img_w = self.input_tensor.shape[2:]
+        self.adaptive = True
         if isinstance(img_h, str) or isinstance(img_w, str):
             pass
         elif img_h is not None and img_w is not None and img_h > 0 and img_w > 0:
+            # 模型输入尺寸固定时无法自适应分辨率
+            self.adaptive = False
             pre_process_list[0] = {
                 'DetResizeForTest': {
                     'image_shape': [img_h, img_w]
@@ -399,6 +411,24 @@ class TextDetector(object):
             }
         self.preprocess_op = create_operators(pre_process_list)
 
+    def adaptive_limit_side_len(self, img):
+        """
+        根据图片尺寸和估计的文本密度选择检测分辨率。本来就不超过默认分辨率的图片不做处理；
+        大图用缩略图的边缘像素占比估计文本密度，稀疏的大图（海报、logo、只有几行字的截图）用更小的分辨率检测
+        """
+        h, w = img.shape[:2]
+        if not self.adaptive or max(h, w) <= self.limit_side_len:
+            return self.limit_side_len
+        scale = 256.0 / max(h, w)
+        thumb = cv2.resize(img, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+        edges = cv2.Canny(gray, 100, 200)
+        density = np.count_nonzero(edges) / float(edges.size)
+        for max_density, limit_side_len in self.ADAPTIVE_LIMIT_SIDE_LENS:
+            if density < max_density:
+                return limit_side_len
+        return self.limit_side_len
+
     def order_points_clockwise(self, pts):
         rect = np.zeros((4, 2), dtype="float32")
         s = pts.sum(axis=1)
@@ -445,7 +475,7 @@ class TextDetector(object):
 
     def __call__(self, img):
         ori_im = img.copy()
-        data = {'image': img}
+        data = {'image': img, 'limit_side_len': self.adaptive_limit_side_len(img)}
 
         st = time.time()
         data = transform(data, self.preprocess_op)
@@ -474,12 +504,36 @@ class TextDetector(object):
 
 
 class OCRQAnything(object):
-    def __init__(self, model_dir=None, device='cpu'):
+    def __init__(self, model_dir=None, device='cpu', cache_size=0):
         self.device = device
         self.text_detector = TextDetector(model_dir, device)
         self.text_recognizer = TextRecognizer(model_dir, device)
         self.drop_score = 0.5
         self.crop_image_res_index = 0
+        # 以图片像素内容哈希为key的LRU结果缓存，docx/pptx/pdf中反复出现的logo、页眉等只识别一次
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(img):
+        return hashlib.md5(img.tobytes()).hexdigest() + '_' + '_'.join(map(str, img.shape))
+
+    def get_cache(self, key):
+        with self.cache_lock:
+            if key not in self.cache:
+                return None
+            self.cache.move_to_end(key)
+            return list(self.cache[key])
+
+    def put_cache(self, key, result):
+        if self.cache_size <= 0:
+            return
+        with self.cache_lock:
+            self.cache[key] = list(result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
 
     def get_rotate_crop_image(self, img, points):
         '''
@@ -568,12 +622,65 @@ class OCRQAnything(object):
             return ""
         return text
 
+    def _crop_text_images(self, img):
+        """检测一张图片中的文本框，返回排序后的文本框、对应的裁剪图以及检测耗时"""
+        ori_im = img.copy()
+        dt_boxes, elapse = self.text_detector(img)
+        if dt_boxes is None:
+            return [], [], elapse
+        dt_boxes = self.sorted_boxes(dt_boxes)
+        img_crop_list = [self.get_rotate_crop_image(ori_im, copy.deepcopy(box)) for box in dt_boxes]
+        return dt_boxes, img_crop_list, elapse
+
+    def batch(self, imgs):
+        """
+        多张图片逐张做文本检测，所有图片的文本裁剪图合并后只调用一次TextRecognizer，
+        返回与imgs一一对应的文本列表
+        """
+        time_dict = {'det': 0, 'rec': 0, 'all': 0, 'cache_hit': 0}
+        start = time.time()
+        results = [None] * len(imgs)
+        miss_idxs = []
+        miss_keys = []
+        crop_nums = []
+        all_crops = []
+        for idx, img in enumerate(imgs):
+            key = self.cache_key(img) if self.cache_size > 0 else None
+            cached = self.get_cache(key) if key else None
+            if cached is not None:
+                results[idx] = cached
+                time_dict['cache_hit'] += 1
+                continue
+            _, img_crop_list, elapse = self._crop_text_images(img)
+            time_dict['det'] += elapse
+            miss_idxs.append(idx)
+            miss_keys.append(key)
+            crop_nums.append(len(img_crop_list))
+            all_crops.extend(img_crop_list)
+
+        rec_res, elapse = self.text_recognizer(all_crops)
+        time_dict['rec'] = elapse
+
+        offset = 0
+        for idx, key, crop_num in zip(miss_idxs, miss_keys, crop_nums):
+            results[idx] = [text for text, score in rec_res[offset:offset + crop_num] if score >= self.drop_score]
+            offset += crop_num
+            if key:
+                self.put_cache(key, results[idx])
+        time_dict['all'] = time.time() - start
+        return results, time_dict
+
     def __call__(self, img, cls=True):
         time_dict = {'det': 0, 'rec': 0, 'cls': 0, 'all': 0}
 
         if img is None:
             return None, None, time_dict
 
+        key = self.cache_key(img) if self.cache_size > 0 else None
+        cached = self.get_cache(key) if key else None
+        if cached is not None:
+            return cached
+
         start = time.time()
         ori_im = img.copy()
         # print(img.shape)
@@ -610,7 +717,10 @@ class OCRQAnything(object):
                 filter_rec_res.append(rec_result)
         end = time.time()
         time_dict['all'] = end - start
-        return [item[0] for item in list(filter_rec_res)]
+        result = [item[0] for item in list(filter_rec_res)]
+        if key:
+            self.put_cache(key, result)
+        return result
 
 
 app = Sanic("OCRService")
@@ -619,7 +729,7 @@ app = Sanic("OCRService")
 @app.before_server_start
 async def setup_ocr(app, loop):
     device = 'cpu' if not args.use_gpu else 'cuda'
-    app.ctx.ocr = OCRQAnything(model_dir=OCR_MODEL_PATH, device=device)
+    app.ctx.ocr = OCRQAnything(model_dir=OCR_MODEL_PATH, device=device, cache_size=args.cache_size)
 
 @app.post("/ocr")
 async def ocr_api(request: Request):
@@ -637,9 +747,43 @@ async def ocr_api(request: Request):
     if img is None:
         return json({"error": "Invalid image file"}, status=400)
 
-    result = app.ctx.ocr(img)
+    result = await asyncio.to_thread(app.ctx.ocr, img)
     return json({"result": result})
 
 
+def decode_and_ocr(ocr, bodies):
+    imgs = []
+    for idx, body in enumerate(bodies):
+        img = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Invalid image file at index {idx}")
+        imgs.append(img)
+    return ocr.batch(imgs)
+
+
+@app.post("/ocr_batch")
+async def ocr_batch_api(request: Request):
+    """
+    批量OCR，图片以二进制形式上传，不再需要base64：
+    - multipart/form-data：任意字段名的多个文件，按上传顺序返回结果
+    - 其他Content-Type：请求体就是一张图片的原始字节
+    """
+    if request.files:
+        bodies = [f.body for name in request.files for f in request.files.getlist(name)]
+    else:
+        bodies = [request.body] if request.body else []
+
+    if not bodies:
+        return json({"error": "No image data provided"}, status=400)
+
+    try:
+        # 解码、检测和识别都放到线程里，避免阻塞事件循环
+        results, time_dict = await asyncio.to_thread(decode_and_ocr, app.ctx.ocr, bodies)
+    except ValueError as e:
+        return json({"error": str(e)}, status=400)
+
+    return json({"results": results, "time_record": {k: round(v, 3) for k, v in time_dict.items()}})
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=7001, workers=args.workers)
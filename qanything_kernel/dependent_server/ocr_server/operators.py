@@ -309,7 +309,8 @@ class DetResizeForTest(object):
 
         if self.resize_type == 0:
             # img, shape = self.resize_image_type0(img)
-            img, [ratio_h, ratio_w] = self.resize_image_type0(img)
+            # 调用方可以在data中为单张图片指定limit_side_len，覆盖默认的检测分辨率
+            img, [ratio_h, ratio_w] = self.resize_image_type0(img, data.get('limit_side_len'))
         elif self.resize_type == 2:
             img, [ratio_h, ratio_w] = self.resize_image_type2(img)
         else:
@@ -338,15 +339,16 @@ class DetResizeForTest(object):
         # return img, np.array([ori_h, ori_w])
         return img, [ratio_h, ratio_w]
 
-    def resize_image_type0(self, img):
+    def resize_image_type0(self, img, limit_side_len=None):
         """
         resize image to a size multiple of 32 which is required by the network
         args:
             img(array): array with shape [h, w, c]
+            limit_side_len(int): override self.limit_side_len for this image
         return(tuple):
             img, (ratio_h, ratio_w)
         """
-        limit_side_len = self.limit_side_len
+        limit_side_len = limit_side_len or self.limit_side_len
         h, w, c = img.shape
 
         # limit the max side
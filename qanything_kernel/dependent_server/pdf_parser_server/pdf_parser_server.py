@@ -49,7 +49,8 @@ async def pdf_parser(request: Request):
     pdf_parser_: PdfLoader = request.app.ctx.pdf_parser
     markdown_file = pdf_parser_.load_to_markdown(filename, save_dir)
 
-    return json({"markdown_file": markdown_file})
+    table_time_record = {k: round(v, 2) for k, v in pdf_parser_.table_time_record.items()}
+    return json({"markdown_file": markdown_file, "table_time_record": table_time_record})
 
 
 if __name__ == '__main__':
@@ -23,12 +23,25 @@ class TableCls():
             self.table_cls = InferenceSession(cls_model, sess_options, providers=['CUDAExecutionProvider'])
         else:
             self.table_cls = InferenceSession(cls_model, sess_options, providers=['CPUExecutionProvider'])
+        self.support_batch = True
 
     def process(self, image):
-        img = Image.fromarray(np.uint8(image))
-        img = data_transform(img)
-        img = torch.unsqueeze(img, dim=0)
-        output = self.table_cls.run(None, {'input': img.numpy()})
-        predict = torch.softmax(torch.from_numpy(output[0]), dim=1)
-        predict_cla = torch.argmax(predict, dim=1).numpy()[0]
-        return cls[predict_cla]
+        return self.process_batch([image])[0]
+
+    def process_batch(self, images, batch_size=16):
+        imgs = [data_transform(Image.fromarray(np.uint8(image))) for image in images]
+        predict_clas = []
+        for start in range(0, len(imgs), batch_size):
+            batch = torch.stack(imgs[start:start + batch_size], dim=0).numpy()
+            output = None
+            if len(batch) > 1 and self.support_batch:
+                try:
+                    output = self.table_cls.run(None, {'input': batch})[0]
+                except Exception:
+                    # 模型导出时固定了batch=1，之后都退化为逐张推理
+                    self.support_batch = False
+            if output is None:
+                output = np.concatenate([self.table_cls.run(None, {'input': b[None]})[0] for b in batch], axis=0)
+            predict = torch.softmax(torch.from_numpy(output), dim=1)
+            predict_clas.extend(torch.argmax(predict, dim=1).numpy().tolist())
+        return [cls[predict_cla] for predict_cla in predict_clas]
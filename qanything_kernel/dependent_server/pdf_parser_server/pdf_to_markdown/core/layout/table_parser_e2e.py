@@ -1,5 +1,6 @@
 from .table_rec.pipeline import TableParser
 from .table_cls.infer_onnx import TableCls
+import time
 
 
 class TableRecognizer():
@@ -14,3 +15,15 @@ class TableRecognizer():
         table_html, table_markdown = self.table_parse.process(table_image.copy(), table_type, ocr_result=ocr_result,
                                                               convert2markdown=True)
         return table_html, table_markdown
+
+    def extract_tables(self, table_images, ocr_results, time_record=None):
+        """
+        一次识别一篇文档内的多个表格：分类模型和结构识别模型都按batch推理，
+        每个阶段的耗时累加到time_record中
+        """
+        time_record = {} if time_record is None else time_record
+        start = time.perf_counter()
+        table_types = self.table_cls.process_batch([table_image.copy() for table_image in table_images])
+        time_record['table_cls'] = time_record.get('table_cls', 0) + time.perf_counter() - start
+        return self.table_parse.process_batch([table_image.copy() for table_image in table_images], table_types,
+                                              ocr_results, convert2markdown=True, time_record=time_record)
@@ -10,7 +10,9 @@ from .table_recover import TableRecover
 from .utils_table_recover import match_ocr_cell, plot_html_table, plot_html_wireless_table
 from .utils_table_recover import merge_adjacent_polys, sorted_boxes
 from qanything_kernel.configs.model_config import PDF_MODEL_PATH
+from qanything_kernel.utils.custom_log import debug_logger
 import markdownify
+import time
 import urllib
 import urllib.request
 import urllib.parse
@@ -196,7 +198,7 @@ def request_service(input_dict, url):
 
 
 class TableParser(object):
-    def __init__(self, device=torch.device("cpu")):
+    def __init__(self, device=torch.device("cpu"), batch_size=4):
         # self.wired_model_stage1 = torch.jit.load('layout/table_rec/checkpoint/wired_model.pt').to('cuda')
         self.device = device
         if self.device == torch.device("cuda"):
@@ -215,11 +217,45 @@ class TableParser(object):
         wireless_onnx2 = os.path.join(PDF_MODEL_PATH, 'checkpoints/table/wireless_processor.onnx')
         self.wireless_model_stage2 = _ort.InferenceSession(wireless_onnx2, sess_options, providers=[onnx_backend])
         self.table_recover = TableRecover()
+        # 一次前向最多拼接的表格数，wired输入为1024x1024，过大容易显存不足
+        self.batch_size = batch_size
+        # 导出时固定了batch维度的模型，第一次拼batch失败后记录下来，之后直接逐张推理
+        self.no_batch_models = set()
+
+    def _stage1_batch(self, model_name, run, inputs):
+        """把多张表格图片拼成一个batch做一次前向，返回每张图片对应的输出切片"""
+        outputs_lst = []
+        for start in range(0, len(inputs), self.batch_size):
+            batch_inputs = inputs[start:start + self.batch_size]
+            if len(batch_inputs) > 1 and model_name not in self.no_batch_models:
+                try:
+                    outputs = run(np.concatenate(batch_inputs, axis=0))
+                    outputs_lst.extend([[o[i:i + 1] for o in outputs] for i in range(len(batch_inputs))])
+                    continue
+                except Exception as e:
+                    debug_logger.warning(f"{model_name} does not support batch inference, fallback to single: {e}")
+                    self.no_batch_models.add(model_name)
+            outputs_lst.extend([list(run(inp)) for inp in batch_inputs])
+        return outputs_lst
 
     def wired_rec(self, image):
-        input, meta = pre_process(image, 1024, 1024)
-
-        hm, st, wh, ax, cr, reg = self.wired_model_stage1(torch.from_numpy(input).to(self.device))
+        return self.wired_rec_batch([image])[0]
+
+    def wired_rec_batch(self, images, time_record=None):
+        time_record = {} if time_record is None else time_record
+        start = time.perf_counter()
+        inputs, metas = zip(*[pre_process(image, 1024, 1024) for image in images])
+        with torch.no_grad():
+            outputs_lst = self._stage1_batch(
+                'wired_model_stage1', lambda x: self.wired_model_stage1(torch.from_numpy(x).to(self.device)),
+                list(inputs))
+        time_record['table_rec_stage1'] = time_record.get('table_rec_stage1', 0) + time.perf_counter() - start
+        start = time.perf_counter()
+        results = [self._wired_decode(meta, *outputs) for meta, outputs in zip(metas, outputs_lst)]
+        time_record['table_rec_stage2'] = time_record.get('table_rec_stage2', 0) + time.perf_counter() - start
+        return results
+
+    def _wired_decode(self, meta, hm, st, wh, ax, cr, reg):
         hm = hm.sigmoid_().detach().to(self.device)
         st, wh, ax, cr, reg = st.detach().to(self.device), wh.detach().to(self.device), ax.detach().to(
             self.device), cr.detach().to(self.device), reg.detach().to(self.device)
@@ -255,9 +291,21 @@ class TableParser(object):
         return polygons, table_res
 
     def wireless_rec(self, image):
-        input, meta = pre_process(image, 768, 768, upper_left=True)
-
-        hm, st, wh, ax, cr, reg = self.wireless_model_stage1.run(None, {'image': input})
+        return self.wireless_rec_batch([image])[0]
+
+    def wireless_rec_batch(self, images, time_record=None):
+        time_record = {} if time_record is None else time_record
+        start = time.perf_counter()
+        inputs, metas = zip(*[pre_process(image, 768, 768, upper_left=True) for image in images])
+        outputs_lst = self._stage1_batch(
+            'wireless_model_stage1', lambda x: self.wireless_model_stage1.run(None, {'image': x}), list(inputs))
+        time_record['table_rec_stage1'] = time_record.get('table_rec_stage1', 0) + time.perf_counter() - start
+        start = time.perf_counter()
+        results = [self._wireless_decode(meta, *outputs) for meta, outputs in zip(metas, outputs_lst)]
+        time_record['table_rec_stage2'] = time_record.get('table_rec_stage2', 0) + time.perf_counter() - start
+        return results
+
+    def _wireless_decode(self, meta, hm, st, wh, ax, cr, reg):
         hm = torch.from_numpy(hm).sigmoid_().to(self.device)
         st, wh, ax, cr, reg = torch.from_numpy(st).to(self.device), torch.from_numpy(wh).to(
             self.device), torch.from_numpy(ax).to(self.device), torch.from_numpy(cr).to(self.device), torch.from_numpy(
@@ -292,25 +340,49 @@ class TableParser(object):
         return polygons, sorted_polygons, slct_logi[0].cpu().numpy()
 
     def process(self, image, table_type, ocr_result, convert2markdown=True):
-        table_markdown = ''
-        if table_type == 'wired':
-            polygons, table_res = self.wired_rec(image)
-            cell_box_map, head_box_map, tail_box_map = match_ocr_cell(polygons, ocr_result)
-            table_str = plot_html_table(table_res, cell_box_map, head_box_map, tail_box_map)
-            if convert2markdown:
-                table_markdown = html2markdown(table_str)
-            return table_str, table_markdown
-        else:
-            polygons, sorted_polygons, slct_logi = self.wireless_rec(image)
-            slct_logi = sort_logi_by_polygons(
-                sorted_polygons, polygons, slct_logi
-            )
-            sorted_logi_points, sorted_polygons = sort_logi(sorted_polygons, slct_logi)
-            cell_box_map, _, _ = match_ocr_cell(sorted_polygons, ocr_result)
-            table_str = plot_html_wireless_table(sorted_logi_points, cell_box_map)
-            if convert2markdown:
-                table_markdown = html2markdown(table_str)
-            return table_str, table_markdown
+        result = self.process_batch([image], [table_type], [ocr_result], convert2markdown)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def process_batch(self, images, table_types, ocr_results, convert2markdown=True, time_record=None):
+        """
+        按表格类型分组后批量识别表格结构，返回与images一一对应的(table_str, table_markdown)，
+        单个表格后处理失败时对应位置为异常对象，不影响同一批的其他表格
+        """
+        time_record = {} if time_record is None else time_record
+        results = [None] * len(images)
+        wired_idxs = [i for i, table_type in enumerate(table_types) if table_type == 'wired']
+        wireless_idxs = [i for i, table_type in enumerate(table_types) if table_type != 'wired']
+        wired_res = self.wired_rec_batch([images[i] for i in wired_idxs], time_record) if wired_idxs else []
+        wireless_res = self.wireless_rec_batch(
+            [images[i] for i in wireless_idxs], time_record) if wireless_idxs else []
+
+        start = time.perf_counter()
+        for idx, rec_res in zip(wired_idxs, wired_res):
+            try:
+                polygons, table_res = rec_res
+                cell_box_map, head_box_map, tail_box_map = match_ocr_cell(polygons, ocr_results[idx])
+                table_str = plot_html_table(table_res, cell_box_map, head_box_map, tail_box_map)
+                table_markdown = html2markdown(table_str) if convert2markdown else ''
+                results[idx] = (table_str, table_markdown)
+            except Exception as e:
+                results[idx] = e
+        for idx, rec_res in zip(wireless_idxs, wireless_res):
+            try:
+                polygons, sorted_polygons, slct_logi = rec_res
+                slct_logi = sort_logi_by_polygons(
+                    sorted_polygons, polygons, slct_logi
+                )
+                sorted_logi_points, sorted_polygons = sort_logi(sorted_polygons, slct_logi)
+                cell_box_map, _, _ = match_ocr_cell(sorted_polygons, ocr_results[idx])
+                table_str = plot_html_wireless_table(sorted_logi_points, cell_box_map)
+                table_markdown = html2markdown(table_str) if convert2markdown else ''
+                results[idx] = (table_str, table_markdown)
+            except Exception as e:
+                results[idx] = e
+        time_record['table_match_ocr'] = time_record.get('table_match_ocr', 0) + time.perf_counter() - start
+        return results
 
 
 def html2markdown(html_text):
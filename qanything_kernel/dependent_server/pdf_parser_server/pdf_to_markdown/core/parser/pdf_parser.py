@@ -46,6 +46,7 @@ class HuParser:
         self.updown_cnt_mdl.load_model(os.path.join(
             model_dir, "updown_concat_xgb.model"))
         self.page_from = 0
+        self.table_time_record = {}
 
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // len(c["text"])
@@ -136,16 +137,10 @@ class HuParser:
     def sort_X_by_page(arr, threashold):
         # sort using y1 first and then x1
         arr = sorted(arr, key=lambda r: (r["page_number"], r["x0"], r["top"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
-                        and arr[j + 1]["top"] < arr[j]["top"] \
-                        and arr[j + 1]["page_number"] == arr[j]["page_number"]:
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        # restore the order using th
+        return Recognizer.restore_order(
+            arr, lambda a, b: abs(b["x0"] - a["x0"]) < threashold and b["top"] < a["top"]
+                              and b["page_number"] == a["page_number"])
 
     def _has_color(self, o):
         if o.get("ncs", "") == "DeviceGray":
@@ -295,58 +290,30 @@ class HuParser:
             return tt and any([tt.find(t.strip()) == 0 for t in txts])
 
         # horizontally merge adjacent box with the same layout
-        i = 0
-        while i < len(bxs) - 1:
-            b = bxs[i]
-            b_ = bxs[i + 1]
+        # 顺序扫描一遍，和上一个保留的box合并，避免在列表中间pop导致的O(n^2)
+        merged = []
+        for b_ in bxs:
+            if not merged:
+                merged.append(b_)
+                continue
+            b = merged[-1]
             if b.get("layoutno", "0") != b_.get("layoutno", "1") or b.get("layout_type", "") in ["table", "figure",
                                                                                                  "equation"]:
-                i += 1
+                merged.append(b_)
                 continue
-            if abs(self._y_dis(b, b_)
-                   ) < self.mean_height[bxs[i]["page_number"] - 1] / 3:
-                # merge
-                if b_["x0"] > b["x0"]:
-                    bxs[i]["x1"] = b_["x1"]
-                    bxs[i]["top"] = (b["top"] + b_["top"]) / 2
-                    bxs[i]["bottom"] = (b["bottom"] + b_["bottom"]) / 2
-                    bxs[i]["text"] += b_["text"]
-                    bxs.pop(i + 1)
-                else:
-                    bxs[i + 1] = b
-                    bxs[i] = b_
-                    b = bxs[i]
-                    b_ = bxs[i + 1]
-                    bxs[i]["x1"] = b_["x1"]
-                    bxs[i]["top"] = (b["top"] + b_["top"]) / 2
-                    bxs[i]["bottom"] = (b["bottom"] + b_["bottom"]) / 2
-                    bxs[i]["text"] += b_["text"]
-                    bxs.pop(i + 1)
-                continue
-            i += 1
-            continue
-
-            dis_thr = 1
-            dis = b["x1"] - b_["x0"]
-            if b.get("layout_type", "") != "text" or b_.get(
-                    "layout_type", "") != "text":
-                if end_with(b, "，") or start_with(b_, "（，"):
-                    dis_thr = -8
-                else:
-                    i += 1
-                    continue
-
-            if abs(self._y_dis(b, b_)) < self.mean_height[bxs[i]["page_number"] - 1] / 5 \
-                    and dis >= dis_thr and b["x1"] < b_["x1"]:
-                # merge
-                bxs[i]["x1"] = b_["x1"]
-                bxs[i]["top"] = (b["top"] + b_["top"]) / 2
-                bxs[i]["bottom"] = (b["bottom"] + b_["bottom"]) / 2
-                bxs[i]["text"] += b_["text"]
-                bxs.pop(i + 1)
+            if abs(self._y_dis(b, b_)) >= self.mean_height[b["page_number"] - 1] / 3:
+                merged.append(b_)
                 continue
-            i += 1
-        self.boxes = bxs
+            # merge
+            if b_["x0"] <= b["x0"]:
+                # 右边的box排在了前面，交换后再合并
+                b, b_ = b_, b
+                merged[-1] = b
+            b["x1"] = b_["x1"]
+            b["top"] = (b["top"] + b_["top"]) / 2
+            b["bottom"] = (b["bottom"] + b_["bottom"]) / 2
+            b["text"] += b_["text"]
+        self.boxes = merged
 
     def _naive_vertical_merge(self):
         bxs = Recognizer.sort_Y_firstly(
@@ -746,8 +713,8 @@ class HuParser:
                     caption,
                     k))
             positions.append(poss)
-        merge_header = False
-        table_header = ''
+        # 先裁剪出整篇文档的所有表格，再一起批量做表格分类和结构识别
+        table_items = []
         for k, bxs in tables.items():
             if not bxs:
                 continue
@@ -756,16 +723,19 @@ class HuParser:
             poss = []
             img = cropout(bxs, "table", poss)
             pn = list(set([b["page_number"] - 1 for b in bxs]))[0]
+            table_items.append((k, bxs, img, poss, pn))
+        self.table_time_record = {}
+        res_dicts = self.tbl_det.construct_tables(
+            [(bxs, img, poss[0][1:], self.page_cum_height[pn]) for k, bxs, img, poss, pn in table_items],
+            html=return_html, is_english=self.is_english, time_record=self.table_time_record)
+        debug_logger.info(f"table recognition: {len(table_items)} tables, time record: {self.table_time_record}")
+
+        merge_header = False
+        table_header = ''
+        for (k, bxs, img, poss, pn), res_dict in zip(table_items, res_dicts):
             try:
                 if merge_header:
-                    res_dict = self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn],
-                                                            html=return_html, is_english=self.is_english)
                     res_dict['table_markdown'] = self.merge_header_markdown(table_header, res_dict['table_markdown'])
-                    res.append((res_dict, k))
-                else:
-                    res_dict = self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn],
-                                                            html=return_html, is_english=self.is_english)
-                    res.append((res_dict, k))
                 if k in table_merge_header.keys():  #下一个表格需要添加当前表头
                     merge_header = True
                     table_header = self.get_markdown_header(res_dict['table_markdown'])
@@ -774,11 +744,7 @@ class HuParser:
                     table_header = ''
             except Exception as e:
                 print(e.args)
-                res.append((
-                    # img, self.tbl_det.construct_table(bxs, img, html=return_html, is_english=self.is_english)))
-                    self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn], html=return_html,
-                                                 is_english=self.is_english),
-                    k))
+            res.append((res_dict, k))
             # img.save('{}.jpg'.format(k))
             positions.append(poss)
 
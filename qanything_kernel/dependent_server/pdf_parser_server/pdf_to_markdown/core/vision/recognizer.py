@@ -1,5 +1,4 @@
 import os
-from copy import deepcopy
 import onnxruntime as ort
 import torch
 from qanything_kernel.dependent_server.pdf_parser_server.pdf_to_markdown.core.vision.operators import *
@@ -37,74 +36,73 @@ class Recognizer(object):
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
 
+    @staticmethod
+    def restore_order(arr, need_swap):
+        """
+        与下面的相邻冒泡修正逐项等价（结果完全一致）：
+            for i in range(len(arr) - 1):
+                for j in range(i, -1, -1):
+                    if need_swap(arr[j], arr[j + 1]):
+                        arr[j], arr[j + 1] = arr[j + 1], arr[j]
+        原实现每一轮都要从i扫到0，总是O(n^2)的。一轮扫描中没有被改动过、上一轮也不需要交换的相邻对，
+        这一轮同样不会交换，所以只需记录上一轮发生交换的位置附近的相邻对，跳过其余位置，
+        总耗时为O(n + 交换次数)：行内乱序不多的页面上近似线性，但交换次数最多为n^2/2（例如阈值内大量box完全逆序），
+        最坏情况仍是O(n^2)，只是不再比原实现慢。need_swap需满足交换后的相邻对不再需要交换。
+        """
+        candidates = []  # 上一轮可能需要交换的相邻对下标，非递增
+        for i in range(len(arr) - 1):
+            next_candidates = []
+            j = i
+            k = 0
+            while j >= 0:
+                if need_swap(arr[j], arr[j + 1]):
+                    arr[j], arr[j + 1] = arr[j + 1], arr[j]
+                    # arr[j + 1]变了，相邻对j + 1要到下一轮才会再被检查
+                    next_candidates.append(j + 1)
+                    next_candidates.append(j)
+                    j -= 1
+                    continue
+                while k < len(candidates) and candidates[k] >= j:
+                    k += 1
+                if k == len(candidates):
+                    break
+                j = candidates[k]
+            candidates = next_candidates
+        return arr
+
     @staticmethod
     def sort_Y_firstly(arr, threashold):
         # sort using y1 first and then x1
         arr = sorted(arr, key=lambda r: (r["top"], r["x0"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["top"] - arr[j]["top"]) < threashold \
-                        and arr[j + 1]["x0"] < arr[j]["x0"]:
-                    tmp = deepcopy(arr[j])
-                    arr[j] = deepcopy(arr[j + 1])
-                    arr[j + 1] = deepcopy(tmp)
-        return arr
+        # restore the order using th
+        return Recognizer.restore_order(
+            arr, lambda a, b: abs(b["top"] - a["top"]) < threashold and b["x0"] < a["x0"])
 
     @staticmethod
-    def sort_X_firstly(arr, threashold, copy=True):
+    def sort_X_firstly(arr, threashold):
         # sort using y1 first and then x1
         arr = sorted(arr, key=lambda r: (r["x0"], r["top"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
-                        and arr[j + 1]["top"] < arr[j]["top"]:
-                    tmp = deepcopy(arr[j]) if copy else arr[j]
-                    arr[j] = deepcopy(arr[j + 1]) if copy else arr[j + 1]
-                    arr[j + 1] = deepcopy(tmp) if copy else tmp
-        return arr
+        # restore the order using th
+        return Recognizer.restore_order(
+            arr, lambda a, b: abs(b["x0"] - a["x0"]) < threashold and b["top"] < a["top"])
 
     @staticmethod
     def sort_C_firstly(arr, thr=0):
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["x0"], r["top"]))
         arr = Recognizer.sort_X_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if "C" not in arr[j] or "C" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["C"] < arr[j]["C"] \
-                        or (
-                        arr[j + 1]["C"] == arr[j]["C"]
-                        and arr[j + 1]["top"] < arr[j]["top"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
-
-        return sorted(arr, key=lambda r: (r.get("C", r["x0"]), r["top"]))
+        return Recognizer.restore_order(
+            arr, lambda a, b: "C" in a and "C" in b and (
+                    b["C"] < a["C"] or (b["C"] == a["C"] and b["top"] < a["top"])))
 
     @staticmethod
     def sort_R_firstly(arr, thr=0):
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["top"], r["x0"]))
         arr = Recognizer.sort_Y_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                if "R" not in arr[j] or "R" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["R"] < arr[j]["R"] \
-                        or (
-                        arr[j + 1]["R"] == arr[j]["R"]
-                        and arr[j + 1]["x0"] < arr[j]["x0"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        return Recognizer.restore_order(
+            arr, lambda a, b: "R" in a and "R" in b and (
+                    b["R"] < a["R"] or (b["R"] == a["R"] and b["x0"] < a["x0"])))
 
     @staticmethod
     def overlapped_area(a, b, ratio=True):
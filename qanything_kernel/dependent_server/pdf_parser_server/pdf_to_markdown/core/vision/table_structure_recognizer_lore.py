@@ -21,10 +21,8 @@ class TableStructureRecognizer_LORE():
             return True
         return False
 
-    def construct_table(self, boxes, image, table_box, height, is_english=False, html=False):
-        """
-        接收一个表格的ocr结果，同时接收一个表格的图片，最终需要返回该表格的html结果
-        """
+    @staticmethod
+    def _prepare_table(boxes, image, table_box, height):
         ocr_result = []
         table_caption = ''
         zoomin = 3
@@ -43,15 +41,54 @@ class TableStructureRecognizer_LORE():
                 new_item.append(item['text'])
                 new_item.append(1.0)
                 ocr_result.append(new_item)
+        return table_image, ocr_result, table_caption
+
+    @staticmethod
+    def _fallback_table(ocr_result, error_info):
+        insert_logger.warning(f"construct_table error: {error_info}")
+        ocr_str = '\n'.join([item[1] for item in ocr_result])
+        insert_logger.warning(f"ocr_str: {ocr_str[:100]}")
+        return ocr_str, ocr_str
+
+    def construct_table(self, boxes, image, table_box, height, is_english=False, html=False):
+        """
+        接收一个表格的ocr结果，同时接收一个表格的图片，最终需要返回该表格的html结果
+        """
+        table_image, ocr_result, table_caption = self._prepare_table(boxes, image, table_box, height)
         try:
             table_html, table_markdown = self.table_rec.extract_table(table_image, ocr_result)
         except Exception as e:
-            insert_logger.warning(f"construct_table error: {traceback.format_exc()}")
-            ocr_str = '\n'.join([item[1] for item in ocr_result])
-            insert_logger.warning(f"ocr_str: {ocr_str[:100]}")
-            table_html, table_markdown = ocr_str, ocr_str
+            table_html, table_markdown = self._fallback_table(ocr_result, traceback.format_exc())
         return {
             'table_html': table_html,
             'table_caption': table_caption,
             'table_markdown': table_markdown
         }
+
+    def construct_tables(self, tables, is_english=False, html=False, time_record=None):
+        """
+        批量版本的construct_table，tables为[(boxes, image, table_box, height), ...]，
+        一篇文档的所有表格一起送入分类和结构识别模型，返回顺序与tables一致
+        """
+        prepared = [self._prepare_table(*table) for table in tables]
+        if not prepared:
+            return []
+        try:
+            rec_results = self.table_rec.extract_tables([p[0] for p in prepared], [p[1] for p in prepared],
+                                                        time_record=time_record)
+        except Exception:
+            insert_logger.warning(f"construct_tables batch error, fallback to single: {traceback.format_exc()}")
+            return [self.construct_table(*table, is_english=is_english, html=html) for table in tables]
+        res_dicts = []
+        for (table_image, ocr_result, table_caption), rec_res in zip(prepared, rec_results):
+            if isinstance(rec_res, Exception):
+                error_info = ''.join(traceback.format_exception(type(rec_res), rec_res, rec_res.__traceback__))
+                table_html, table_markdown = self._fallback_table(ocr_result, error_info)
+            else:
+                table_html, table_markdown = rec_res
+            res_dicts.append({
+                'table_html': table_html,
+                'table_caption': table_caption,
+                'table_markdown': table_markdown
+            })
+        return res_dicts
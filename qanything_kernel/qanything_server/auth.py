@@ -1,10 +1,13 @@
 import functools
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import time
 import os
 from sanic import response, request
 
 from qanything_kernel.core.local_doc_qa import LocalDocQA
+from qanything_kernel.connector.database.mysql.mysql_client import PERMISSION_LEVELS
 from qanything_kernel.utils.custom_log import debug_logger
 from qanything_kernel.utils.general_utils import safe_get
 
@@ -12,12 +15,99 @@ from qanything_kernel.utils.general_utils import safe_get
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")  # 生产环境中应使用环境变量
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # 令牌有效期
+JWT_CACHE_SIZE = 10000  # 缓存解码后的令牌数量
+ACL_CACHE_SIZE = 10000  # 缓存有效权限的用户数量
+ACL_VERSION_CHECK_INTERVAL = 1  # 权限版本号的检查间隔（秒），其他进程修改权限后最多延迟这么久生效
 
-def get_user_role(user_id, req):
+
+class TokenCache:
+    """缓存令牌解码结果，同一令牌只验证一次签名；过期时间仍由调用方每次检查"""
+
+    def __init__(self, max_size=JWT_CACHE_SIZE):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+    def decode(self, token):
+        if token in self.cache:
+            self.cache.move_to_end(token)
+            return self.cache[token]
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        self.cache[token] = payload
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        return payload
+
+
+class PermissionResolver:
+    """
+    缓存每个用户对所有知识库的有效权限，一次查询得到用户可访问的知识库集合。
+    缓存项记录计算时的AclVersion，授权、撤销、用户组/部门变更等写入会递增版本号，版本变化后缓存整体失效。
+    其他进程的写入最多延迟version_check_interval秒才能发现，所以缓存只用于放行，拒绝前总是从数据库重新读取该用户的权限
+    """
+
+    def __init__(self, max_size=ACL_CACHE_SIZE, version_check_interval=ACL_VERSION_CHECK_INTERVAL):
+        self.max_size = max_size
+        self.version_check_interval = version_check_interval
+        self.cache = OrderedDict()
+        self.version = None
+        self.version_check_time = 0
+
+    async def current_version(self, mysql_client):
+        now = time.time()
+        # 本进程刚修改过权限时立即检查，其他进程的修改按间隔检查
+        if (now - self.version_check_time > self.version_check_interval
+                or mysql_client.acl_changed_time >= self.version_check_time):
+            version = await mysql_client.get_acl_version()
+            if version != self.version:
+                self.cache.clear()
+                self.version = version
+            self.version_check_time = now
+        return self.version
+
+    async def get(self, mysql_client, user_id, refresh=False):
+        version = await self.current_version(mysql_client)
+        if not refresh and user_id in self.cache:
+            self.cache.move_to_end(user_id)
+            return self.cache[user_id]
+        permissions = await mysql_client.get_effective_kb_permissions(user_id)
+        # 查询期间版本号发生变化时不写入缓存
+        if self.version == version:
+            self.cache[user_id] = permissions
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return permissions
+
+    async def denied_kb_ids(self, mysql_client, user_id, kb_ids, required_permission):
+        """返回kb_ids中用户没有required_permission权限的知识库"""
+        cached = user_id in self.cache
+        permissions = await self.get(mysql_client, user_id)
+        denied_kb_ids = await self.denied_(mysql_client, user_id, permissions, kb_ids, required_permission)
+        if denied_kb_ids and cached and (permissions is None or permissions['role'] != 'superadmin'):
+            # 例如其他进程刚创建的知识库：本进程的缓存还没有失效，重新读取后再决定是否拒绝
+            permissions = await self.get(mysql_client, user_id, refresh=True)
+            denied_kb_ids = await self.denied_(mysql_client, user_id, permissions, kb_ids, required_permission)
+        return denied_kb_ids
+
+    @staticmethod
+    async def denied_(mysql_client, user_id, permissions, kb_ids, required_permission):
+        if permissions is None:
+            debug_logger.error(f"用户 {user_id} 不存在或未激活")
+            return list(kb_ids)
+        if permissions['role'] == 'superadmin':
+            # 超级管理员拥有所有存在的知识库的权限
+            return await mysql_client.check_kb_exist(user_id, list(kb_ids))
+        required_level = PERMISSION_LEVELS.get(required_permission, 0)
+        return [kb_id for kb_id in kb_ids if permissions['kb_permissions'].get(kb_id, -1) < required_level]
+
+
+token_cache = TokenCache()
+permission_resolver = PermissionResolver()
+
+async def get_user_role(user_id, req):
     """获取用户角色"""
     local_doc_qa = req.app.ctx.local_doc_qa
     query = "SELECT role FROM User WHERE user_id = %s AND status = 'active'"
-    result = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    result = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     if result:
         return result[0][0]
     return None
@@ -62,7 +152,7 @@ def auth_required(permission_level="read", check_kb_access=False):
             # 验证令牌
             try:
                 # 解码JWT令牌
-                payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+                payload = token_cache.decode(token)
                 
                 # 验证令牌中的用户ID与请求中的用户ID是否匹配
                 token_user_id = payload.get("user_id")
@@ -77,7 +167,7 @@ def auth_required(permission_level="read", check_kb_access=False):
                     return response.json({"code": 401, "msg": "令牌已过期"})
                 
                 # 检查用户角色和权限
-                user_role = payload.get("role") or get_user_role(user_id, req)
+                user_role = payload.get("role") or await get_user_role(user_id, req)
                 debug_logger.info(f"用户角色验证 - 用户: {user_id}, 角色: {user_role}, 所需权限: {permission_level}")
                 
                 # 根据角色和请求的权限级别判断是否有权限
@@ -88,20 +178,20 @@ def auth_required(permission_level="read", check_kb_access=False):
                 # 如果需要检查知识库访问权限
                 if check_kb_access:
                     local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+                    # 单个知识库和批量操作的多个知识库一起检查，权限由缓存的有效权限集合判断
+                    check_kb_ids = []
                     kb_id = safe_get(req, 'kb_id')
                     if kb_id:
-                        # 检查用户是否有权限访问该知识库
-                        if not local_doc_qa.milvus_summary.check_kb_access(user_id, kb_id, permission_level):
-                            debug_logger.error(f"知识库访问权限不足 - 用户: {user_id}, 知识库: {kb_id}, 所需权限: {permission_level}")
-                            return response.json({"code": 403, "msg": f"没有权限{permission_level}访问知识库 {kb_id}"})
-                    
-                    # 如果是批量操作多个知识库
+                        check_kb_ids.append(kb_id)
                     kb_ids = safe_get(req, 'kb_ids')
                     if kb_ids and isinstance(kb_ids, list):
-                        for kb_id in kb_ids:
-                            if not local_doc_qa.milvus_summary.check_kb_access(user_id, kb_id, permission_level):
-                                debug_logger.error(f"知识库访问权限不足 - 用户: {user_id}, 知识库: {kb_id}, 所需权限: {permission_level}")
-                                return response.json({"code": 403, "msg": f"没有权限{permission_level}访问知识库 {kb_id}"})
+                        check_kb_ids.extend(kb_ids)
+                    if check_kb_ids:
+                        denied_kb_ids = await permission_resolver.denied_kb_ids(
+                            local_doc_qa.milvus_summary_async, user_id, check_kb_ids, permission_level)
+                        if denied_kb_ids:
+                            debug_logger.error(f"知识库访问权限不足 - 用户: {user_id}, 知识库: {denied_kb_ids}, 所需权限: {permission_level}")
+                            return response.json({"code": 403, "msg": f"没有权限{permission_level}访问知识库 {denied_kb_ids[0]}"})
                 
                 # 将用户信息添加到请求上下文中，方便后续使用
                 req.ctx.user = {
@@ -134,7 +224,7 @@ async def login(req: request):
     
     # 查询用户信息
     query = "SELECT user_id, password, role, user_name FROM User WHERE user_name = %s AND status = 'active'"
-    user_info = local_doc_qa.milvus_summary.execute_query_(query, (username,), fetch=True)
+    user_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (username,), fetch=True)
     
     if not user_info:
         return response.json({"code": 401, "msg": "用户不存在或已被禁用"})
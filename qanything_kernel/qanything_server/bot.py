@@ -22,15 +22,15 @@ async def get_bot_info(req: request):
     # user_id = user_id + '__' + user_info
     bot_id = safe_get(req, 'bot_id')
     if bot_id:
-        if not local_doc_qa.milvus_summary.check_bot_is_exist(bot_id):
+        if not await local_doc_qa.milvus_summary_async.check_bot_is_exist(bot_id):
             return sanic_json({"code": 2003, "msg": "fail, Bot {} not found".format(bot_id)})
     debug_logger.info("get_bot_info %s", user_id)
-    bot_infos = local_doc_qa.milvus_summary.get_bot(user_id, bot_id)
+    bot_infos = await local_doc_qa.milvus_summary_async.get_bot(user_id, bot_id)
     data = []
     for bot_info in bot_infos:
         if bot_info[6] != "":
             kb_ids = bot_info[6].split(',')
-            kb_infos = local_doc_qa.milvus_summary.get_knowledge_base_name(kb_ids)
+            kb_infos = await local_doc_qa.milvus_summary_async.get_knowledge_base_name(kb_ids)
             kb_names = []
             for kb_id in kb_ids:
                 for kb_info in kb_infos:
@@ -65,13 +65,13 @@ async def new_bot(req: request):
     kb_ids = safe_get(req, "kb_ids", [])
     kb_ids_str = ",".join(kb_ids)
 
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, kb_ids)
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, kb_ids)
     if not_exist_kb_ids:
         msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
         return sanic_json({"code": 2001, "msg": msg, "data": [{}]})
     debug_logger.info("new_bot %s", user_id)
     bot_id = 'BOT' + uuid.uuid4().hex
-    local_doc_qa.milvus_summary.new_qanything_bot(bot_id, user_id, bot_name, desc, head_image, prompt_setting,
+    await local_doc_qa.milvus_summary_async.new_qanything_bot(bot_id, user_id, bot_name, desc, head_image, prompt_setting,
                                                   welcome_message, kb_ids_str)
     create_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     return sanic_json({"code": 200, "msg": "success create qanything bot {}".format(bot_id),
@@ -89,9 +89,9 @@ async def delete_bot(req: request):
     # user_id = user_id + '__' + user_info
     debug_logger.info("delete_bot %s", user_id)
     bot_id = safe_get(req, 'bot_id')
-    if not local_doc_qa.milvus_summary.check_bot_is_exist(bot_id):
+    if not await local_doc_qa.milvus_summary_async.check_bot_is_exist(bot_id):
         return sanic_json({"code": 2003, "msg": "fail, Bot {} not found".format(bot_id)})
-    local_doc_qa.milvus_summary.delete_bot(user_id, bot_id)
+    await local_doc_qa.milvus_summary_async.delete_bot(user_id, bot_id)
     return sanic_json({"code": 200, "msg": "Bot {} delete success".format(bot_id)})
 
 
@@ -106,9 +106,9 @@ async def update_bot(req: request):
     # user_id = user_id + '__' + user_info
     debug_logger.info("update_bot %s", user_id)
     bot_id = safe_get(req, 'bot_id')
-    if not local_doc_qa.milvus_summary.check_bot_is_exist(bot_id):
+    if not await local_doc_qa.milvus_summary_async.check_bot_is_exist(bot_id):
         return sanic_json({"code": 2003, "msg": "fail, Bot {} not found".format(bot_id)})
-    bot_info = local_doc_qa.milvus_summary.get_bot(user_id, bot_id)[0]
+    bot_info = (await local_doc_qa.milvus_summary_async.get_bot(user_id, bot_id))[0]
     bot_name = safe_get(req, "bot_name", bot_info[1])
     description = safe_get(req, "description", bot_info[2])
     head_image = safe_get(req, "head_image", bot_info[3])
@@ -116,7 +116,7 @@ async def update_bot(req: request):
     welcome_message = safe_get(req, "welcome_message", bot_info[5])
     kb_ids = safe_get(req, "kb_ids")
     if kb_ids is not None:
-        not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, kb_ids)
+        not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, kb_ids)
         if not_exist_kb_ids:
             msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
             return sanic_json({"code": 2001, "msg": msg, "data": [{}]})
@@ -175,6 +175,6 @@ async def update_bot(req: request):
     #  update_time     TIMESTAMP DEFAULT CURRENT_TIMESTAMP 根据这个mysql的格式获取现在的时间
     update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     debug_logger.info(f"update_time: {update_time}")
-    local_doc_qa.milvus_summary.update_bot(user_id, bot_id, bot_name, description, head_image, prompt_setting,
+    await local_doc_qa.milvus_summary_async.update_bot(user_id, bot_id, bot_name, description, head_image, prompt_setting,
                                            welcome_message, kb_ids_str, update_time, llm_setting)
     return sanic_json({"code": 200, "msg": "Bot {} update success".format(bot_id)})
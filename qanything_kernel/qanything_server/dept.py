@@ -22,7 +22,7 @@ async def create_department(req: request):
     # 如果指定了父部门，检查父部门是否存在
     if parent_dept_id:
         query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-        if not local_doc_qa.milvus_summary.execute_query_(query, (parent_dept_id,), fetch=True):
+        if not await local_doc_qa.milvus_summary_async.execute_query_(query, (parent_dept_id,), fetch=True):
             return sanic_json({"code": 404, "msg": "父部门不存在"})
     
     # 生成唯一的部门ID
@@ -31,7 +31,7 @@ async def create_department(req: request):
     # 创建部门
     query = "INSERT INTO Department (dept_id, dept_name, parent_dept_id) VALUES (%s, %s, %s)"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (dept_id, dept_name, parent_dept_id), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id, dept_name, parent_dept_id), commit=True)
         return sanic_json({
             "code": 200, 
             "msg": "部门创建成功", 
@@ -64,27 +64,16 @@ async def list_departments(req: request):
         GROUP BY d.dept_id, d.dept_name, d.parent_dept_id, d.creation_time, p.dept_name
         ORDER BY d.creation_time
     """
-    depts = local_doc_qa.milvus_summary.execute_query_(query, (), fetch=True)
+    depts = await local_doc_qa.milvus_summary_async.execute_query_(query, (), fetch=True)
     
+    # 一次查询所有部门的知识库权限
+    kb_access_by_subject = await local_doc_qa.milvus_summary_async.get_kb_access_by_subject_ids(
+        'department', [dept[0] for dept in depts or []])
+
     result = []
-    for dept in depts:
-        dept_id = dept[0]
-        
-        # 查询部门的知识库权限
-        kb_access_query = """
-            SELECT kb.kb_id, kb.kb_name, kba.permission_type, 
-                   kba.granted_by, u.user_name as granted_by_name,
-                   kba.granted_at
-            FROM KnowledgeBaseAccess kba
-            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
-            LEFT JOIN User u ON kba.granted_by = u.user_id
-            WHERE kba.subject_type = 'department'
-            AND kba.subject_id = %s
-            AND kb.deleted = 0
-            ORDER BY kba.granted_at DESC
-        """
-        kb_access = local_doc_qa.milvus_summary.execute_query_(kb_access_query, (dept_id,), fetch=True)
-        
+    for dept in depts or []:
+        kb_access = kb_access_by_subject.get(dept[0], [])
+
         result.append({
             "dept_id": dept[0],
             "dept_name": dept[1],
@@ -123,13 +112,13 @@ async def update_department(req: request):
     
     # 检查部门是否存在
     query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "部门不存在"})
     
     # 如果指定了父部门，检查父部门是否存在
     if parent_dept_id:
         query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-        if not local_doc_qa.milvus_summary.execute_query_(query, (parent_dept_id,), fetch=True):
+        if not await local_doc_qa.milvus_summary_async.execute_query_(query, (parent_dept_id,), fetch=True):
             return sanic_json({"code": 404, "msg": "父部门不存在"})
         
         # 检查是否形成循环依赖
@@ -156,7 +145,7 @@ async def update_department(req: request):
     params.append(dept_id)
     
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, tuple(params), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, tuple(params), commit=True)
         return sanic_json({"code": 200, "msg": "部门更新成功"})
     except Exception as e:
         debug_logger.error(f"更新部门失败: {str(e)}")
@@ -175,27 +164,27 @@ async def delete_department(req: request):
     
     # 检查部门是否存在
     query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "部门不存在"})
     
     # 检查是否有子部门
     query = "SELECT dept_id FROM Department WHERE parent_dept_id = %s"
-    if local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+    if await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
         return sanic_json({"code": 400, "msg": "该部门下有子部门，无法删除"})
     
     # 检查是否有用户属于该部门
     query = "SELECT user_id FROM User WHERE dept_id = %s"
-    if local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+    if await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
         return sanic_json({"code": 400, "msg": "该部门下有用户，无法删除"})
     
     # 删除部门
     query = "DELETE FROM Department WHERE dept_id = %s"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), commit=True)
         
         # 同时删除该部门的所有知识库权限
         query = "DELETE FROM KnowledgeBaseAccess WHERE subject_id = %s AND subject_type = 'department'"
-        local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), commit=True)
         
         return sanic_json({"code": 200, "msg": "部门删除成功"})
     except Exception as e:
@@ -219,7 +208,7 @@ async def add_users_to_dept(req: request):
     
     # 检查部门是否存在
     query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "部门不存在"})
     
     success_count = 0
@@ -229,7 +218,7 @@ async def add_users_to_dept(req: request):
         try:
             # 检查用户是否存在
             query = "SELECT user_id, dept_id FROM User WHERE user_id = %s AND status = 'active'"
-            user_info = local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True)
+            user_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True)
             
             if not user_info:
                 failed_list.append({
@@ -248,7 +237,7 @@ async def add_users_to_dept(req: request):
             
             # 更新用户的部门
             query = "UPDATE User SET dept_id = %s WHERE user_id = %s"
-            local_doc_qa.milvus_summary.execute_query_(query, (dept_id, target_user_id), commit=True)
+            await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id, target_user_id), commit=True)
             success_count += 1
             
         except Exception as e:
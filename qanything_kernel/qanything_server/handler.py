@@ -3,6 +3,7 @@ import shutil
 
 from qanything_kernel.core.local_file import LocalFile
 from qanything_kernel.core.local_doc_qa import LocalDocQA
+from qanything_kernel.core.retriever.vectorstore import flush_stats
 from qanything_kernel.utils.custom_log import debug_logger, qa_logger
 from qanything_kernel.configs.model_config import (BOT_DESC, BOT_IMAGE, BOT_PROMPT, BOT_WELCOME,
                                                    DEFAULT_PARENT_CHUNK_SIZE, MAX_CHARS, VECTOR_SEARCH_TOP_K,
@@ -70,7 +71,8 @@ def sync_function_with_args(arg1, arg2):
 @get_time_async
 async def health_check(req: request):
     # 实现一个服务健康检查的逻辑，正常就返回200，不正常就返回500
-    return sanic_json({"code": 200, "msg": "success"})
+    # milvus_flush为本进程各collection等待合并flush的行数和flush耗时
+    return sanic_json({"code": 200, "msg": "success", "milvus_flush": flush_stats()})
 
     
 @get_time_async
@@ -1,5 +1,8 @@
 import asyncio
 import base64
+import mimetypes
+import csv
+import io
 import json
 import os
 import re
@@ -13,29 +16,35 @@ from datetime import datetime
 from httpx._transports.default import ResponseStream
 from langchain.schema import Document
 from sanic import request, response
+from sanic.exceptions import HeaderNotFound, InvalidRangeType, RangeNotSatisfiable
+from sanic.handlers import ContentRangeHandler
 from sanic.response import ResponseStream
 from sanic.response import json as sanic_json
 from tqdm import tqdm
 
 from qanything_kernel.configs.model_config import DEFAULT_PARENT_CHUNK_SIZE, MAX_CHARS, UPLOAD_ROOT_PATH, \
-    IMAGES_ROOT_PATH, VECTOR_SEARCH_TOP_K, GATEWAY_IP
+    VECTOR_SEARCH_TOP_K, GATEWAY_IP, LIST_DOCS_MAX_PAGE_LIMIT, QALOG_EXPORT_BATCH_SIZE, \
+    FILE_DOWNLOAD_CHUNK_SIZE, FILE_BASE64_MAX_SIZE
+from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
 from qanything_kernel.core.local_doc_qa import LocalDocQA
 from qanything_kernel.core.local_file import LocalFile
-from qanything_kernel.qanything_server.handler import auth_required, run_in_background
-from qanything_kernel.utils.custom_log import debug_logger, qa_logger
+from qanything_kernel.qanything_server.handler import auth_required
+from qanything_kernel.qanything_server.auth import permission_resolver
+from qanything_kernel.utils.custom_log import debug_logger
 from qanything_kernel.utils.general_utils import get_time_async, safe_get, correct_kb_id, check_user_id_and_user_info, \
-    truncate_filename, read_files_with_extensions, fast_estimate_file_char_count, simplify_filename, \
+    truncate_filename, read_files_with_extensions, simplify_filename, \
     check_and_transform_excel, format_source_documents, format_time_record, replace_image_references, get_time_range, \
-    export_qalogs_to_excel, num_tokens_embed
+    num_tokens_embed, QaLogExcelWriter, qalog_export_row
+from qanything_kernel.utils.upload_utils import run_in_upload_pool, estimate_file_chars, MultipartStreamParser
 
 
-def _check_kb_exists(local_doc_qa, kb_id):
+async def _check_kb_exists(local_doc_qa, kb_id):
     """检查知识库是否存在"""
     query = "SELECT kb_id FROM KnowledgeBase WHERE kb_id = %s AND deleted = 0"
-    return local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    return await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
 
 
-def _check_subject_exists(local_doc_qa, subject_type, subject_id):
+async def _check_subject_exists(local_doc_qa, subject_type, subject_id):
     """根据主体类型检查主体是否存在"""
     if subject_type == 'user':
         query = "SELECT user_id FROM User WHERE user_id = %s AND status = 'active'"
@@ -46,21 +55,21 @@ def _check_subject_exists(local_doc_qa, subject_type, subject_id):
     else:
         return False
     
-    return local_doc_qa.milvus_summary.execute_query_(query, (subject_id,), fetch=True)
+    return await local_doc_qa.milvus_summary_async.execute_query_(query, (subject_id,), fetch=True)
 
 
-def _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id):
+async def _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id):
     """获取知识库访问权限记录"""
     query = """
         SELECT id, permission_type FROM KnowledgeBaseAccess 
         WHERE kb_id = %s AND subject_type = %s AND subject_id = %s
     """
-    return local_doc_qa.milvus_summary.execute_query_(
+    return await local_doc_qa.milvus_summary_async.execute_query_(
         query, (kb_id, subject_type, subject_id), fetch=True
     )
 
 
-def _get_subject_name(local_doc_qa, subject_type, subject_id):
+async def _get_subject_name(local_doc_qa, subject_type, subject_id):
     """获取主体名称"""
     if subject_type == 'user':
         query = "SELECT user_name FROM User WHERE user_id = %s"
@@ -71,10 +80,10 @@ def _get_subject_name(local_doc_qa, subject_type, subject_id):
     else:
         return "未知主体"
     
-    subject_info = local_doc_qa.milvus_summary.execute_query_(query, (subject_id,), fetch=True)
+    subject_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (subject_id,), fetch=True)
     return subject_info[0][0] if subject_info else f"未知{subject_type}"
 
-def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
+async def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
     """获取用户对知识库的权限"""
     # 如果用户是管理员或知识库所有者，直接授予所有权限
     if role == "superadmin" or role == "admin" or user_id == owner_id:
@@ -82,7 +91,7 @@ def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
     
     # 获取用户所在的所有用户组
     query = "SELECT group_id FROM GroupMember WHERE user_id = %s"
-    user_groups = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    user_groups = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     group_ids = [group[0] for group in user_groups] if user_groups else []
 
     # 权限级别映射，用于比较权限高低
@@ -96,7 +105,7 @@ def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
         SELECT permission_type FROM KnowledgeBaseAccess 
         WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
     """
-    user_access = local_doc_qa.milvus_summary.execute_query_(query, (kb_id, user_id), fetch=True)
+    user_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id, user_id), fetch=True)
     if user_access:
         user_level = level_map.get(user_access[0][0], 0)
         if user_level > highest_level:
@@ -110,7 +119,7 @@ def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
             SELECT permission_type FROM KnowledgeBaseAccess 
             WHERE kb_id = %s AND subject_type = 'department' AND subject_id = %s
         """
-        dept_access = local_doc_qa.milvus_summary.execute_query_(query, (kb_id, dept_id), fetch=True)
+        dept_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id, dept_id), fetch=True)
         if dept_access:
             dept_level = level_map.get(dept_access[0][0], 0)
             if dept_level > highest_level:
@@ -125,7 +134,7 @@ def _get_user_permission(local_doc_qa, kb_id, user_id, role, dept_id, owner_id):
             JOIN UserGroup g ON a.subject_id = g.group_id
             WHERE a.kb_id = %s AND a.subject_type = 'group' AND a.subject_id = %s
         """
-        group_access = local_doc_qa.milvus_summary.execute_query_(query, (kb_id, group_id), fetch=True)
+        group_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id, group_id), fetch=True)
         if group_access:
             group_level = level_map.get(group_access[0][0], 0)
             if group_level > highest_level:
@@ -161,15 +170,15 @@ async def grant_kb_access(req: request):
         return sanic_json({"code": 400, "msg": "权限级别必须是read、write或admin"})
 
     # 检查知识库是否存在
-    if not _check_kb_exists(local_doc_qa, kb_id):
+    if not await _check_kb_exists(local_doc_qa, kb_id):
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
     # 检查主体是否存在
-    if not _check_subject_exists(local_doc_qa, subject_type, subject_id):
+    if not await _check_subject_exists(local_doc_qa, subject_type, subject_id):
         return sanic_json({"code": 404, "msg": f"{subject_type}不存在或已被禁用"})
 
     # 检查是否已有权限记录
-    existing_access = _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
+    existing_access = await _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
 
     try:
         if existing_access:
@@ -184,7 +193,7 @@ async def grant_kb_access(req: request):
                 UPDATE KnowledgeBaseAccess SET permission_type = %s, granted_by = %s
                 WHERE id = %s
             """
-            local_doc_qa.milvus_summary.execute_query_(
+            await local_doc_qa.milvus_summary_async.execute_query_(
                 update_query, (access_level, user_id, access_id), commit=True
             )
             return sanic_json({"code": 200, "msg": f"权限级别已从{current_level}更新为{access_level}"})
@@ -195,7 +204,7 @@ async def grant_kb_access(req: request):
                 (kb_id, subject_type, subject_id, permission_type, granted_by)
                 VALUES (%s, %s, %s, %s, %s)
             """
-            local_doc_qa.milvus_summary.execute_query_(
+            await local_doc_qa.milvus_summary_async.execute_query_(
                 insert_query, (kb_id, subject_type, subject_id, access_level, user_id), commit=True
             )
             return sanic_json({"code": 200, "msg": "权限授予成功"})
@@ -222,11 +231,11 @@ async def revoke_kb_access(req: request):
         return sanic_json({"code": 400, "msg": "主体类型必须是user、department或group"})
     
     # 检查知识库是否存在
-    if not _check_kb_exists(local_doc_qa, kb_id):
+    if not await _check_kb_exists(local_doc_qa, kb_id):
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
     # 检查是否有权限记录
-    existing_access = _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
+    existing_access = await _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
 
     if not existing_access:
         return sanic_json({"code": 404, "msg": f"该{subject_type}没有此知识库的访问权限"})
@@ -237,7 +246,7 @@ async def revoke_kb_access(req: request):
             DELETE FROM KnowledgeBaseAccess 
             WHERE kb_id = %s AND subject_type = %s AND subject_id = %s
         """
-        local_doc_qa.milvus_summary.execute_query_(
+        await local_doc_qa.milvus_summary_async.execute_query_(
             delete_query, (kb_id, subject_type, subject_id), commit=True
         )
         return sanic_json({"code": 200, "msg": "权限撤销成功"})
@@ -264,7 +273,7 @@ async def get_kb_access_list(req: request):
     # 检查知识库是否存在
     query = "SELECT kb_id, kb_name, user_id FROM KnowledgeBase WHERE kb_id = %s AND deleted = 0"
     debug_logger.info(f"执行查询: {query} 参数: {kb_id}")
-    kb_info = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    kb_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     
     if not kb_info:
         debug_logger.warning(f"获取知识库访问权限列表失败 - 知识库 {kb_id} 不存在")
@@ -275,7 +284,7 @@ async def get_kb_access_list(req: request):
     debug_logger.info(f"知识库信息 - 名称: {kb_name}, 所有者ID: {owner_id}")
 
     # 获取所有者信息
-    owner_name = _get_subject_name(local_doc_qa, 'user', owner_id)
+    owner_name = await _get_subject_name(local_doc_qa, 'user', owner_id)
     debug_logger.info(f"知识库所有者: {owner_name} (ID: {owner_id})")
 
     # 获取所有权限记录
@@ -286,7 +295,7 @@ async def get_kb_access_list(req: request):
         ORDER BY subject_type, permission_type
     """
     debug_logger.info(f"查询知识库权限记录: {query} 参数: {kb_id}")
-    access_records = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    access_records = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     debug_logger.info(f"找到 {len(access_records) if access_records else 0} 条权限记录")
 
     # 处理权限记录
@@ -295,7 +304,7 @@ async def get_kb_access_list(req: request):
         access_id, subject_type, subject_id, access_level = record
         debug_logger.info(f"处理权限记录 - ID: {access_id}, 类型: {subject_type}, 主体ID: {subject_id}, 权限级别: {access_level}")
         
-        subject_name = _get_subject_name(local_doc_qa, subject_type, subject_id)
+        subject_name = await _get_subject_name(local_doc_qa, subject_type, subject_id)
         debug_logger.info(f"主体名称: {subject_name}")
 
         access_list.append({
@@ -336,7 +345,7 @@ async def check_kb_permission(req: request):
     
     # 检查知识库是否存在
     query = "SELECT kb_id, kb_name, user_id FROM KnowledgeBase WHERE kb_id = %s AND deleted = 0"
-    kb_info = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    kb_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     if not kb_info:
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
@@ -344,7 +353,7 @@ async def check_kb_permission(req: request):
     owner_id = kb_info[0][2]  # 使用user_id作为owner_id
 
     # 获取用户权限
-    has_permission, permission_level, permission_source = _get_user_permission(
+    has_permission, permission_level, permission_source = await _get_user_permission(
         local_doc_qa, kb_id, user_id, role, dept_id, owner_id
     )
 
@@ -374,7 +383,7 @@ async def batch_set_kb_access(req: request):
         return sanic_json({"code": 400, "msg": "知识库ID和权限列表不能为空"})
     
     # 检查知识库是否存在
-    if not _check_kb_exists(local_doc_qa, kb_id):
+    if not await _check_kb_exists(local_doc_qa, kb_id):
         return sanic_json({"code": 404, "msg": "知识库不存在"})
     
     success_count = 0
@@ -412,7 +421,7 @@ async def batch_set_kb_access(req: request):
             continue
 
         # 检查主体是否存在
-        if not _check_subject_exists(local_doc_qa, subject_type, subject_id):
+        if not await _check_subject_exists(local_doc_qa, subject_type, subject_id):
             failed_list.append({
                 "subject_type": subject_type,
                 "subject_id": subject_id,
@@ -422,7 +431,7 @@ async def batch_set_kb_access(req: request):
 
         try:
             # 检查是否已有权限记录
-            existing_access = _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
+            existing_access = await _get_kb_access(local_doc_qa, kb_id, subject_type, subject_id)
 
             if access_level == 'none':
                 # 如果设置为none，则删除权限记录
@@ -431,7 +440,7 @@ async def batch_set_kb_access(req: request):
                         DELETE FROM KnowledgeBaseAccess 
                         WHERE kb_id = %s AND subject_type = %s AND subject_id = %s
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         delete_query, (kb_id, subject_type, subject_id), commit=True
                     )
             else:
@@ -442,7 +451,7 @@ async def batch_set_kb_access(req: request):
                         UPDATE KnowledgeBaseAccess SET permission_type = %s, granted_by = %s
                         WHERE id = %s
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         update_query, (access_level, user_id, access_id), commit=True
                     )
                 else:
@@ -452,7 +461,7 @@ async def batch_set_kb_access(req: request):
                         (kb_id, subject_type, subject_id, permission_type, granted_by)
                         VALUES (%s, %s, %s, %s, %s)
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         insert_query, (kb_id, subject_type, subject_id, access_level, user_id), commit=True
                     )
             
@@ -497,7 +506,7 @@ async def get_kb_detail(req: request):
         FROM KnowledgeBase 
         WHERE kb_id = %s AND deleted = 0
     """
-    kb_info = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    kb_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     if not kb_info:
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
@@ -505,10 +514,10 @@ async def get_kb_detail(req: request):
     owner_id = kb[2]  # 使用user_id作为owner_id
 
     # 获取所有者信息
-    owner_name = _get_subject_name(local_doc_qa, 'user', owner_id)
+    owner_name = await _get_subject_name(local_doc_qa, 'user', owner_id)
 
     # 检查用户是否有权限访问该知识库
-    has_access, access_level, access_source = _get_user_permission(
+    has_access, access_level, access_source = await _get_user_permission(
         local_doc_qa, kb_id, user_id, role, dept_id, owner_id
     )
 
@@ -518,7 +527,7 @@ async def get_kb_detail(req: request):
 
     # 获取知识库文件数量
     query = "SELECT COUNT(*) FROM File WHERE kb_id = %s"
-    file_count_result = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    file_count_result = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     file_count = file_count_result[0][0] if file_count_result else 0
 
     # 如果用户是管理员或知识库所有者，获取知识库的访问权限列表
@@ -530,11 +539,11 @@ async def get_kb_detail(req: request):
             WHERE a.kb_id = %s
             ORDER BY a.subject_type, a.permission_type
         """
-        access_records = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+        access_records = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
 
         for record in access_records:
             access_id, subject_type, subject_id, level = record
-            subject_name = _get_subject_name(local_doc_qa, subject_type, subject_id)
+            subject_name = await _get_subject_name(local_doc_qa, subject_type, subject_id)
 
             access_list.append({
                 "access_id": access_id,
@@ -583,7 +592,7 @@ async def transfer_kb_ownership(req: request):
 
     # 检查知识库是否存在
     query = "SELECT kb_id, user_id FROM KnowledgeBase WHERE kb_id = %s"
-    kb_info = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    kb_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     if not kb_info:
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
@@ -594,7 +603,7 @@ async def transfer_kb_ownership(req: request):
         return sanic_json({"code": 403, "msg": "您没有权限转移此知识库的所有权"})
 
     # 检查新所有者是否存在
-    if not _check_subject_exists(local_doc_qa, 'user', new_owner_id):
+    if not await _check_subject_exists(local_doc_qa, 'user', new_owner_id):
         return sanic_json({"code": 404, "msg": "新所有者不存在或已被禁用"})
 
     # 如果新所有者与当前所有者相同，则无需转移
@@ -604,11 +613,11 @@ async def transfer_kb_ownership(req: request):
     try:
         # 更新知识库所有者
         update_query = "UPDATE KnowledgeBase SET user_id = %s WHERE kb_id = %s"
-        local_doc_qa.milvus_summary.execute_query_(update_query, (new_owner_id, kb_id), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(update_query, (new_owner_id, kb_id), commit=True)
 
         # 确保新所有者有admin权限
         # 先检查是否已有权限记录
-        existing_access = _get_kb_access(local_doc_qa, kb_id, 'user', new_owner_id)
+        existing_access = await _get_kb_access(local_doc_qa, kb_id, 'user', new_owner_id)
 
         if existing_access:
             # 更新权限级别为admin
@@ -617,7 +626,7 @@ async def transfer_kb_ownership(req: request):
                 UPDATE KnowledgeBaseAccess SET permission_type = 'admin'
                 WHERE id = %s
             """
-            local_doc_qa.milvus_summary.execute_query_(
+            await local_doc_qa.milvus_summary_async.execute_query_(
                 update_query, (access_id,), commit=True
             )
         else:
@@ -627,7 +636,7 @@ async def transfer_kb_ownership(req: request):
                 (kb_id, subject_type, subject_id, permission_type, granted_by)
                 VALUES (%s, 'user', %s, 'admin', %s)
             """
-            local_doc_qa.milvus_summary.execute_query_(
+            await local_doc_qa.milvus_summary_async.execute_query_(
                 insert_query, (kb_id, new_owner_id, user_id), commit=True
             )
 
@@ -659,13 +668,13 @@ async def new_knowledge_base(req: request):
         return sanic_json({"code": 400, "msg": "知识库名称不能为空"})
 
     # 检查知识库ID是否已存在
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, [kb_id])
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
     if not not_exist_kb_ids:
         return sanic_json({"code": 2001, "msg": "知识库ID {} 已经存在".format(kb_id)})
 
     try:
         # 创建新知识库
-        local_doc_qa.milvus_summary.new_milvus_base(kb_id, user_id, kb_name)
+        await local_doc_qa.milvus_summary_async.new_milvus_base(kb_id, user_id, kb_name)
 
         # 生成时间戳
         now = datetime.now()
@@ -700,7 +709,7 @@ async def rename_knowledge_base(req: request):
 
     # 检查知识库是否存在
     query = "SELECT kb_id, user_id FROM KnowledgeBase WHERE kb_id = %s"
-    kb_info = local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True)
+    kb_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True)
     if not kb_info:
         return sanic_json({"code": 404, "msg": "知识库不存在"})
 
@@ -718,7 +727,7 @@ async def rename_knowledge_base(req: request):
             WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
             AND access_level IN ('write', 'admin')
         """
-        user_access = local_doc_qa.milvus_summary.execute_query_(query, (kb_id, user_id), fetch=True)
+        user_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id, user_id), fetch=True)
         if user_access:
             has_write_access = True
 
@@ -727,12 +736,12 @@ async def rename_knowledge_base(req: request):
 
     # 检查新名称是否已被使用
     query = "SELECT kb_id FROM KnowledgeBase WHERE kb_name = %s AND kb_id != %s AND deleted = 0"
-    if local_doc_qa.milvus_summary.execute_query_(query, (new_name, kb_id), fetch=True):
+    if await local_doc_qa.milvus_summary_async.execute_query_(query, (new_name, kb_id), fetch=True):
         return sanic_json({"code": 400, "msg": "该知识库名称已存在"})
 
     # 更新知识库名称
     try:
-        update_query = local_doc_qa.milvus_summary.rename_knowledge_base(user_id, kb_id, new_name)
+        update_query = await local_doc_qa.milvus_summary_async.rename_knowledge_base(user_id, kb_id, new_name)
         return sanic_json({"code": 200, "msg": "知识库重命名成功"})
     except Exception as e:
         debug_logger.error(f"重命名知识库失败: {str(e)}")
@@ -750,7 +759,7 @@ async def upload_weblink(req: request):
     # 获取并验证知识库ID
     kb_id = safe_get(req, 'kb_id')
     kb_id = correct_kb_id(kb_id)
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, [kb_id])
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
     if not_exist_kb_ids:
         msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
         return sanic_json({"code": 2001, "msg": msg, "data": [{}]})
@@ -798,7 +807,7 @@ async def upload_weblink(req: request):
     # 检查同名文件
     exist_file_names = []
     if mode == 'soft':
-        exist_files = local_doc_qa.milvus_summary.check_file_exist_by_name(user_id, kb_id, file_names)
+        exist_files = await local_doc_qa.milvus_summary_async.check_file_exist_by_name(user_id, kb_id, file_names)
         exist_file_names = [f[1] for f in exist_files]
         for exist_file in exist_files:
             file_id, file_name, file_size, status = exist_file
@@ -821,7 +830,7 @@ async def upload_weblink(req: request):
         file_location = local_file.file_location
 
         # 添加文件到数据库
-        msg = local_doc_qa.milvus_summary.add_file(
+        msg = await local_doc_qa.milvus_summary_async.add_file(
             file_id, user_id, kb_id, file_name, file_size, file_location,
             chunk_size, timestamp, url
         )
@@ -846,6 +855,78 @@ async def upload_weblink(req: request):
     return sanic_json({"code": 200, "msg": msg, "data": data})
 
 
+def clean_upload_file_name(file_name):
+    # 删除掉全角字符，文件名中的/会被当作目录
+    file_name = re.sub(r'[\uFF01-\uFF5E\u3000-\u303F]', '', file_name).replace("/", "_")
+    debug_logger.info('cleaned name: %s', file_name)
+    return truncate_filename(file_name, max_length=110)
+
+
+async def check_upload_file_limit(local_doc_qa, kb_id, upload_count):
+    """知识库最多10000个文件，超出时返回错误信息，文件数由数据库分组计数得到"""
+    exist_count = sum((await local_doc_qa.milvus_summary_async.get_file_status_count(kb_id)).values())
+    if exist_count + upload_count > 10000:
+        return f"fail, exist files is {exist_count}, upload files is {upload_count}, total files is {exist_count + upload_count}, max length is 10000."
+    return None
+
+
+async def remove_upload_files(file_locations):
+    for file_location in file_locations:
+        await run_in_upload_pool(shutil.rmtree, os.path.dirname(file_location), True)
+
+
+async def register_local_files(local_doc_qa, user_id, kb_id, local_files, chunk_size):
+    """
+    在线程池中并发估算文件字符数，超过MAX_CHARS的文件删除，其余文件用一次批量INSERT登记到File表。
+    返回(data, failed_files)
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M")
+    chars_list = await estimate_file_chars([local_file.file_location for local_file in local_files])
+    data, rows, failed_files, failed_locations = [], [], [], []
+    for local_file, chars in zip(local_files, chars_list):
+        debug_logger.info(f"{local_file.file_name} char_size: {chars}")
+        if chars and chars > MAX_CHARS:
+            debug_logger.warning(f"fail, file {local_file.file_name} chars is {chars}, max length is {MAX_CHARS}.")
+            failed_files.append(local_file.file_name)
+            failed_locations.append(local_file.file_location)
+            continue
+        rows.append((local_file.file_id, user_id, kb_id, local_file.file_name, local_file.file_size,
+                     local_file.file_location, chunk_size, timestamp, '', 'gray', local_file.content_hash,
+                     LocalFile.get_parse_config(local_file.file_name, chunk_size)))
+        data.append({
+            "file_id": local_file.file_id,
+            "file_name": local_file.file_name,
+            "status": "gray",
+            "bytes": local_file.file_size,
+            "timestamp": timestamp,
+            "estimated_chars": chars
+        })
+    await remove_upload_files(failed_locations)
+    if rows:
+        msg = await local_doc_qa.milvus_summary_async.add_files(rows)
+        debug_logger.info(f"add {len(rows)} files, {msg}")
+    return data, failed_files
+
+
+def upload_result_msg(exist_file_names, failed_files):
+    if exist_file_names:
+        return f'warning，当前的mode是soft，无法上传同名文件{exist_file_names}，如果想强制上传同名文件，请设置mode：strong'
+    elif failed_files:
+        return f"warning, {failed_files} chars is too much, max characters length is {MAX_CHARS}, skip upload."
+    return "success，后台正在飞速上传文件，请耐心等待"
+
+
+async def get_exist_file_names(local_doc_qa, user_id, kb_id, file_names, mode):
+    # soft模式下不上传同名文件
+    if mode != 'soft':
+        return []
+    exist_files = await local_doc_qa.milvus_summary_async.check_file_exist_by_name(user_id, kb_id, file_names)
+    for exist_file in exist_files:
+        file_id, file_name, file_size, status = exist_file
+        debug_logger.info(f"{file_name}, {status}, existed files, skip upload")
+    return [f[1] for f in exist_files]
+
+
 @get_time_async
 @auth_required("write", check_kb_access=True)
 async def upload_files(req: request):
@@ -874,100 +955,245 @@ async def upload_files(req: request):
     debug_logger.info(f"{user_id} upload files number: {len(files)}")
 
     # 验证知识库是否存在
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, [kb_id])
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
     if not_exist_kb_ids:
         msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
         return sanic_json({"code": 2001, "msg": msg, "data": [{}]})
 
     # 检查文件数量限制
-    exist_files = local_doc_qa.milvus_summary.get_files(user_id, kb_id)
-    if len(exist_files) + len(files) > 10000:
-        return sanic_json({
-            "code": 2002,
-            "msg": f"fail, exist files is {len(exist_files)}, upload files is {len(files)}, total files is {len(exist_files) + len(files)}, max length is 10000."
-        })
+    limit_msg = await check_upload_file_limit(local_doc_qa, kb_id, len(files))
+    if limit_msg:
+        return sanic_json({"code": 2002, "msg": limit_msg})
 
     # 处理文件名
-    data = []
-    local_files = []
     file_names = []
     for file in files:
-        if isinstance(file, str):
-            file_name = os.path.basename(file)
-        else:
-            debug_logger.info('ori name: %s', file.name)
-            file_name = urllib.parse.unquote(file.name, encoding='UTF-8')
-            debug_logger.info('decode name: %s', file_name)
-
-        # 删除掉全角字符
-        file_name = re.sub(r'[\uFF01-\uFF5E\u3000-\u303F]', '', file_name)
-        debug_logger.info('cleaned name: %s', file_name)
-        file_name = truncate_filename(file_name, max_length=110)
-        file_names.append(file_name)
+        debug_logger.info('ori name: %s', file.name)
+        file_name = urllib.parse.unquote(file.name, encoding='UTF-8')
+        debug_logger.info('decode name: %s', file_name)
+        file_names.append(clean_upload_file_name(file_name))
 
     # 检查同名文件
-    exist_file_names = []
-    if mode == 'soft':
-        exist_files = local_doc_qa.milvus_summary.check_file_exist_by_name(user_id, kb_id, file_names)
-        exist_file_names = [f[1] for f in exist_files]
-        for exist_file in exist_files:
-            file_id, file_name, file_size, status = exist_file
-            debug_logger.info(f"{file_name}, {status}, existed files, skip upload")
+    exist_file_names = await get_exist_file_names(local_doc_qa, user_id, kb_id, file_names, mode)
 
-    # 生成时间戳
-    now = datetime.now()
-    timestamp = now.strftime("%Y%m%d%H%M")
+    # 在线程池中并发写盘，跳过同名文件
+    local_files = await asyncio.gather(*[
+        run_in_upload_pool(LocalFile, user_id, kb_id, file, file_name)
+        for file, file_name in zip(files, file_names) if file_name not in exist_file_names
+    ])
+    data, failed_files = await register_local_files(local_doc_qa, user_id, kb_id, local_files, chunk_size)
 
-    # 处理文件上传
-    failed_files = []
-    for file, file_name in zip(files, file_names):
-        # 跳过同名文件
-        if file_name in exist_file_names:
-            continue
+    msg = upload_result_msg(exist_file_names, failed_files)
+    return sanic_json({"code": 200, "msg": msg, "data": data})
 
-        # 创建本地文件对象
-        local_file = LocalFile(user_id, kb_id, file, file_name)
 
-        # 检查文件字符数
-        chars = fast_estimate_file_char_count(local_file.file_location)
-        debug_logger.info(f"{file_name} char_size: {chars}")
-        if chars and chars > MAX_CHARS:
-            debug_logger.warning(f"fail, file {file_name} chars is {chars}, max length is {MAX_CHARS}.")
-            failed_files.append(file_name)
-            continue
+@get_time_async
+@auth_required("write", check_kb_access=True)
+async def upload_files_stream(req: request):
+    """
+    流式上传文件到知识库：multipart请求体边接收边写入磁盘，worker内存占用与文件大小无关。
+    鉴权在读取请求体之前进行，user_id、kb_id需要放在URL查询参数中；mode、chunk_size可放在查询参数或表单字段中，
+    文件字段名与upload_files相同（files）。
+    """
+    local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+    user_id = safe_get(req, 'user_id')
+    kb_id = correct_kb_id(safe_get(req, 'kb_id'))
+    debug_logger.info("upload_files_stream %s %s", user_id, kb_id)
 
-        # 获取文件信息
-        file_id = local_file.file_id
-        file_size = len(local_file.file_content)
-        file_location = local_file.file_location
-        local_files.append(local_file)
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
+    if not_exist_kb_ids:
+        msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
+        return sanic_json({"code": 2001, "msg": msg, "data": [{}]})
 
-        # 添加文件到数据库
-        msg = local_doc_qa.milvus_summary.add_file(
-            file_id, user_id, kb_id, file_name, file_size, file_location,
-            chunk_size, timestamp
-        )
-        debug_logger.info(f"{file_name}, {file_id}, {msg}")
+    try:
+        parser = MultipartStreamParser(req.headers.get('content-type'))
+    except ValueError as e:
+        return sanic_json({"code": 2002, "msg": f"fail, {e}"})
 
-        # 添加到返回数据
-        data.append({
-            "file_id": file_id,
-            "file_name": file_name,
-            "status": "gray",
-            "bytes": len(local_file.file_content),
-            "timestamp": timestamp,
-            "estimated_chars": chars
-        })
+    fields = {}
+    saved_files = []  # [(file_id, file_name, file_location)]
+    field_name, field_value, file_obj, pending = None, None, None, bytearray()
+    try:
+        while not parser.finished:
+            body = await req.stream.read()
+            if body is None:
+                break
+            for event in parser.feed(body):
+                if event[0] == 'part':
+                    _, field_name, file_name = event
+                    if file_name is None:
+                        field_value = bytearray()
+                    elif field_name == 'files':
+                        file_id = uuid.uuid4().hex
+                        file_name = clean_upload_file_name(urllib.parse.unquote(file_name, encoding='UTF-8'))
+                        file_location = await run_in_upload_pool(LocalFile.get_file_location, user_id, kb_id,
+                                                                 file_id, file_name)
+                        file_obj = await run_in_upload_pool(open, file_location, 'wb')
+                        saved_files.append((file_id, file_name, file_location))
+                elif event[0] == 'data':
+                    if file_obj is not None:
+                        # 攒够1MB再写盘，减少线程池调度次数
+                        pending += event[1]
+                        if len(pending) >= 1024 * 1024:
+                            await run_in_upload_pool(file_obj.write, bytes(pending))
+                            pending.clear()
+                    elif field_value is not None and len(field_value) < 64 * 1024:
+                        field_value += event[1]
+                else:
+                    if file_obj is not None:
+                        await run_in_upload_pool(file_obj.write, bytes(pending))
+                        pending.clear()
+                        await run_in_upload_pool(file_obj.close)
+                        file_obj = None
+                    elif field_value is not None:
+                        fields[field_name] = field_value.decode('utf-8', errors='replace')
+                        field_value = None
+        if not parser.finished:
+            raise ValueError("request body is incomplete")
+    except Exception as e:
+        debug_logger.error(f"upload_files_stream failed: {e}")
+        if file_obj is not None:
+            await run_in_upload_pool(file_obj.close)
+        await remove_upload_files([file_location for _, _, file_location in saved_files])
+        return sanic_json({"code": 2002, "msg": f"fail, invalid upload body: {e}"})
+
+    mode = fields.get('mode') or safe_get(req, 'mode', default='soft')
+    chunk_size = int(fields.get('chunk_size') or safe_get(req, 'chunk_size', default=DEFAULT_PARENT_CHUNK_SIZE))
+    debug_logger.info(f"{user_id} upload files number: {len(saved_files)}, mode: {mode}, chunk_size: {chunk_size}")
+
+    limit_msg = await check_upload_file_limit(local_doc_qa, kb_id, len(saved_files))
+    if limit_msg:
+        await remove_upload_files([file_location for _, _, file_location in saved_files])
+        return sanic_json({"code": 2002, "msg": limit_msg})
+
+    exist_file_names = await get_exist_file_names(local_doc_qa, user_id, kb_id,
+                                                  [file_name for _, file_name, _ in saved_files], mode)
+    await remove_upload_files([file_location for _, file_name, file_location in saved_files
+                               if file_name in exist_file_names])
+    # 文件已在磁盘上，LocalFile只需计算内容哈希，同样放到线程池中
+    local_files = await asyncio.gather(*[
+        run_in_upload_pool(LocalFile, user_id, kb_id, None, file_name, file_id)
+        for file_id, file_name, _ in saved_files if file_name not in exist_file_names
+    ])
+    data, failed_files = await register_local_files(local_doc_qa, user_id, kb_id, local_files, chunk_size)
+
+    msg = upload_result_msg(exist_file_names, failed_files)
+    return sanic_json({"code": 200, "msg": msg, "data": data})
 
-    # 生成响应消息
-    if exist_file_names:
-        msg = f'warning，当前的mode是soft，无法上传同名文件{exist_file_names}，如果想强制上传同名文件，请设置mode：strong'
-    elif failed_files:
-        msg = f"warning, {failed_files} chars is too much, max characters length is {MAX_CHARS}, skip upload."
-    else:
-        msg = "success，后台正在飞速上传文件，请耐心等待"
 
-    return sanic_json({"code": 200, "msg": msg, "data": data})
+def parse_config_chunk_size(parse_config):
+    # parse_config形如".pdf:800:pdf_parser_v1"，旧文件没有记录时使用默认值
+    try:
+        return int(parse_config.split(':')[1])
+    except (AttributeError, IndexError, ValueError):
+        return DEFAULT_PARENT_CHUNK_SIZE
+
+
+async def copy_files_to_kb(local_doc_qa, user_id, src_kb_id, target_kb_id, src_files, move):
+    """
+    把src_files（get_files_for_copy的结果）登记为target_kb_id中的新文件，新文件状态为gray，由入库服务按FileClone记录
+    直接复制源文件的原始文件、向量、ES记录和父文档，不重新解析和embedding；move为True时新文件入库成功后删除源文件。
+    返回新文件列表
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M")
+    faq_ids = [src_file[0] for src_file in src_files if src_file[4] == 'FAQ']
+    src_faqs = await local_doc_qa.milvus_summary_async.get_faqs(faq_ids) if faq_ids else {}
+    rows, clones, faqs, data = [], [], [], []
+    for src_file_id, file_name, file_size, content_length, file_location, file_url, content_hash, parse_config \
+            in src_files:
+        file_id = uuid.uuid4().hex
+        if file_location in ('FAQ', 'URL'):
+            new_location = file_location
+        else:
+            # 与LocalFile.get_file_location相同的路径，目录由入库服务复制文件时创建
+            new_location = os.path.join(UPLOAD_ROOT_PATH, user_id, target_kb_id, file_id, file_name)
+        if src_file_id in src_faqs:
+            _, _, question, answer, nos_keys = src_faqs[src_file_id]
+            faqs.append((file_id, user_id, target_kb_id, question, answer, nos_keys))
+        clones.append((file_id, src_file_id, src_kb_id, move))
+        rows.append((file_id, user_id, target_kb_id, file_name, file_size, new_location,
+                     parse_config_chunk_size(parse_config), timestamp, file_url, 'gray', content_hash, parse_config))
+        data.append({"file_id": file_id, "file_name": file_name, "src_file_id": src_file_id, "status": "gray",
+                     "bytes": file_size, "content_length": content_length, "timestamp": timestamp})
+    # File记录最后写入，入库服务取到gray文件时FileClone和FAQ一定已经存在
+    await local_doc_qa.milvus_summary_async.add_file_clones(clones)
+    if faqs:
+        await local_doc_qa.milvus_summary_async.add_faqs(faqs)
+    if rows:
+        await local_doc_qa.milvus_summary_async.add_files(rows)
+    debug_logger.info(f"copy {len(rows)} files from {src_kb_id} to {target_kb_id}, move: {move}")
+    return data
+
+
+@get_time_async
+@auth_required("write")
+async def clone_knowledge_base(req: request):
+    """
+    复制知识库：新建一个知识库，复制源知识库中入库成功的全部文件。向量、ES记录和父文档由入库服务直接复制，
+    不重新解析和embedding，耗时只与存储的读写量有关。源知识库需要read权限
+    """
+    local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+    user_id = safe_get(req, 'user_id')
+    kb_id = correct_kb_id(safe_get(req, 'kb_id'))
+    kb_name = safe_get(req, 'kb_name')
+    debug_logger.info("clone_knowledge_base %s %s", user_id, kb_id)
+
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
+    if not_exist_kb_ids:
+        return sanic_json({"code": 2001, "msg": "invalid kb_id: {}, please check...".format(not_exist_kb_ids)})
+    if await permission_resolver.denied_kb_ids(local_doc_qa.milvus_summary_async, user_id, [kb_id], "read"):
+        return sanic_json({"code": 403, "msg": f"没有权限read访问知识库 {kb_id}"})
+    if not kb_name:
+        kb_name = (await local_doc_qa.milvus_summary_async.get_knowledge_base_name([kb_id]))[0][2] + '_副本'
+
+    src_files = await local_doc_qa.milvus_summary_async.get_files_for_copy(kb_id)
+    new_kb_id = correct_kb_id('KB' + uuid.uuid4().hex)
+    await local_doc_qa.milvus_summary_async.new_milvus_base(new_kb_id, user_id, kb_name)
+    data = await copy_files_to_kb(local_doc_qa, user_id, kb_id, new_kb_id, src_files, False)
+    return sanic_json({"code": 200, "msg": "success，后台正在复制文件，请耐心等待",
+                       "data": {"kb_id": new_kb_id, "kb_name": kb_name, "files": data}})
+
+
+@get_time_async
+@auth_required("write")
+async def copy_files(req: request):
+    """
+    把知识库中入库成功的文件复制或移动（move=true）到另一个知识库，file_ids为空时处理全部文件。
+    向量、ES记录和父文档由入库服务直接复制，不重新解析和embedding；移动时新文件入库成功后才删除源文件。
+    源知识库需要read权限（移动需要write），目标知识库需要write权限
+    """
+    local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+    user_id = safe_get(req, 'user_id')
+    kb_id = correct_kb_id(safe_get(req, 'kb_id'))
+    target_kb_id = correct_kb_id(safe_get(req, 'target_kb_id'))
+    file_ids = safe_get(req, 'file_ids')
+    move = str(safe_get(req, 'move', False)).lower() == 'true'
+    debug_logger.info("copy_files %s %s -> %s, move: %s", user_id, kb_id, target_kb_id, move)
+
+    if kb_id == target_kb_id:
+        return sanic_json({"code": 2001, "msg": "fail, target_kb_id is the same as kb_id"})
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id, target_kb_id])
+    if not_exist_kb_ids:
+        return sanic_json({"code": 2001, "msg": "invalid kb_id: {}, please check...".format(not_exist_kb_ids)})
+    for check_kb_id, permission in ((kb_id, "write" if move else "read"), (target_kb_id, "write")):
+        if await permission_resolver.denied_kb_ids(local_doc_qa.milvus_summary_async, user_id, [check_kb_id],
+                                                   permission):
+            return sanic_json({"code": 403, "msg": f"没有权限{permission}访问知识库 {check_kb_id}"})
+
+    if isinstance(file_ids, str):
+        file_ids = [file_ids]
+    src_files = await local_doc_qa.milvus_summary_async.get_files_for_copy(kb_id, file_ids or None)
+    if file_ids:
+        found_file_ids = {src_file[0] for src_file in src_files}
+        invalid_file_ids = [file_id for file_id in file_ids if file_id not in found_file_ids]
+        if invalid_file_ids:
+            return sanic_json({"code": 2004, "msg": f"fail, files {invalid_file_ids} not found or not green"})
+
+    limit_msg = await check_upload_file_limit(local_doc_qa, target_kb_id, len(src_files))
+    if limit_msg:
+        return sanic_json({"code": 2002, "msg": limit_msg})
+    data = await copy_files_to_kb(local_doc_qa, user_id, kb_id, target_kb_id, src_files, move)
+    return sanic_json({"code": 200, "msg": "success，后台正在复制文件，请耐心等待", "data": data})
 
 
 @get_time_async
@@ -1025,7 +1251,7 @@ async def upload_faqs(req: request):
         return sanic_json({"code": 2002, "msg": f"fail, faqs too many, max length is 1000."})
 
     # 验证知识库是否存在
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, [kb_id])
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
     if not_exist_kb_ids:
         msg = "invalid kb_id: {}, please check...".format(not_exist_kb_ids)
         return sanic_json({"code": 2001, "msg": msg})
@@ -1062,13 +1288,13 @@ async def upload_faqs(req: request):
         local_files.append(local_file)
 
         # 添加FAQ到数据库
-        local_doc_qa.milvus_summary.add_faq(
+        await local_doc_qa.milvus_summary_async.add_faq(
             file_id, user_id, kb_id, faq['question'], faq['answer'],
             faq.get('nos_keys', '')
         )
 
         # 添加文件记录
-        local_doc_qa.milvus_summary.add_file(
+        await local_doc_qa.milvus_summary_async.add_file(
             file_id, user_id, kb_id, file_name, file_size, file_location,
             chunk_size, timestamp
         )
@@ -1106,26 +1332,36 @@ async def list_docs(req: request):
     file_id = safe_get(req, 'file_id')
     page_id = safe_get(req, 'page_id', 1)  # 默认为第一页
     page_limit = safe_get(req, 'page_limit', 10)  # 默认每页显示10条记录
+    page_limit = max(1, min(page_limit, LIST_DOCS_MAX_PAGE_LIMIT))  # 每次请求读取的行数有上限
+    cursor = safe_get(req, 'cursor')  # 上一页返回的next_cursor，传入时按keyset翻页，忽略page_id
 
-    # 获取文件信息
-    data = []
+    # 各状态文件数量和总数由数据库分组统计，不再读取全部文件
+    next_cursor = None
     if file_id is None:
-        file_infos = local_doc_qa.milvus_summary.get_files(user_id, kb_id)
+        status_count = await local_doc_qa.milvus_summary_async.get_file_status_count(kb_id)
+        total_count = sum(status_count.values())
+        total_pages = (total_count + page_limit - 1) // page_limit
+
+        # 验证页码是否有效
+        if cursor is None and page_id > total_pages and total_count != 0:
+            return sanic_json({
+                "code": 2002,
+                "msg": f'输入非法！page_id超过最大值，page_id: {page_id}，最大值：{total_pages}，请检查！'
+            })
+        file_infos, next_cursor = await local_doc_qa.milvus_summary_async.get_files_page(
+            kb_id, page_limit, cursor=cursor, offset=(page_id - 1) * page_limit)
     else:
-        file_infos = local_doc_qa.milvus_summary.get_files(user_id, kb_id, file_id)
+        file_infos = await local_doc_qa.milvus_summary_async.get_files(user_id, kb_id, file_id) or []
+        status_count = dict(Counter(file_info[2] for file_info in file_infos))
+        total_count = len(file_infos)
+        total_pages = 1 if file_infos else 0
 
-    # 统计各状态文件数量
-    status_count = {}
+    # 只为当前页的FAQ文件批量查询问题和答案
+    faq_ids = [file_info[0] for file_info in file_infos if file_info[1].endswith('.faq')]
+    faqs = await local_doc_qa.milvus_summary_async.get_faqs(faq_ids) if faq_ids else {}
 
-    # 处理文件信息
+    current_page_data = []
     for file_info in file_infos:
-        # 统计状态
-        status = file_info[2]
-        if status not in status_count:
-            status_count[status] = 1
-        else:
-            status_count[status] += 1
-
         # 构建文件数据
         file_data = {
             "file_id": file_info[0],
@@ -1141,32 +1377,12 @@ async def list_docs(req: request):
         }
 
         # 如果是FAQ文件，添加问题和答案
-        if file_info[1].endswith('.faq'):
-            faq_info = local_doc_qa.milvus_summary.get_faq(file_info[0])
-            user_id, kb_id, question, answer, nos_keys = faq_info
+        if file_info[0] in faqs:
+            _, _, question, answer, _ = faqs[file_info[0]]
             file_data['question'] = question
             file_data['answer'] = answer
 
-        data.append(file_data)
-
-    # 按时间戳排序，时间越新的越靠前
-    data = sorted(data, key=lambda x: int(x['timestamp']), reverse=True)
-
-    # 分页处理
-    total_count = len(data)
-    total_pages = (total_count + page_limit - 1) // page_limit
-
-    # 验证页码是否有效
-    if page_id > total_pages and total_count != 0:
-        return sanic_json({
-            "code": 2002,
-            "msg": f'输入非法！page_id超过最大值，page_id: {page_id}，最大值：{total_pages}，请检查！'
-        })
-
-    # 计算当前页的数据范围
-    start_index = (page_id - 1) * page_limit
-    end_index = start_index + page_limit
-    current_page_data = data[start_index:end_index]
+        current_page_data.append(file_data)
 
     # 返回结果
     return sanic_json({
@@ -1178,7 +1394,8 @@ async def list_docs(req: request):
             "status_count": status_count,  # 各状态的文件数
             "details": current_page_data,  # 当前页码下的文件目录
             "page_id": page_id,  # 当前页码,
-            "page_limit": page_limit  # 每页显示的文件数
+            "page_limit": page_limit,  # 每页显示的文件数
+            "next_cursor": next_cursor  # 下一页的游标，没有更多数据时为None
         }
     })
 
@@ -1198,7 +1415,7 @@ async def delete_docs(req: request):
     file_ids = safe_get(req, "file_ids")
 
     # 验证知识库是否存在
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, [kb_id])
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, [kb_id])
     if not_exist_kb_ids:
         return sanic_json({
             "code": 2003,
@@ -1206,7 +1423,7 @@ async def delete_docs(req: request):
         })
 
     # 验证文件是否存在
-    valid_file_infos = local_doc_qa.milvus_summary.check_file_exist(user_id, kb_id, file_ids)
+    valid_file_infos = await local_doc_qa.milvus_summary_async.check_file_exist(user_id, kb_id, file_ids)
     if len(valid_file_infos) == 0:
         return sanic_json({
             "code": 2004,
@@ -1217,38 +1434,17 @@ async def delete_docs(req: request):
     valid_file_ids = [file_info[0] for file_info in valid_file_infos]
     debug_logger.info("delete_docs valid_file_ids %s", valid_file_ids)
 
-    # 从Milvus中删除数据
-    expr = f"""kb_id == "{kb_id}" and file_id in {valid_file_ids}"""
-    asyncio.create_task(run_in_background(local_doc_qa.milvus_kb.delete_expr, expr))
-
-    # 从ES中删除数据
-    file_chunks = local_doc_qa.milvus_summary.get_chunk_size(valid_file_ids)
-    asyncio.create_task(run_in_background(local_doc_qa.es_client.delete_files, valid_file_ids, file_chunks))
-
-    # 从数据库中删除相关记录
-    local_doc_qa.milvus_summary.delete_files(kb_id, valid_file_ids)
-    local_doc_qa.milvus_summary.delete_documents(valid_file_ids)
-    local_doc_qa.milvus_summary.delete_faqs(valid_file_ids)
-
-    # 删除文件系统中的文件
-    for file_id in file_ids:
-        try:
-            # 删除上传目录
-            upload_path = os.path.join(UPLOAD_ROOT_PATH, user_id)
-            file_dir = os.path.join(upload_path, kb_id, file_id)
-            debug_logger.info("delete_docs file_dir %s", file_dir)
-            shutil.rmtree(file_dir)
-
-            # 删除图片目录
-            images_dir = os.path.join(IMAGES_ROOT_PATH, file_id)
-            debug_logger.info("delete_docs images_dir %s", images_dir)
-            shutil.rmtree(images_dir)
-        except Exception as e:
-            debug_logger.error("An error occurred while constructing file paths: %s", str(e))
+    # 文件记录先标记为删除，列表中立即不可见；向量、ES记录、父文档和磁盘文件由后台删除任务分批清理
+    await local_doc_qa.milvus_summary_async.delete_files(kb_id, valid_file_ids)
+    job_id = uuid.uuid4().hex
+    await local_doc_qa.milvus_summary_async.add_delete_jobs(
+        [(job_id, user_id, kb_id, 'files', json.dumps(valid_file_ids), len(valid_file_ids))])
+    local_doc_qa.delete_job_worker.notify()
 
     return sanic_json({
         "code": 200,
-        "msg": "documents {} delete success".format(valid_file_ids)
+        "msg": "documents {} delete success".format(valid_file_ids),
+        "job_id": job_id
     })
     
 
@@ -1267,52 +1463,47 @@ async def delete_knowledge_base(req: request):
     kb_ids = [correct_kb_id(kb_id) for kb_id in kb_ids]
 
     # 验证知识库是否存在
-    not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, kb_ids)
+    not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, kb_ids)
     if not_exist_kb_ids:
         return sanic_json({
             "code": 2003,
             "msg": "fail, knowledge Base {} not found".format(not_exist_kb_ids)
         })
 
-    # 从Milvus中删除数据
-    for kb_id in kb_ids:
-        expr = f"kb_id == \"{kb_id}\""
-        asyncio.create_task(run_in_background(local_doc_qa.milvus_kb.delete_expr, expr))
-
-    # 处理每个知识库
-    for kb_id in kb_ids:
-        # 获取知识库中的文件
-        file_infos = local_doc_qa.milvus_summary.get_files(user_id, kb_id)
-        file_ids = [file_info[0] for file_info in file_infos]
-        file_chunks = [file_info[8] for file_info in file_infos]
-
-        # 从ES中删除文件
-        asyncio.create_task(run_in_background(local_doc_qa.es_client.delete_files, file_ids, file_chunks))
-
-        # 从数据库中删除文档和FAQ
-        local_doc_qa.milvus_summary.delete_documents(file_ids)
-        local_doc_qa.milvus_summary.delete_faqs(file_ids)
-
-        # 删除文件系统中的知识库目录
-        try:
-            upload_path = os.path.join(UPLOAD_ROOT_PATH, user_id)
-            file_dir = os.path.join(upload_path, kb_id)
-            debug_logger.info("delete_knowledge_base file dir : %s", file_dir)
-            shutil.rmtree(file_dir)
-        except Exception as e:
-            debug_logger.error("An error occurred while constructing file paths: %s", str(e))
-
-        debug_logger.info(f"""delete knowledge base {kb_id} success""")
-
-    # 从数据库中删除知识库
-    local_doc_qa.milvus_summary.delete_knowledge_base(user_id, kb_ids)
+    # 知识库和文件记录先标记为删除，向量、ES记录、父文档和磁盘文件由后台删除任务分批清理
+    await local_doc_qa.milvus_summary_async.delete_knowledge_base(user_id, kb_ids)
+    job_ids = {kb_id: uuid.uuid4().hex for kb_id in kb_ids}
+    await local_doc_qa.milvus_summary_async.add_delete_jobs(
+        [(job_id, user_id, kb_id, 'kb', None, 0) for kb_id, job_id in job_ids.items()])
+    local_doc_qa.delete_job_worker.notify()
+    debug_logger.info(f"delete knowledge base {kb_ids}, jobs: {job_ids}")
 
     return sanic_json({
         "code": 200,
-        "msg": "Knowledge Base {} delete success".format(kb_ids)
+        "msg": "Knowledge Base {} delete success".format(kb_ids),
+        "job_ids": job_ids
     })
 
 
+@get_time_async
+@auth_required("read")
+async def get_delete_jobs(req: request):
+    """查询删除任务的进度，status为pending/running/done/failed，progress为已清理的文件数"""
+    local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+    user_id = safe_get(req, 'user_id')
+    job_ids = safe_get(req, 'job_ids')
+    if isinstance(job_ids, str):
+        job_ids = [job_ids]
+    if not job_ids:
+        return sanic_json({"code": 2005, "msg": "fail, job_ids is empty"})
+    rows = await local_doc_qa.milvus_summary_async.get_delete_jobs(user_id, job_ids)
+    data = [{"job_id": job_id, "kb_id": kb_id, "job_type": job_type, "status": status, "total": total,
+             "progress": progress, "attempts": attempts, "msg": msg or '',
+             "creation_time": str(creation_time), "update_time": str(update_time)}
+            for job_id, kb_id, job_type, status, total, progress, attempts, msg, creation_time, update_time in rows]
+    return sanic_json({"code": 200, "msg": "success", "data": data})
+
+
 @get_time_async
 @auth_required("read", check_kb_access=True)
 async def get_total_status(req: request):
@@ -1326,7 +1517,7 @@ async def get_total_status(req: request):
 
     # 确定要处理的用户列表
     if not user_id:
-        users = local_doc_qa.milvus_summary.get_users()
+        users = await local_doc_qa.milvus_summary_async.get_users()
         users = [user[0] for user in users]
     else:
         users = [user_id]
@@ -1340,19 +1531,19 @@ async def get_total_status(req: request):
 
         # 如果按日期统计
         if by_date:
-            res[user] = local_doc_qa.milvus_summary.get_total_status_by_date(user)
+            res[user] = await local_doc_qa.milvus_summary_async.get_total_status_by_date(user)
             continue
 
         # 获取用户的所有知识库
-        kbs = local_doc_qa.milvus_summary.get_knowledge_bases(user)
+        kbs = await local_doc_qa.milvus_summary_async.get_knowledge_bases(user)
 
         # 统计每个知识库的文件状态
         for kb_id, kb_name in kbs:
             # 获取各状态的文件信息
-            gray_file_infos = local_doc_qa.milvus_summary.get_file_by_status([kb_id], 'gray')
-            red_file_infos = local_doc_qa.milvus_summary.get_file_by_status([kb_id], 'red')
-            yellow_file_infos = local_doc_qa.milvus_summary.get_file_by_status([kb_id], 'yellow')
-            green_file_infos = local_doc_qa.milvus_summary.get_file_by_status([kb_id], 'green')
+            gray_file_infos = await local_doc_qa.milvus_summary_async.get_file_by_status([kb_id], 'gray')
+            red_file_infos = await local_doc_qa.milvus_summary_async.get_file_by_status([kb_id], 'red')
+            yellow_file_infos = await local_doc_qa.milvus_summary_async.get_file_by_status([kb_id], 'yellow')
+            green_file_infos = await local_doc_qa.milvus_summary_async.get_file_by_status([kb_id], 'green')
 
             # 统计各状态的文件数量
             res[user][kb_name + kb_id] = {
@@ -1389,11 +1580,11 @@ async def clean_files_by_status(req: request):
 
     # 如果未提供知识库ID，则获取用户的所有知识库
     if not kb_ids:
-        kbs = local_doc_qa.milvus_summary.get_knowledge_bases(user_id)
+        kbs = await local_doc_qa.milvus_summary_async.get_knowledge_bases(user_id)
         kb_ids = [kb[0] for kb in kbs]
     else:
         # 验证知识库是否存在
-        not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, kb_ids)
+        not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, kb_ids)
         if not_exist_kb_ids:
             return sanic_json({
                 "code": 2003,
@@ -1401,7 +1592,7 @@ async def clean_files_by_status(req: request):
             })
 
     # 获取指定状态的文件
-    files_to_clean = local_doc_qa.milvus_summary.get_file_by_status(kb_ids, status)
+    files_to_clean = await local_doc_qa.milvus_summary_async.get_file_by_status(kb_ids, status)
     file_ids = [f[0] for f in files_to_clean]
     file_names = [f[1] for f in files_to_clean]
     debug_logger.info(f'{status} files number: {len(file_names)}')
@@ -1409,7 +1600,7 @@ async def clean_files_by_status(req: request):
     # 删除数据库中的文件记录
     if file_ids:
         for kb_id in kb_ids:
-            local_doc_qa.milvus_summary.delete_files(kb_id, file_ids)
+            await local_doc_qa.milvus_summary_async.delete_files(kb_id, file_ids)
 
     # 返回成功响应
     return sanic_json({
@@ -1435,10 +1626,10 @@ async def local_doc_chat(req: request):
     bot_id = safe_get(req, 'bot_id')
     if bot_id:
         # 获取机器人配置
-        if not local_doc_qa.milvus_summary.check_bot_is_exist(bot_id):
+        if not await local_doc_qa.milvus_summary_async.check_bot_is_exist(bot_id):
             return sanic_json({"code": 2003, "msg": "fail, Bot {} not found".format(bot_id)})
 
-        bot_info = local_doc_qa.milvus_summary.get_bot(None, bot_id)[0]
+        bot_info = (await local_doc_qa.milvus_summary_async.get_bot(None, bot_id))[0]
         bot_id, bot_name, desc, image, prompt, welcome, kb_ids_str, upload_time, user_id, llm_setting = bot_info
 
         # 验证知识库绑定
@@ -1565,13 +1756,13 @@ async def local_doc_chat(req: request):
     # 验证知识库
     if kb_ids:
         # 检查知识库是否存在
-        not_exist_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, kb_ids)
+        not_exist_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, kb_ids)
         if not_exist_kb_ids:
             return sanic_json({"code": 2003, "msg": "fail, knowledge Base {} not found".format(not_exist_kb_ids)})
 
         # 添加FAQ知识库
         faq_kb_ids = [kb + '_FAQ' for kb in kb_ids]
-        not_exist_faq_kb_ids = local_doc_qa.milvus_summary.check_kb_exist(user_id, faq_kb_ids)
+        not_exist_faq_kb_ids = await local_doc_qa.milvus_summary_async.check_kb_exist(user_id, faq_kb_ids)
         exist_faq_kb_ids = [kb for kb in faq_kb_ids if kb not in not_exist_faq_kb_ids]
         debug_logger.info("exist_faq_kb_ids: %s", exist_faq_kb_ids)
         kb_ids += exist_faq_kb_ids
@@ -1579,7 +1770,7 @@ async def local_doc_chat(req: request):
     # 检查知识库中是否有有效文件
     file_infos = []
     for kb_id in kb_ids:
-        file_infos.extend(local_doc_qa.milvus_summary.get_files(user_id, kb_id))
+        file_infos.extend(await local_doc_qa.milvus_summary_async.get_files(user_id, kb_id))
     valid_files = [fi for fi in file_infos if fi[2] == 'green']
     if len(valid_files) == 0:
         debug_logger.info("valid_files is empty, use only chat mode.")
@@ -1592,7 +1783,7 @@ async def local_doc_chat(req: request):
     # 更新知识库最近访问时间
     qa_timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
     for kb_id in kb_ids:
-        local_doc_qa.milvus_summary.update_knowledge_base_latest_qa_time(kb_id, qa_timestamp)
+        await local_doc_qa.milvus_summary_async.update_knowledge_base_latest_qa_time(kb_id, qa_timestamp)
 
     debug_logger.info("streaming: %s", streaming)
 
@@ -1659,8 +1850,8 @@ async def local_doc_chat(req: request):
                         'source_documents': source_documents,
                         'bot_id': bot_id
                     }
-                    local_doc_qa.milvus_summary.add_qalog(**chat_data)
-                    qa_logger.info("chat_data: %s", chat_data)
+                    # 问答记录放入后台队列批量写入，不阻塞[DONE]的返回
+                    await local_doc_qa.qalog_writer.submit(chat_data)
                     debug_logger.info("response: %s", chat_data['result'])
 
                     # 构建完成响应
@@ -1766,8 +1957,7 @@ async def local_doc_chat(req: request):
             }
 
             # 保存问答记录
-            local_doc_qa.milvus_summary.add_qalog(**chat_data)
-            qa_logger.info("chat_data: %s", chat_data)
+            await local_doc_qa.qalog_writer.submit(chat_data)
             debug_logger.info("response: %s", chat_data['result'])
 
             # 返回响应
@@ -1817,12 +2007,8 @@ async def get_doc_completed(req: request):
     page_limit = safe_get(req, 'page_limit', 10)  # 默认每页显示10条记录
 
     try:
-        # 获取文档分块数据
-        sorted_json_datas = local_doc_qa.milvus_summary.get_document_by_file_id(file_id)
-        chunks = [json_data['kwargs'] for json_data in sorted_json_datas]
-
-        # 计算分页信息
-        total_count = len(chunks)
+        # 计算分页信息，总数由count查询得到，不读取文档内容
+        total_count = await local_doc_qa.milvus_summary_async.get_document_count_by_file_id(file_id)
         total_pages = (total_count + page_limit - 1) // page_limit
 
         # 验证页码是否有效
@@ -1832,17 +2018,18 @@ async def get_doc_completed(req: request):
                 "msg": f'输入非法！page_id超过最大值，page_id: {page_id}，最大值：{total_pages}，请检查！'
             })
 
-        # 获取当前页数据
+        # 只从数据库读取当前页的分块
         start_index = (page_id - 1) * page_limit
-        end_index = start_index + page_limit
-        current_page_chunks = chunks[start_index:end_index]
+        sorted_json_datas = await local_doc_qa.milvus_summary_async.get_document_page_by_file_id(
+            file_id, start_index, page_limit)
+        current_page_chunks = [json_data['kwargs'] for json_data in sorted_json_datas]
 
         # 处理图片引用
         for chunk in current_page_chunks:
             chunk['page_content'] = replace_image_references(chunk['page_content'], file_id)
 
         # 获取文件路径
-        file_location = local_doc_qa.milvus_summary.get_file_location(file_id)
+        file_location = await local_doc_qa.milvus_summary_async.get_file_location(file_id)
         file_path = os.path.dirname(file_location) if file_location else ""
 
         # 返回成功响应
@@ -1912,19 +2099,12 @@ async def get_qa_info(req: request):
 
     if only_need_count:
         try:
-            need_info = ["timestamp"]
-            qa_infos = local_doc_qa.milvus_summary.get_qalog_by_filter(
-                need_info=need_info,
+            # 按天统计问答数量，在数据库中分组计数
+            qa_infos_by_day = await local_doc_qa.milvus_summary_async.get_qalog_count_by_day(
                 user_id=user_id,
                 time_range=time_range
             )
 
-            # 按天统计问答数量
-            qa_infos = sorted(qa_infos, key=lambda x: x['timestamp'])
-            qa_infos = [qa_info['timestamp'] for qa_info in qa_infos]
-            qa_infos = [qa_info[:10] for qa_info in qa_infos]
-            qa_infos_by_day = dict(Counter(qa_infos))
-
             return sanic_json({
                 "code": 200,
                 "msg": "success",
@@ -1949,44 +2129,43 @@ async def get_qa_info(req: request):
         ]
         need_info = safe_get(req, 'need_info', default_need_info)
         save_to_excel = safe_get(req, 'save_to_excel', False)
+        export_format = safe_get(req, 'export_format', 'xlsx')  # 导出格式：xlsx或csv
+        cursor = safe_get(req, 'cursor')  # 上一页返回的next_cursor，传入时按keyset翻页，忽略page_id
 
-        # 获取问答记录
-        qa_infos = local_doc_qa.milvus_summary.get_qalog_by_filter(
-            need_info=need_info,
-            user_id=user_id,
-            query=query,
-            bot_id=bot_id,
-            time_range=time_range,
-            any_kb_id=any_kb_id,
-            qa_ids=qa_ids
-        )
+        invalid_need_info = [info for info in need_info if info not in KnowledgeBaseManager.QALOG_INFO_COLUMNS]
+        if invalid_need_info:
+            return sanic_json({"code": 2002, "msg": f'输入非法！need_info包含不存在的字段：{invalid_need_info}，请检查！'})
+
+        filters = dict(user_id=user_id, query=query, bot_id=bot_id, time_range=time_range, any_kb_id=any_kb_id)
 
-        # 处理导出到Excel的情况
+        # 处理导出的情况
         if save_to_excel:
-            timestamp = datetime.now().strftime("%Y%m%d%H%M")
-            file_name = f"QAnything_QA_{timestamp}.xlsx"
-            file_path = export_qalogs_to_excel(qa_infos, need_info, file_name)
-            return await response.file(
-                file_path,
-                filename=file_name,
-                mime_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                headers={'Content-Disposition': f'attachment; filename="{file_name}"'}
-            )
+            if export_format not in ('xlsx', 'csv'):
+                return sanic_json({"code": 2002, "msg": f'输入非法！export_format只支持xlsx和csv，当前为{export_format}，请检查！'})
+            return await export_qa_info(local_doc_qa, need_info, filters, qa_ids, export_format)
 
         # 处理分页
-        total_count = len(qa_infos)
+        next_cursor = None
+        if qa_ids is not None:
+            qa_infos = await local_doc_qa.milvus_summary_async.get_qalog_by_filter(need_info=need_info, qa_ids=qa_ids)
+            total_count = len(qa_infos)
+        else:
+            total_count = await local_doc_qa.milvus_summary_async.get_qalog_count(**filters)
         total_pages = (total_count + page_limit - 1) // page_limit
 
-        if page_id > total_pages and total_count != 0:
+        if cursor is None and page_id > total_pages and total_count != 0:
             return sanic_json({
                 "code": 2002,
                 "msg": f'输入非法！page_id超过最大值，page_id: {page_id}，最大值：{total_pages}，请检查！'
             })
 
-        # 获取当前页数据
-        start_index = (page_id - 1) * page_limit
-        end_index = start_index + page_limit
-        current_qa_infos = qa_infos[start_index:end_index]
+        # 获取当前页数据，只从数据库读取本页的记录
+        if qa_ids is not None:
+            start_index = (page_id - 1) * page_limit
+            current_qa_infos = qa_infos[start_index:start_index + page_limit]
+        else:
+            current_qa_infos, next_cursor = await local_doc_qa.milvus_summary_async.get_qalog_page(
+                need_info, page_limit, cursor=cursor, offset=(page_id - 1) * page_limit, **filters)
 
         msg = f"检测到的Log总数为{total_count}, 本次返回page_id为{page_id}的数据，每页显示{page_limit}条"
 
@@ -1996,7 +2175,8 @@ async def get_qa_info(req: request):
             "page_id": page_id,
             "page_limit": page_limit,
             "qa_infos": current_qa_infos,
-            "total_count": total_count
+            "total_count": total_count,
+            "next_cursor": next_cursor  # 下一页的游标，没有更多数据时为None
         })
 
     except Exception as e:
@@ -2007,6 +2187,61 @@ async def get_qa_info(req: request):
         })
 
 
+async def iter_qa_info_batches(local_doc_qa, need_info, filters, qa_ids):
+    """按keyset分批读取要导出的问答记录，JSON列保持数据库中的原始字符串，不在内存中累积"""
+    if qa_ids is not None:
+        yield await local_doc_qa.milvus_summary_async.get_qalog_by_filter(need_info=need_info, qa_ids=qa_ids,
+                                                                          decode_json=False)
+        return
+    cursor = None
+    while True:
+        qa_infos, cursor = await local_doc_qa.milvus_summary_async.get_qalog_page(
+            need_info, QALOG_EXPORT_BATCH_SIZE, cursor=cursor, decode_json=False, **filters)
+        if qa_infos:
+            yield qa_infos
+        if cursor is None:
+            break
+
+
+async def export_qa_info(local_doc_qa, need_info, filters, qa_ids, export_format):
+    """
+    流式导出问答记录：csv边读边写入分块响应；
+    xlsx用openpyxl只写模式逐批写入文件（在工作线程中执行），完成后分块发送。
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M")
+    file_name = f"QAnything_QA_{timestamp}.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename="{file_name}"'}
+
+    if export_format == 'csv':
+        async def write_csv(response):
+            # 带BOM，Excel打开时能正确识别中文
+            await response.write('\ufeff')
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(need_info)
+            async for qa_infos in iter_qa_info_batches(local_doc_qa, need_info, filters, qa_ids):
+                writer.writerows(qalog_export_row(qa_info, need_info) for qa_info in qa_infos)
+                await response.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                await response.write(buffer.getvalue())
+
+        return ResponseStream(write_csv, headers=headers, content_type='text/csv; charset=utf-8')
+
+    excel_writer = QaLogExcelWriter(need_info, file_name)
+    async for qa_infos in iter_qa_info_batches(local_doc_qa, need_info, filters, qa_ids):
+        await asyncio.to_thread(excel_writer.write, qa_infos)
+    file_path = await asyncio.to_thread(excel_writer.save)
+    return await response.file_stream(
+        file_path,
+        chunk_size=1024 * 1024,
+        filename=file_name,
+        mime_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers=headers
+    )
+
+
 @get_time_async
 @auth_required("read", check_kb_access=True)
 async def get_random_qa(req: request):
@@ -2031,14 +2266,14 @@ async def get_random_qa(req: request):
         debug_logger.info(f"get_random_qa limit: {limit}, time_range: {time_range}")
 
         # 获取随机问答记录
-        qa_infos = local_doc_qa.milvus_summary.get_random_qa_infos(
+        qa_infos = await local_doc_qa.milvus_summary_async.get_random_qa_infos(
             limit=limit,
             time_range=time_range,
             need_info=need_info
         )
 
         # 获取统计信息
-        counts = local_doc_qa.milvus_summary.get_statistic(time_range=time_range)
+        counts = await local_doc_qa.milvus_summary_async.get_statistic(time_range=time_range)
 
         return sanic_json({
             "code": 200,
@@ -2070,62 +2305,59 @@ async def get_related_qa(req: request):
     # 获取其他参数
     need_info = safe_get(req, 'need_info')
     need_more = safe_get(req, 'need_more', False)
+    recent_cursor = safe_get(req, 'recent_cursor')  # 上次返回的recent_next_cursor，用于继续翻页
+    older_cursor = safe_get(req, 'older_cursor')  # 上次返回的older_next_cursor，用于继续翻页
     debug_logger.info("get_related_qa %s", qa_id)
 
     try:
         # 获取相关问答记录
-        qa_log, recent_logs, older_logs = local_doc_qa.milvus_summary.get_related_qa_infos(
-            qa_id,
-            need_info,
-            need_more
-        )
+        qa_log, recent_logs, older_logs, recent_next_cursor, older_next_cursor = \
+            await local_doc_qa.milvus_summary_async.get_related_qa_infos(
+                qa_id,
+                need_info,
+                need_more,
+                recent_cursor=recent_cursor,
+                older_cursor=older_cursor
+            )
 
-        # 处理最近的问答记录
+        # 按kb_ids分组
         recent_sections = defaultdict(list)
         for log in recent_logs:
             recent_sections[log['kb_ids']].append(log)
-
-        # 为最近的问答记录添加知识库名称
-        for i, kb_ids in enumerate(list(recent_sections.keys())):
-            try:
-                kb_names = local_doc_qa.milvus_summary.get_knowledge_base_name(json.loads(kb_ids))
-                kb_names = [kb_name for user_id, kb_id, kb_name in kb_names]
-                kb_names = ','.join(kb_names)
-                recent_sections[i] = recent_sections.pop(kb_ids)
-                for log in recent_sections[i]:
-                    log['kb_names'] = kb_names
-            except Exception as e:
-                debug_logger.error(f"Error processing recent kb_ids {kb_ids}: {str(e)}")
-                recent_sections[i] = recent_sections.pop(kb_ids)
-                for log in recent_sections[i]:
-                    log['kb_names'] = "未知知识库"
-
-        # 处理较早的问答记录
         older_sections = defaultdict(list)
         for log in older_logs:
             older_sections[log['kb_ids']].append(log)
 
-        # 为较早的问答记录添加知识库名称
-        for i, kb_ids in enumerate(list(older_sections.keys())):
+        # 一次查询所有分组涉及的知识库名称
+        section_kb_ids = {}
+        for kb_ids in list(recent_sections.keys()) + list(older_sections.keys()):
             try:
-                kb_names = local_doc_qa.milvus_summary.get_knowledge_base_name(json.loads(kb_ids))
-                kb_names = [kb_name for user_id, kb_id, kb_name in kb_names]
-                kb_names = ','.join(kb_names)
-                older_sections[i] = older_sections.pop(kb_ids)
-                for log in older_sections[i]:
-                    log['kb_names'] = kb_names
+                section_kb_ids[kb_ids] = json.loads(kb_ids)
             except Exception as e:
-                debug_logger.error(f"Error processing older kb_ids {kb_ids}: {str(e)}")
-                older_sections[i] = older_sections.pop(kb_ids)
-                for log in older_sections[i]:
-                    log['kb_names'] = "未知知识库"
+                debug_logger.error(f"Error processing kb_ids {kb_ids}: {str(e)}")
+        all_kb_ids = list({kb_id for kb_id_list in section_kb_ids.values() for kb_id in kb_id_list})
+        kb_infos = await local_doc_qa.milvus_summary_async.get_knowledge_base_name(all_kb_ids)
+        kb_name_map = {kb_id: kb_name for user_id, kb_id, kb_name in kb_infos or []}
+
+        # 为问答记录添加知识库名称，分组的key改为序号
+        for sections in (recent_sections, older_sections):
+            for i, kb_ids in enumerate(list(sections.keys())):
+                if kb_ids in section_kb_ids:
+                    kb_names = ','.join(kb_name_map[kb_id] for kb_id in section_kb_ids[kb_ids] if kb_id in kb_name_map)
+                else:
+                    kb_names = "未知知识库"
+                sections[i] = sections.pop(kb_ids)
+                for log in sections[i]:
+                    log['kb_names'] = kb_names
 
         return sanic_json({
             "code": 200,
             "msg": "success",
             "qa_info": qa_log,
             "recent_sections": recent_sections,
-            "older_sections": older_sections
+            "older_sections": older_sections,
+            "recent_next_cursor": recent_next_cursor,  # 下一页的游标，没有更多数据时为None
+            "older_next_cursor": older_next_cursor
         })
 
     except Exception as e:
@@ -2143,7 +2375,7 @@ async def get_user_id(req: request):
     kb_id = safe_get(req, 'kb_id')
     kb_id = correct_kb_id(kb_id)
     debug_logger.info("kb_id: {}".format(kb_id))
-    user_id = local_doc_qa.milvus_summary.get_user_by_kb_id(kb_id)
+    user_id = await local_doc_qa.milvus_summary_async.get_user_by_kb_id(kb_id)
     if not user_id:
         return sanic_json({"code": 2003, "msg": "fail, knowledge Base {} not found".format(kb_id)})
     else:
@@ -2158,7 +2390,7 @@ async def get_doc(req: request):
     debug_logger.info("get_doc %s", doc_id)
     if not doc_id:
         return sanic_json({"code": 2005, "msg": "fail, doc_id is None"})
-    doc_json_data = local_doc_qa.milvus_summary.get_document_by_doc_id(doc_id)
+    doc_json_data = await local_doc_qa.milvus_summary_async.get_document_by_doc_id(doc_id)
     return sanic_json({"code": 200, "msg": "success", "doc_text": doc_json_data['kwargs']})
 
 
@@ -2187,7 +2419,7 @@ async def get_user_status(req: request):
     local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
     user_id = safe_get(req, 'user_id')
     debug_logger.info("get_user_status %s", user_id)
-    user_status = local_doc_qa.milvus_summary.get_user_status(user_id)
+    user_status = await local_doc_qa.milvus_summary_async.get_user_status(user_id)
     if user_status is None:
         return sanic_json({"code": 2003, "msg": "fail, user {} not found".format(user_id)})
     if user_status == 0:
@@ -2206,12 +2438,6 @@ async def update_chunks(req: request):
     doc_id = safe_get(req, 'doc_id')
     debug_logger.info(f"doc_id: {doc_id}")
     
-    # 检查是否有正在处理的文件
-    yellow_files = local_doc_qa.milvus_summary.get_files_by_status("yellow")
-    if len(yellow_files) > 0:
-        return sanic_json({"code": 2002,
-                           "msg": f"fail, currently, there are {len(yellow_files)} files being parsed, please wait for all files to finish parsing before updating the chunk."})
-    
     # 获取更新内容和分块大小
     update_content = safe_get(req, 'update_content')
     debug_logger.info(f"update_content: {update_content}")
@@ -2226,18 +2452,43 @@ async def update_chunks(req: request):
                                                 f"the max tokens is {chunk_size}"})
     
     # 获取文档信息
-    doc_json = local_doc_qa.milvus_summary.get_document_by_doc_id(doc_id)
+    doc_json = await local_doc_qa.milvus_summary_async.get_document_by_doc_id(doc_id)
     if not doc_json:
         return sanic_json({"code": 2004, "msg": "fail, DocId {} not found".format(doc_id)})
     
+    # 只检查本文件是否正在解析，其他文件的入库不影响更新
+    metadata = doc_json['kwargs']['metadata']
+    file_status = await local_doc_qa.milvus_summary_async.check_file_exist(user_id, metadata.get('kb_id'),
+                                                                          [metadata.get('file_id')])
+    if file_status and file_status[0][1] == 'yellow':
+        return sanic_json({"code": 2002, "msg": "fail, the file of DocId {} is being parsed, please wait for it to "
+                                                "finish parsing before updating the chunk.".format(doc_id)})
+
+    # 修改前先标记，修改过程中该文件也不会被其他用户上传的相同文件选为去重来源
+    await local_doc_qa.milvus_summary_async.mark_file_edited(metadata.get('file_id'))
+
+    # 增量更新：只对内容变化的子chunk重新embedding，按doc_id定向更新Milvus、ES和父文档
+    try:
+        time_record = await local_doc_qa.retriever.update_document_incremental(doc_id, doc_json, update_content,
+                                                                               chunk_size)
+    except Exception as e:
+        debug_logger.error(f"增量更新文档时出错: {str(e)}")
+        return sanic_json({"code": 5000, "msg": f"Failed to update document: {str(e)}"})
+    if time_record is not None:
+        await local_doc_qa.milvus_summary_async.add_chunks_number(
+            metadata.get('file_id'), time_record['added_chunks'] - time_record['deleted_chunks'])
+        return sanic_json({"code": 200, "msg": "success update doc_id {}".format(doc_id), "time_record": time_record})
+
+    # 向量库中没有这个父文档的子chunk（例如之前入库失败），按完整流程重新插入
     # 创建新文档对象
-    doc = Document(page_content=update_content, metadata=doc_json['kwargs']['metadata'])
+    doc = Document(page_content=update_content, metadata=metadata)
     doc.metadata['doc_id'] = doc_id
     
     # 更新数据库中的文档
-    local_doc_qa.milvus_summary.update_document(doc_id, update_content)
+    await local_doc_qa.milvus_summary_async.update_document(doc_id, update_content)
     
     # 从向量库中删除旧文档
+    deleted_chunks = 0
     try:
         expr = f'doc_id == "{doc_id}"'
         debug_logger.info(f"删除向量库中的文档，表达式: {expr}")
@@ -2253,17 +2504,21 @@ async def update_chunks(req: request):
             debug_logger.warning(f"未找到匹配表达式 '{expr}' 的文档")
         else:
             debug_logger.info(f"找到 {len(chunks)} 个匹配的文档")
-            local_doc_qa.milvus_kb.delete_expr(expr)
+            local_doc_qa.milvus_kb.delete_expr(expr, raise_error=True)
+            deleted_chunks = len(chunks)
     except Exception as e:
         debug_logger.error(f"删除向量库文档时出错: {str(e)}")
         # 继续执行，不中断流程
     
     # 插入新文档到向量库
     try:
-        await local_doc_qa.retriever.insert_documents([doc], chunk_size, True)
+        added_chunks, _ = await local_doc_qa.retriever.insert_documents([doc], chunk_size, True)
     except Exception as e:
         debug_logger.error(f"插入新文档到向量库时出错: {str(e)}")
+        await local_doc_qa.milvus_summary_async.add_chunks_number(metadata.get('file_id'), -deleted_chunks)
         return sanic_json({"code": 5000, "msg": f"Failed to insert document: {str(e)}"})
+    await local_doc_qa.milvus_summary_async.add_chunks_number(metadata.get('file_id'),
+                                                              added_chunks - deleted_chunks)
     
     return sanic_json({"code": 200, "msg": "success update doc_id {}".format(doc_id)})
 
@@ -2274,11 +2529,91 @@ async def get_file_base64(req: request):
     local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
     file_id = safe_get(req, 'file_id')
     debug_logger.info("get_file_base64 %s", file_id)
-    file_location = local_doc_qa.milvus_summary.get_file_location(file_id)
+    file_location = await local_doc_qa.milvus_summary_async.get_file_location(file_id)
     debug_logger.info("file_location %s", file_location)
     # file_location = '/home/liujx/Downloads/2021-08-01 00:00:00.pdf'
     if not file_location:
         return sanic_json({"code": 2005, "msg": "fail, file_id is Invalid"})
-    with open(file_location, "rb") as f:
-        file_base64 = base64.b64encode(f.read()).decode()
+    # 大文件整体读入再base64会占用数倍文件大小的内存，改用download_file流式下载
+    file_size = os.path.getsize(file_location)
+    if file_size > FILE_BASE64_MAX_SIZE:
+        return sanic_json({"code": 2003, "msg": f"fail, file size {file_size} exceeds {FILE_BASE64_MAX_SIZE}, "
+                                                f"please use /api/local_doc_qa/download_file"})
+
+    def read_base64():
+        with open(file_location, "rb") as f:
+            return base64.b64encode(f.read()).decode()
+
+    file_base64 = await asyncio.to_thread(read_base64)
     return sanic_json({"code": 200, "msg": "success", "file_base64": file_base64})
+
+
+@get_time_async
+@auth_required("read", check_kb_access=True)
+async def download_file(req: request):
+    """
+    分块流式下载上传的原始文件，支持Range请求（断点续传、大文件预览按需读取）和ETag/Last-Modified条件请求，
+    worker内存占用与文件大小无关。文件所属知识库需要有read权限。
+    """
+    local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
+    user_id = safe_get(req, 'user_id')
+    file_id = safe_get(req, 'file_id')
+    # True时浏览器下载，否则内联预览；GET参数是字符串，按'true'判断
+    as_attachment = str(safe_get(req, 'attachment', False)).lower() == 'true'
+    debug_logger.info("download_file %s", file_id)
+    if not file_id:
+        return sanic_json({"code": 2005, "msg": "fail, file_id is None"})
+
+    file_info = await local_doc_qa.milvus_summary_async.get_file_download_info(file_id)
+    if not file_info:
+        return sanic_json({"code": 2005, "msg": "fail, file_id is Invalid"})
+    kb_id, file_name, file_location = file_info
+    if await permission_resolver.denied_kb_ids(local_doc_qa.milvus_summary_async, user_id, [kb_id], "read"):
+        return sanic_json({"code": 403, "msg": f"没有权限read访问知识库 {kb_id}"})
+
+    # 只允许下载上传目录中的文件，FAQ、URL等没有原始文件
+    upload_root = os.path.realpath(UPLOAD_ROOT_PATH)
+    file_path = os.path.realpath(file_location)
+    if not file_path.startswith(upload_root + os.sep) or not os.path.isfile(file_path):
+        return sanic_json({"code": 2005, "msg": "fail, original file not found"})
+
+    stats = await asyncio.to_thread(os.stat, file_path)
+    etag = f'"{stats.st_size:x}-{stats.st_mtime_ns:x}"'
+    last_modified = datetime.utcfromtimestamp(int(stats.st_mtime))
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": "{}; filename*=UTF-8''{}".format(
+            "attachment" if as_attachment else "inline", urllib.parse.quote(file_name)),
+    }
+
+    # 条件请求：文件未变化时返回304
+    if_none_match = req.headers.get("If-None-Match")
+    if_modified_since = req.headers.get("If-Modified-Since")
+    if if_none_match:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return response.empty(status=304, headers=headers)
+    elif if_modified_since:
+        try:
+            if last_modified <= datetime.strptime(if_modified_since, "%a, %d %b %Y %H:%M:%S GMT"):
+                return response.empty(status=304, headers=headers)
+        except ValueError:
+            pass
+
+    # Range请求返回206和对应的字节区间；If-Range与当前文件不一致时返回完整文件
+    _range = None
+    if_range = req.headers.get("If-Range")
+    if if_range is None or if_range.strip() in (etag, headers["Last-Modified"]):
+        try:
+            _range = ContentRangeHandler(req, stats)
+        except HeaderNotFound:
+            _range = None
+        except (InvalidRangeType, RangeNotSatisfiable):
+            # 在handler内处理，不交给auth_required的异常处理（会被当成认证失败）
+            return response.empty(status=416, headers={"Content-Range": f"bytes */{stats.st_size}"})
+
+    mime_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    return await response.file_stream(file_path, chunk_size=FILE_DOWNLOAD_CHUNK_SIZE, mime_type=mime_type,
+                                      headers=headers, _range=_range)
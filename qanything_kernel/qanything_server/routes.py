@@ -19,6 +19,7 @@ api_bp.add_route(handler.health_check, "/health_check", methods=['GET'])  # tags
 local_doc_qa_bp.add_route(kb.new_knowledge_base, "/new_knowledge_base", methods=['POST'])  # tags=["新建知识库"]
 local_doc_qa_bp.add_route(kb.upload_weblink, "/upload_weblink", methods=['POST'])  # tags=["上传网页链接"]
 local_doc_qa_bp.add_route(kb.upload_files, "/upload_files", methods=['POST'])  # tags=["上传文件"]
+local_doc_qa_bp.add_route(kb.upload_files_stream, "/upload_files_stream", methods=['POST'], stream=True)  # tags=["流式上传文件"]
 local_doc_qa_bp.add_route(kb.upload_faqs, "/upload_faqs", methods=['POST'])  # tags=["上传FAQ"]
 local_doc_qa_bp.add_route(kb.local_doc_chat, "/local_doc_chat", methods=['POST'])  # tags=["知识库问答"]
 local_doc_qa_bp.add_route(kb.list_docs, "/list_files", methods=['POST'])  # tags=["文件列表"]
@@ -26,6 +27,7 @@ local_doc_qa_bp.add_route(kb.get_total_status, "/get_total_status", methods=['PO
 local_doc_qa_bp.add_route(kb.clean_files_by_status, "/clean_files_by_status", methods=['POST'])  # tags=["清理文件"]
 local_doc_qa_bp.add_route(kb.delete_docs, "/delete_files", methods=['POST'])  # tags=["删除文件"]
 local_doc_qa_bp.add_route(kb.delete_knowledge_base, "/delete_knowledge_base", methods=['POST'])  # tags=["删除知识库"]
+local_doc_qa_bp.add_route(kb.get_delete_jobs, "/get_delete_jobs", methods=['POST'])  # tags=["删除任务进度"]
 local_doc_qa_bp.add_route(kb.rename_knowledge_base, "/rename_knowledge_base", methods=['POST'])  # tags=["重命名知识库"]
 local_doc_qa_bp.add_route(kb.get_doc_completed, "/get_doc_completed", methods=['POST'])  # tags=["获取文档完整内容"]
 local_doc_qa_bp.add_route(kb.get_qa_info, "/get_qa_info", methods=['POST'])  # tags=["获取QA信息"]
@@ -37,6 +39,9 @@ local_doc_qa_bp.add_route(kb.get_random_qa, "/get_random_qa", methods=['POST'])
 local_doc_qa_bp.add_route(kb.get_related_qa, "/get_related_qa", methods=['POST'])  # tags=["获取相关QA"]
 local_doc_qa_bp.add_route(kb.update_chunks, "/update_chunks", methods=['POST'])  # tags=["更新文档块"]
 local_doc_qa_bp.add_route(kb.get_file_base64, "/get_file_base64", methods=['POST'])  # tags=["获取文件Base64"]
+local_doc_qa_bp.add_route(kb.download_file, "/download_file", methods=['GET', 'POST'])  # tags=["下载原始文件"]
+local_doc_qa_bp.add_route(kb.clone_knowledge_base, "/clone_knowledge_base", methods=['POST'])  # tags=["复制知识库"]
+local_doc_qa_bp.add_route(kb.copy_files, "/copy_files", methods=['POST'])  # tags=["复制或移动文件"]
 
 # 机器人相关路由
 bot_bp.add_route(bot.new_bot, "/new_bot", methods=['POST'])  # tags=["创建机器人"]
@@ -19,10 +19,12 @@ sys.path.append(root_dir)
 
 from qanything_kernel.qanything_server.routes import register_routes
 from qanything_kernel.core.local_doc_qa import LocalDocQA
+from qanything_kernel.core.retriever.vectorstore import flush_all_collections
 from sanic.worker.manager import WorkerManager
 from sanic import Sanic
 from sanic_ext import Extend
 import time
+import asyncio
 import argparse
 import webbrowser
 from sanic.exceptions import SanicException, NotFound
@@ -78,10 +80,21 @@ async def init_local_doc_qa(app, loop):
     start = time.time()
     local_doc_qa = LocalDocQA(args.port)
     local_doc_qa.init_cfg(args)
+    await local_doc_qa.milvus_summary_async.init(loop)
+    local_doc_qa.qalog_writer.start()
+    local_doc_qa.delete_job_worker.start()
     end = time.time()
     print(f'init local_doc_qa cost {end - start}s', flush=True)
     app.ctx.local_doc_qa = local_doc_qa
     
+@app.after_server_stop
+async def close_local_doc_qa(app, loop):
+    # 先写完队列中的问答记录再关闭连接池
+    await app.ctx.local_doc_qa.qalog_writer.close()
+    await app.ctx.local_doc_qa.delete_job_worker.close()
+    await asyncio.to_thread(flush_all_collections)
+    await app.ctx.local_doc_qa.milvus_summary_async.close()
+
 @app.after_server_start
 async def notify_server_started(app, loop):
     print(f"Server Start Cost {time.time() - start_time} seconds", flush=True)
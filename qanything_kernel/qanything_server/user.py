@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 import bcrypt
 from qanything_kernel.qanything_server.handler import auth_required
@@ -27,19 +28,19 @@ async def create_user(req: request):
     
     # 检查用户名是否已存在
     query = "SELECT user_id FROM User WHERE user_name = %s"
-    if local_doc_qa.milvus_summary.execute_query_(query, (user_name,), fetch=True):
+    if await local_doc_qa.milvus_summary_async.execute_query_(query, (user_name,), fetch=True):
         return sanic_json({"code": 400, "msg": "该用户名已被使用"})
     
     # 检查邮箱是否已存在
     if email:
         query = "SELECT user_id FROM User WHERE email = %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (email,), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (email,), fetch=True):
             return sanic_json({"code": 400, "msg": "该邮箱已被注册"})
     
     # 如果指定了部门，检查部门是否存在
     if dept_id:
         query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-        if not local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+        if not await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
             return sanic_json({"code": 404, "msg": "部门不存在"})
     
     # 生成唯一的用户ID
@@ -54,7 +55,7 @@ async def create_user(req: request):
         VALUES (%s, %s, %s, %s, %s, %s, 'active')
     """
     try:
-        local_doc_qa.milvus_summary.execute_query_(
+        await local_doc_qa.milvus_summary_async.execute_query_(
             query, (new_user_id, user_name, email, hashed_password, dept_id, role), commit=True
         )
         
@@ -81,6 +82,9 @@ async def list_users(req: request):
     local_doc_qa: LocalDocQA = req.app.ctx.local_doc_qa
     user_id = safe_get(req, 'user_id')
     
+    page_id = safe_get(req, 'page_id')  # 可选分页参数，不传时返回全部用户
+    page_limit = safe_get(req, 'page_limit', 100)
+
     # 获取所有用户的基本信息
     query = """
         SELECT u.user_id, u.user_name, u.email, u.role, u.dept_id, u.status, 
@@ -90,80 +94,36 @@ async def list_users(req: request):
         WHERE u.status = %s
         ORDER BY u.creation_time DESC
     """
-    users = local_doc_qa.milvus_summary.execute_query_(query, ("active",), fetch=True)
-    
+    params = ("active",)
+    if page_id is not None:
+        query += " LIMIT %s OFFSET %s"
+        params += (page_limit, (page_id - 1) * page_limit)
+    users = await local_doc_qa.milvus_summary_async.execute_query_(query, params, fetch=True) or []
+
+    # 按本页的用户批量加载用户组、拥有的知识库和各类授权，查询次数与用户数无关
+    mysql_client = local_doc_qa.milvus_summary_async
+    user_ids = [user[0] for user in users]
+    dept_ids = list({user[4] for user in users if user[4]})
+    groups_by_user = await mysql_client.get_groups_by_user_ids(user_ids)
+    group_ids = list({group[0] for groups in groups_by_user.values() for group in groups})
+    owned_kbs_by_user, direct_access_by_user, dept_access_by_dept, group_access_by_group = await asyncio.gather(
+        mysql_client.get_owned_kbs_by_user_ids(user_ids),
+        mysql_client.get_kb_access_by_subject_ids('user', user_ids),
+        mysql_client.get_kb_access_by_subject_ids('department', dept_ids),
+        mysql_client.get_kb_access_by_subject_ids('group', group_ids))
+
     result = []
     for user in users:
         current_user_id = user[0]
-        
-        # 获取用户所属的用户组
-        groups_query = """
-            SELECT g.group_id, g.group_name, gm.creation_time as join_time
-            FROM GroupMember gm
-            JOIN UserGroup g ON gm.group_id = g.group_id
-            WHERE gm.user_id = %s
-            ORDER BY gm.creation_time DESC
-        """
-        user_groups = local_doc_qa.milvus_summary.execute_query_(groups_query, (current_user_id,), fetch=True)
-        
-        # 查询用户拥有的知识库
-        owned_kb_query = """
-            SELECT kb_id, kb_name, latest_insert_time
-            FROM KnowledgeBase
-            WHERE user_id = %s
-            AND deleted = 0
-            ORDER BY latest_insert_time DESC
-        """
-        owned_kbs = local_doc_qa.milvus_summary.execute_query_(owned_kb_query, (current_user_id,), fetch=True)
-        
-        # 查询用户直接拥有的权限
-        direct_access_query = """
-            SELECT kb.kb_id, kb.kb_name, kba.permission_type,
-                   kba.granted_by, u.user_name as granted_by_name,
-                   kba.granted_at
-            FROM KnowledgeBaseAccess kba
-            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
-            LEFT JOIN User u ON kba.granted_by = u.user_id
-            WHERE kba.subject_type = 'user' 
-            AND kba.subject_id = %s
-            AND kb.deleted = 0
-            ORDER BY kba.granted_at DESC
-        """
-        direct_access = local_doc_qa.milvus_summary.execute_query_(direct_access_query, (current_user_id,), fetch=True)
-        
-        # 查询用户通过部门获得的权限
-        dept_access_query = """
-            SELECT kb.kb_id, kb.kb_name, kba.permission_type,
-                   kba.granted_by, u.user_name as granted_by_name,
-                   kba.granted_at
-            FROM KnowledgeBaseAccess kba
-            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
-            LEFT JOIN User u ON kba.granted_by = u.user_id
-            WHERE kba.subject_type = 'department' 
-            AND kba.subject_id = %s
-            AND kb.deleted = 0
-            ORDER BY kba.granted_at DESC
-        """
-        dept_access = local_doc_qa.milvus_summary.execute_query_(dept_access_query, (user[4],), fetch=True) if user[4] else []
-        
-        # 查询用户通过用户组获得的权限
-        group_access_query = """
-            SELECT kb.kb_id, kb.kb_name, kba.permission_type,
-                   kba.granted_by, u.user_name as granted_by_name,
-                   kba.granted_at,
-                   g.group_id, g.group_name
-            FROM GroupMember gm
-            JOIN UserGroup g ON gm.group_id = g.group_id
-            JOIN KnowledgeBaseAccess kba ON kba.subject_id = g.group_id
-            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
-            LEFT JOIN User u ON kba.granted_by = u.user_id
-            WHERE gm.user_id = %s
-            AND kba.subject_type = 'group'
-            AND kb.deleted = 0
-            ORDER BY kba.granted_at DESC
-        """
-        group_access = local_doc_qa.milvus_summary.execute_query_(group_access_query, (current_user_id,), fetch=True)
-        
+        user_groups = groups_by_user.get(current_user_id, [])
+        owned_kbs = owned_kbs_by_user.get(current_user_id, [])
+        direct_access = direct_access_by_user.get(current_user_id, [])
+        dept_access = dept_access_by_dept.get(user[4], []) if user[4] else []
+        # 用户组权限：合并用户所在各组的授权，按授权时间倒序
+        group_access = [acc + (group[0], group[1]) for group in user_groups
+                        for acc in group_access_by_group.get(group[0], [])]
+        group_access.sort(key=lambda acc: (acc[5] is not None, acc[5] or 0), reverse=True)
+
         result.append({
             "user_id": user[0],
             "user_name": user[1],
@@ -233,7 +193,14 @@ async def list_users(req: request):
             }
         })
     
-    return sanic_json({"code": 200, "msg": "获取用户列表成功", "data": result})
+    res = {"code": 200, "msg": "获取用户列表成功", "data": result}
+    if page_id is not None:
+        count_result = await local_doc_qa.milvus_summary_async.execute_query_(
+            "SELECT COUNT(*) FROM User WHERE status = %s", ("active",), fetch=True)
+        res["total"] = count_result[0][0] if count_result else 0
+        res["page_id"] = page_id
+        res["page_limit"] = page_limit
+    return sanic_json(res)
 
 
 @get_time_async
@@ -255,13 +222,13 @@ async def update_user(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id FROM User WHERE user_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不存在"})
     
     # 如果指定了部门，检查部门是否存在
     if dept_id:
         query = "SELECT dept_id FROM Department WHERE dept_id = %s"
-        if not local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True):
+        if not await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True):
             return sanic_json({"code": 404, "msg": "部门不存在"})
     
     # 构建更新语句
@@ -271,7 +238,7 @@ async def update_user(req: request):
     if user_name:
         # 检查用户名是否已被其他用户使用
         query = "SELECT user_id FROM User WHERE user_name = %s AND user_id != %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (user_name, target_user_id), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (user_name, target_user_id), fetch=True):
             return sanic_json({"code": 400, "msg": "该用户名已被其他用户使用"})
         update_fields.append("user_name = %s")
         params.append(user_name)
@@ -279,7 +246,7 @@ async def update_user(req: request):
     if email:
         # 检查邮箱是否已被其他用户使用
         query = "SELECT user_id FROM User WHERE email = %s AND user_id != %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (email, target_user_id), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (email, target_user_id), fetch=True):
             return sanic_json({"code": 400, "msg": "该邮箱已被其他用户使用"})
         update_fields.append("email = %s")
         params.append(email)
@@ -310,7 +277,7 @@ async def update_user(req: request):
     params.append(target_user_id)
     
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, tuple(params), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, tuple(params), commit=True)
         return sanic_json({"code": 200, "msg": "用户信息更新成功"})
     except Exception as e:
         debug_logger.error(f"更新用户信息失败: {str(e)}")
@@ -330,7 +297,7 @@ async def delete_user(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id FROM User WHERE user_id = %s AND status = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id, "active"), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id, "active"), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不存在"})
     
     # 不允许删除自己
@@ -340,15 +307,15 @@ async def delete_user(req: request):
     # 将用户状态设为inactive
     query = "UPDATE User SET status = 'inactive' WHERE user_id = %s"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), commit=True)
         
         # 从所有用户组中移除该用户
         query = "DELETE FROM GroupMember WHERE user_id = %s"
-        local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), commit=True)
         
         # 删除该用户的所有知识库权限
         query = "DELETE FROM KnowledgeBaseAccess WHERE subject_id = %s AND subject_type = 'user'"
-        local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), commit=True)
         
         return sanic_json({"code": 200, "msg": "用户删除成功"})
     except Exception as e:
@@ -370,7 +337,7 @@ async def reset_user_password(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id FROM User WHERE user_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不存在"})
     
     # 对新密码进行哈希处理
@@ -379,7 +346,7 @@ async def reset_user_password(req: request):
     # 更新密码
     query = "UPDATE User SET password = %s WHERE user_id = %s"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (hashed_password, target_user_id), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (hashed_password, target_user_id), commit=True)
         return sanic_json({"code": 200, "msg": "用户密码重置成功"})
     except Exception as e:
         debug_logger.error(f"重置用户密码失败: {str(e)}")
@@ -405,12 +372,12 @@ async def set_user_kb_access(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id FROM User WHERE user_id = %s AND status = 'active'"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不存在或已被禁用"})
     
     # 检查知识库是否存在
     query = "SELECT kb_id FROM KnowledgeBase WHERE kb_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "知识库不存在"})
     
     try:
@@ -419,7 +386,7 @@ async def set_user_kb_access(req: request):
             SELECT id FROM KnowledgeBaseAccess 
             WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
         """
-        existing_access = local_doc_qa.milvus_summary.execute_query_(
+        existing_access = await local_doc_qa.milvus_summary_async.execute_query_(
             query, (kb_id, target_user_id), fetch=True
         )
         
@@ -430,7 +397,7 @@ async def set_user_kb_access(req: request):
                     DELETE FROM KnowledgeBaseAccess 
                     WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
                 """
-                local_doc_qa.milvus_summary.execute_query_(
+                await local_doc_qa.milvus_summary_async.execute_query_(
                     delete_query, (kb_id, target_user_id), commit=True
                 )
                 return sanic_json({"code": 200, "msg": "已移除用户的知识库访问权限"})
@@ -444,7 +411,7 @@ async def set_user_kb_access(req: request):
                     UPDATE KnowledgeBaseAccess SET permission_type = %s, granted_by = %s
                     WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
                 """
-                local_doc_qa.milvus_summary.execute_query_(
+                await local_doc_qa.milvus_summary_async.execute_query_(
                     update_query, (permission_type, admin_user_id, kb_id, target_user_id), commit=True
                 )
                 return sanic_json({"code": 200, "msg": f"用户权限已更新为{permission_type}"})
@@ -455,7 +422,7 @@ async def set_user_kb_access(req: request):
                     (kb_id, subject_type, subject_id, permission_type, granted_by)
                     VALUES (%s, %s, %s, %s, %s)
                 """
-                local_doc_qa.milvus_summary.execute_query_(
+                await local_doc_qa.milvus_summary_async.execute_query_(
                     insert_query, (kb_id, 'user', target_user_id, permission_type, admin_user_id), commit=True
                 )
                 return sanic_json({"code": 200, "msg": f"已授予用户{permission_type}权限"})
@@ -478,7 +445,7 @@ async def batch_set_user_kb_access(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id FROM User WHERE user_id = %s AND status = 'active'"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不存在或已被禁用"})
     
     success_count = 0
@@ -505,7 +472,7 @@ async def batch_set_user_kb_access(req: request):
         
         # 检查知识库是否存在
         query = "SELECT kb_id FROM KnowledgeBase WHERE kb_id = %s"
-        if not local_doc_qa.milvus_summary.execute_query_(query, (kb_id,), fetch=True):
+        if not await local_doc_qa.milvus_summary_async.execute_query_(query, (kb_id,), fetch=True):
             failed_list.append({
                 "kb_id": kb_id,
                 "reason": "知识库不存在"
@@ -518,7 +485,7 @@ async def batch_set_user_kb_access(req: request):
                 SELECT id FROM KnowledgeBaseAccess 
                 WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
             """
-            existing_access = local_doc_qa.milvus_summary.execute_query_(
+            existing_access = await local_doc_qa.milvus_summary_async.execute_query_(
                 query, (kb_id, target_user_id), fetch=True
             )
             
@@ -529,7 +496,7 @@ async def batch_set_user_kb_access(req: request):
                         DELETE FROM KnowledgeBaseAccess 
                         WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         delete_query, (kb_id, target_user_id), commit=True
                     )
             else:
@@ -540,7 +507,7 @@ async def batch_set_user_kb_access(req: request):
                         UPDATE KnowledgeBaseAccess SET permission_type = %s, granted_by = %s
                         WHERE kb_id = %s AND subject_type = 'user' AND subject_id = %s
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         update_query, (permission_type, admin_user_id, kb_id, target_user_id), commit=True
                     )
                 else:
@@ -550,7 +517,7 @@ async def batch_set_user_kb_access(req: request):
                         (kb_id, subject_type, subject_id, permission_type, granted_by)
                         VALUES (%s, %s, %s, %s, %s)
                     """
-                    local_doc_qa.milvus_summary.execute_query_(
+                    await local_doc_qa.milvus_summary_async.execute_query_(
                         insert_query, (kb_id, 'user', target_user_id, permission_type, admin_user_id), commit=True
                     )
             
@@ -586,7 +553,7 @@ async def get_user_kb_access(req: request):
     
     # 检查用户是否存在
     query = "SELECT user_id, user_name, dept_id, role FROM User WHERE user_id = %s"
-    user_info = local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True)
+    user_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True)
     if not user_info:
         return sanic_json({"code": 404, "msg": "用户不存在"})
     
@@ -601,27 +568,27 @@ async def get_user_kb_access(req: request):
         JOIN UserGroup g ON m.group_id = g.group_id
         WHERE m.user_id = %s
     """
-    user_groups = local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True)
+    user_groups = await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True)
     groups = [{"group_id": g[0], "group_name": g[1]} for g in user_groups]
     
     # 获取部门信息
     dept_name = None
     if dept_id:
         query = "SELECT dept_name FROM Department WHERE dept_id = %s"
-        dept_info = local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True)
+        dept_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True)
         if dept_info:
             dept_name = dept_info[0][0]
     
     # 获取所有知识库
     query = "SELECT kb_id, kb_name, owner_id FROM KnowledgeBase ORDER BY creation_time DESC"
-    all_kbs = local_doc_qa.milvus_summary.execute_query_(query, (), fetch=True)
+    all_kbs = await local_doc_qa.milvus_summary_async.execute_query_(query, (), fetch=True)
     
     # 获取用户直接权限
     query = """
         SELECT kb_id, permission_type FROM KnowledgeBaseAccess 
         WHERE subject_type = 'user' AND subject_id = %s
     """
-    user_access = local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True)
+    user_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True)
     user_access_dict = {a[0]: a[1] for a in user_access}
     
     # 获取部门权限
@@ -631,18 +598,24 @@ async def get_user_kb_access(req: request):
             SELECT kb_id, permission_type FROM KnowledgeBaseAccess 
             WHERE subject_type = 'department' AND subject_id = %s
         """
-        dept_access = local_doc_qa.milvus_summary.execute_query_(query, (dept_id,), fetch=True)
+        dept_access = await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id,), fetch=True)
         dept_access_dict = {a[0]: a[1] for a in dept_access}
     
     # 获取用户组权限
     group_access_dict = {}
+    group_access_by_group = {}
+    if groups:
+        # 一次查询所有用户组的授权，再按用户组顺序合并
+        query = """
+            SELECT subject_id, kb_id, permission_type FROM KnowledgeBaseAccess 
+            WHERE subject_type = 'group' AND subject_id IN ({})
+        """.format(','.join(['%s'] * len(groups)))
+        group_ids = [group["group_id"] for group in groups]
+        for a in await local_doc_qa.milvus_summary_async.execute_query_(query, group_ids, fetch=True) or []:
+            group_access_by_group.setdefault(a[0], []).append(a[1:])
     for group in groups:
         group_id = group["group_id"]
-        query = """
-            SELECT kb_id, permission_type FROM KnowledgeBaseAccess 
-            WHERE subject_type = 'group' AND subject_id = %s
-        """
-        group_access = local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True)
+        group_access = group_access_by_group.get(group_id, [])
         for a in group_access:
             kb_id, level = a
             if kb_id not in group_access_dict or level > group_access_dict[kb_id]["level"]:
@@ -748,7 +721,7 @@ async def get_accessible_kbs(req: request):
             WHERE deleted = 0
             ORDER BY latest_insert_time DESC
         """
-        kbs = local_doc_qa.milvus_summary.execute_query_(query, (), fetch=True)
+        kbs = await local_doc_qa.milvus_summary_async.execute_query_(query, (), fetch=True)
         
         result = []
         for kb in kbs:
@@ -773,7 +746,7 @@ async def get_accessible_kbs(req: request):
         WHERE user_id = %s AND deleted = 0
         ORDER BY latest_insert_time DESC
     """
-    owned_kbs = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    owned_kbs = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     
     # 2. 获取用户直接被授权的知识库
     query = """
@@ -784,7 +757,7 @@ async def get_accessible_kbs(req: request):
         WHERE a.subject_type = 'user' AND a.subject_id = %s AND k.user_id != %s AND k.deleted = 0
         ORDER BY k.latest_insert_time DESC
     """
-    direct_kbs = local_doc_qa.milvus_summary.execute_query_(query, (user_id, user_id), fetch=True)
+    direct_kbs = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id, user_id), fetch=True)
     
     # 3. 获取用户通过部门被授权的知识库
     dept_kbs = []
@@ -802,12 +775,12 @@ async def get_accessible_kbs(req: request):
                   )
             ORDER BY k.latest_insert_time DESC
         """
-        dept_kbs = local_doc_qa.milvus_summary.execute_query_(query, (dept_id, user_id, user_id), fetch=True)
+        dept_kbs = await local_doc_qa.milvus_summary_async.execute_query_(query, (dept_id, user_id, user_id), fetch=True)
     
     # 4. 获取用户通过用户组被授权的知识库
     # 先获取用户所在的所有用户组
     query = "SELECT group_id FROM GroupMember WHERE user_id = %s"
-    user_groups = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    user_groups = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     
     group_kbs = []
     if user_groups:
@@ -826,7 +799,7 @@ async def get_accessible_kbs(req: request):
         else:
             exclude_kb_query = exclude_kb_query.replace("OR (subject_type = 'department' AND subject_id = %s)", "")
         
-        exclude_kbs = local_doc_qa.milvus_summary.execute_query_(exclude_kb_query, tuple(exclude_params), fetch=True)
+        exclude_kbs = await local_doc_qa.milvus_summary_async.execute_query_(exclude_kb_query, tuple(exclude_params), fetch=True)
         exclude_kb_ids = [kb[0] for kb in exclude_kbs] if exclude_kbs else []
         
         # 构建排除条件
@@ -851,7 +824,7 @@ async def get_accessible_kbs(req: request):
         if exclude_kb_ids:
             params.extend(exclude_kb_ids)
         
-        group_kbs_raw = local_doc_qa.milvus_summary.execute_query_(query, tuple(params), fetch=True)
+        group_kbs_raw = await local_doc_qa.milvus_summary_async.execute_query_(query, tuple(params), fetch=True)
         
         # 处理可能有多个用户组授权同一个知识库的情况，选择最高权限
         kb_group_map = {}
@@ -870,12 +843,16 @@ async def get_accessible_kbs(req: request):
                     'group_id': group_id
                 }
         
-        # 获取用户组名称
+        # 批量获取用户组名称
+        group_names = {}
+        group_ids = list({kb_info['group_id'] for kb_info in kb_group_map.values()})
+        if group_ids:
+            query = "SELECT group_id, group_name FROM UserGroup WHERE group_id IN ({})".format(
+                ','.join(['%s'] * len(group_ids)))
+            group_names = dict(await local_doc_qa.milvus_summary_async.execute_query_(query, group_ids, fetch=True) or [])
         for kb_id, kb_info in kb_group_map.items():
             group_id = kb_info['group_id']
-            query = "SELECT group_name FROM UserGroup WHERE group_id = %s"
-            group_name_result = local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True)
-            group_name = group_name_result[0][0] if group_name_result else "未知用户组"
+            group_name = group_names.get(group_id, "未知用户组")
             
             kb_data = list(kb_info['kb_data'])
             kb_data.append(group_id)
@@ -956,7 +933,7 @@ async def change_password(req: request):
     
     # 验证旧密码
     query = "SELECT password FROM User WHERE user_id = %s"
-    result = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    result = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     if not result:
         return sanic_json({"code": 404, "msg": "用户不存在"})
     
@@ -970,7 +947,7 @@ async def change_password(req: request):
     # 更新密码
     query = "UPDATE User SET password = %s WHERE user_id = %s"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (hashed_password, user_id), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (hashed_password, user_id), commit=True)
         return sanic_json({"code": 200, "msg": "密码修改成功"})
     except Exception as e:
         debug_logger.error(f"修改密码失败: {str(e)}")
@@ -991,7 +968,7 @@ async def get_user_profile(req: request):
         LEFT JOIN Department d ON u.dept_id = d.dept_id
         WHERE u.user_id = %s
     """
-    user_info = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    user_info = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     
     if not user_info:
         return sanic_json({"code": 404, "msg": "用户不存在"})
@@ -1003,7 +980,7 @@ async def get_user_profile(req: request):
         JOIN UserGroup g ON m.group_id = g.group_id
         WHERE m.user_id = %s
     """
-    user_groups = local_doc_qa.milvus_summary.execute_query_(query, (user_id,), fetch=True)
+    user_groups = await local_doc_qa.milvus_summary_async.execute_query_(query, (user_id,), fetch=True)
     groups = [{"group_id": g[0], "group_name": g[1]} for g in user_groups]
     
     # 构建返回结果
@@ -1041,7 +1018,7 @@ async def update_user_profile(req: request):
     if user_name:
         # 检查用户名是否已被其他用户使用
         query = "SELECT user_id FROM User WHERE user_name = %s AND user_id != %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (user_name, user_id), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (user_name, user_id), fetch=True):
             return sanic_json({"code": 400, "msg": "该用户名已被其他用户使用"})
         update_fields.append("user_name = %s")
         params.append(user_name)
@@ -1049,7 +1026,7 @@ async def update_user_profile(req: request):
     if email:
         # 检查邮箱是否已被其他用户使用
         query = "SELECT user_id FROM User WHERE email = %s AND user_id != %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (email, user_id), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (email, user_id), fetch=True):
             return sanic_json({"code": 400, "msg": "该邮箱已被其他用户使用"})
         update_fields.append("email = %s")
         params.append(email)
@@ -1059,7 +1036,7 @@ async def update_user_profile(req: request):
     params.append(user_id)
     
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, tuple(params), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, tuple(params), commit=True)
         return sanic_json({"code": 200, "msg": "个人信息更新成功"})
     except Exception as e:
         debug_logger.error(f"更新个人信息失败: {str(e)}")
@@ -20,7 +20,7 @@ async def create_group(req: request):
     
     # 检查用户组名称是否已存在
     query = "SELECT group_id FROM UserGroup WHERE group_name = %s"
-    if local_doc_qa.milvus_summary.execute_query_(query, (group_name,), fetch=True):
+    if await local_doc_qa.milvus_summary_async.execute_query_(query, (group_name,), fetch=True):
         return sanic_json({"code": 400, "msg": "该用户组名称已存在"})
     
     # 生成唯一的用户组ID
@@ -29,7 +29,7 @@ async def create_group(req: request):
     # 创建用户组
     query = "INSERT INTO UserGroup (group_id, group_name) VALUES (%s, %s)"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (group_id, group_name), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id, group_name), commit=True)
         return sanic_json({
             "code": 200, 
             "msg": "用户组创建成功", 
@@ -59,27 +59,16 @@ async def list_groups(req: request):
         GROUP BY g.group_id, g.group_name, g.creation_time
         ORDER BY g.creation_time
     """
-    groups = local_doc_qa.milvus_summary.execute_query_(query, (), fetch=True)
+    groups = await local_doc_qa.milvus_summary_async.execute_query_(query, (), fetch=True)
     
+    # 一次查询所有用户组的知识库权限
+    kb_access_by_subject = await local_doc_qa.milvus_summary_async.get_kb_access_by_subject_ids(
+        'group', [group[0] for group in groups or []])
+
     result = []
-    for group in groups:
-        group_id = group[0]
-        
-        # 查询用户组的知识库权限
-        kb_access_query = """
-            SELECT kb.kb_id, kb.kb_name, kba.permission_type, 
-                   kba.granted_by, u.user_name as granted_by_name,
-                   kba.granted_at
-            FROM KnowledgeBaseAccess kba
-            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
-            LEFT JOIN User u ON kba.granted_by = u.user_id
-            WHERE kba.subject_type = 'group'
-            AND kba.subject_id = %s
-            AND kb.deleted = 0
-            ORDER BY kba.granted_at DESC
-        """
-        kb_access = local_doc_qa.milvus_summary.execute_query_(kb_access_query, (group_id,), fetch=True)
-        
+    for group in groups or []:
+        kb_access = kb_access_by_subject.get(group[0], [])
+
         result.append({
             "group_id": group[0],
             "group_name": group[1],
@@ -116,7 +105,7 @@ async def update_group(req: request):
     
     # 检查用户组是否存在
     query = "SELECT group_id FROM UserGroup WHERE group_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户组不存在"})
     
     # 构建更新语句
@@ -126,7 +115,7 @@ async def update_group(req: request):
     if group_name:
         # 检查用户组名称是否已被其他用户组使用
         query = "SELECT group_id FROM UserGroup WHERE group_name = %s AND group_id != %s"
-        if local_doc_qa.milvus_summary.execute_query_(query, (group_name, group_id), fetch=True):
+        if await local_doc_qa.milvus_summary_async.execute_query_(query, (group_name, group_id), fetch=True):
             return sanic_json({"code": 400, "msg": "该用户组名称已被其他用户组使用"})
         update_fields.append("group_name = %s")
         params.append(group_name)
@@ -139,7 +128,7 @@ async def update_group(req: request):
     params.append(group_id)
     
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, tuple(params), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, tuple(params), commit=True)
         return sanic_json({"code": 200, "msg": "用户组更新成功"})
     except Exception as e:
         debug_logger.error(f"更新用户组失败: {str(e)}")
@@ -159,7 +148,7 @@ async def delete_group(req: request):
     
     # 检查用户组是否存在
     query = "SELECT group_id FROM UserGroup WHERE group_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户组不存在"})
     
     # 删除用户组
@@ -167,14 +156,14 @@ async def delete_group(req: request):
     try:
         # 先删除用户组成员关系
         member_query = "DELETE FROM GroupMember WHERE group_id = %s"
-        local_doc_qa.milvus_summary.execute_query_(member_query, (group_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(member_query, (group_id,), commit=True)
         
         # 删除用户组
-        local_doc_qa.milvus_summary.execute_query_(query, (group_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), commit=True)
         
         # 删除该用户组的所有知识库权限
         access_query = "DELETE FROM KnowledgeBaseAccess WHERE subject_id = %s AND subject_type = 'group'"
-        local_doc_qa.milvus_summary.execute_query_(access_query, (group_id,), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(access_query, (group_id,), commit=True)
         
         return sanic_json({"code": 200, "msg": "用户组删除成功"})
     except Exception as e:
@@ -199,7 +188,7 @@ async def add_user_to_group(req: request):
     
     # 检查用户组是否存在
     query = "SELECT group_id FROM UserGroup WHERE group_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户组不存在"})
     
     success_count = 0
@@ -209,7 +198,7 @@ async def add_user_to_group(req: request):
         try:
             # 检查用户是否存在
             query = "SELECT user_id FROM User WHERE user_id = %s AND status = 'active'"
-            if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id,), fetch=True):
+            if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id,), fetch=True):
                 failed_list.append({
                     "user_id": target_user_id,
                     "reason": "用户不存在或已被禁用"
@@ -218,7 +207,7 @@ async def add_user_to_group(req: request):
             
             # 检查用户是否已在用户组中
             query = "SELECT user_id FROM GroupMember WHERE user_id = %s AND group_id = %s"
-            if local_doc_qa.milvus_summary.execute_query_(query, (target_user_id, group_id), fetch=True):
+            if await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id, group_id), fetch=True):
                 failed_list.append({
                     "user_id": target_user_id,
                     "reason": "用户已在该用户组中"
@@ -227,7 +216,7 @@ async def add_user_to_group(req: request):
             
             # 添加用户到用户组
             query = "INSERT INTO GroupMember (user_id, group_id) VALUES (%s, %s)"
-            local_doc_qa.milvus_summary.execute_query_(query, (target_user_id, group_id), commit=True)
+            await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id, group_id), commit=True)
             success_count += 1
             
         except Exception as e:
@@ -262,13 +251,13 @@ async def remove_user_from_group(req: request):
     
     # 检查用户是否在用户组中
     query = "SELECT user_id FROM GroupMember WHERE user_id = %s AND group_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (target_user_id, group_id), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id, group_id), fetch=True):
         return sanic_json({"code": 404, "msg": "用户不在该用户组中"})
     
     # 从用户组中移除用户
     query = "DELETE FROM GroupMember WHERE user_id = %s AND group_id = %s"
     try:
-        local_doc_qa.milvus_summary.execute_query_(query, (target_user_id, group_id), commit=True)
+        await local_doc_qa.milvus_summary_async.execute_query_(query, (target_user_id, group_id), commit=True)
         return sanic_json({"code": 200, "msg": "从用户组中移除用户成功"})
     except Exception as e:
         debug_logger.error(f"从用户组中移除用户失败: {str(e)}")
@@ -288,7 +277,7 @@ async def list_group_members(req: request):
     
     # 检查用户组是否存在
     query = "SELECT group_id FROM UserGroup WHERE group_id = %s"
-    if not local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True):
+    if not await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), fetch=True):
         return sanic_json({"code": 404, "msg": "用户组不存在"})
     
     # 获取用户组成员
@@ -300,7 +289,7 @@ async def list_group_members(req: request):
         WHERE gm.group_id = %s AND u.status = 'active'
         ORDER BY gm.creation_time
     """
-    members = local_doc_qa.milvus_summary.execute_query_(query, (group_id,), fetch=True)
+    members = await local_doc_qa.milvus_summary_async.execute_query_(query, (group_id,), fetch=True)
     
     result = []
     for member in members:
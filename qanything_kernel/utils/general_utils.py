@@ -5,6 +5,7 @@ from qanything_kernel.configs.model_config import (KB_SUFFIX, UPLOAD_ROOT_PATH,
 from transformers import AutoTokenizer
 import pandas as pd
 import inspect
+import json
 import traceback
 from urllib.parse import urlparse
 import time
@@ -16,7 +17,7 @@ import aiohttp
 from functools import wraps
 import tiktoken
 from openpyxl.utils import get_column_letter
-from openpyxl import load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 import numpy as np
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
@@ -36,7 +37,8 @@ from io import BytesIO
 __all__ = ['isURL', 'get_time', 'get_time_async', 'format_source_documents', 'safe_get', 'truncate_filename',
            'shorten_data', 'read_files_with_extensions', 'validate_user_id', 'get_invalid_user_id_msg', 'num_tokens',
            'clear_string', 'simplify_filename', 'string_bytes_length', 'correct_kb_id', 'clear_kb_id',
-           'clear_string_is_equal', 'export_qalogs_to_excel', 'deduplicate_documents', 'fast_estimate_file_char_count',
+           'clear_string_is_equal', 'QaLogExcelWriter', 'qalog_export_row', 'deduplicate_documents',
+           'fast_estimate_file_char_count',
            'check_user_id_and_user_info', 'get_table_infos', 'format_time_record', 'get_time_range',
            'html_to_markdown', "num_tokens_embed", "num_tokens_rerank", "get_all_subpages", "replace_image_references", 'check_and_transform_excel']
 
@@ -362,29 +364,56 @@ def string_bytes_length(string):
     return len(string.encode('utf-8'))
 
 
-def export_qalogs_to_excel(qalogs, columns, filename: str):
-    # 将查询结果转换为 DataFrame
-    df = pd.DataFrame(qalogs, columns=columns)
+def qalog_export_row(qalog, columns, max_cell_length=None):
+    """问答记录转成导出的一行，时间转为字符串，可选截断过长的单元格"""
+    row = []
+    for column in columns:
+        value = qalog.get(column)
+        if isinstance(value, datetime):
+            value = value.strftime("%Y-%m-%d %H:%M:%S")
+        elif value is not None and not isinstance(value, (str, int, float)):
+            value = json.dumps(value, ensure_ascii=False)
+        if max_cell_length and isinstance(value, str) and len(value) > max_cell_length:
+            value = value[:max_cell_length]
+        row.append(value)
+    return row
 
-    # 写入 Excel 文件
-    root_path = os.path.dirname(UPLOAD_ROOT_PATH) + '/saved_qalogs'
-    if not os.path.exists(root_path):
-        os.makedirs(root_path)
 
-    file_path = os.path.join(root_path, filename)
-    df.to_excel(file_path, index=False)
-
-    # 使用 openpyxl 调整列宽
-    workbook = load_workbook(filename=file_path)
-    worksheet = workbook.active
-
-    for column_cells in worksheet.columns:
-        length = max(len(str(cell.value)) for cell in column_cells)
-        worksheet.column_dimensions[get_column_letter(column_cells[0].column)].width = length
-
-    workbook.save(file_path)
-    debug_logger.info(f"Data exported to {file_path} successfully.")
-    return file_path
+class QaLogExcelWriter:
+    """
+    使用openpyxl的只写模式逐批写入问答记录，行数据直接写入临时文件，内存占用与导出的总行数无关。
+    只写模式必须在写第一行之前设置列宽，列宽按第一批数据估算。
+    """
+    MAX_CELL_LENGTH = 32767  # Excel单元格的最大字符数
+    MAX_COLUMN_WIDTH = 100
+
+    def __init__(self, columns, filename: str):
+        root_path = os.path.dirname(UPLOAD_ROOT_PATH) + '/saved_qalogs'
+        os.makedirs(root_path, exist_ok=True)
+        self.file_path = os.path.join(root_path, filename)
+        self.columns = columns
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet()
+        self.header_written = False
+
+    def write(self, qalogs):
+        rows = [[ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+                 for value in qalog_export_row(qalog, self.columns, self.MAX_CELL_LENGTH)] for qalog in qalogs]
+        if not self.header_written:
+            for i, column in enumerate(self.columns):
+                length = max([len(column)] + [len(str(row[i])) for row in rows if row[i] is not None])
+                self.worksheet.column_dimensions[get_column_letter(i + 1)].width = min(length, self.MAX_COLUMN_WIDTH)
+            self.worksheet.append(self.columns)
+            self.header_written = True
+        for row in rows:
+            self.worksheet.append(row)
+
+    def save(self):
+        if not self.header_written:
+            self.write([])
+        self.workbook.save(self.file_path)
+        debug_logger.info(f"Data exported to {self.file_path} successfully.")
+        return self.file_path
 
 
 def check_user_id_and_user_info(user_id, user_info):
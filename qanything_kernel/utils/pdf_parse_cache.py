@@ -0,0 +1,101 @@
+from qanything_kernel.configs.model_config import PDF_PARSE_CACHE_PATH, PDF_PARSE_CACHE_MAX_SIZE, PDF_PARSER_VERSION
+from qanything_kernel.utils.custom_log import insert_logger
+import traceback
+import hashlib
+import shutil
+import uuid
+import os
+
+
+class PdfParseCache:
+    """
+    PDF解析结果的本地磁盘缓存，key为文件内容的sha256+解析器版本。
+    每个缓存条目是一个目录，保存生成的markdown（parsed.md）以及解析出的图片，
+    同一份PDF无论上传到哪个知识库、哪个用户，或删除后重新上传，都可以直接复用解析结果。
+    """
+    MARKDOWN_NAME = 'parsed.md'
+
+    def __init__(self, cache_root=PDF_PARSE_CACHE_PATH, max_size=PDF_PARSE_CACHE_MAX_SIZE,
+                 version=PDF_PARSER_VERSION):
+        self.cache_root = os.path.join(cache_root, version)
+        self.max_size = max_size
+        os.makedirs(self.cache_root, exist_ok=True)
+
+    @staticmethod
+    def file_hash(file_path, block_size=1024 * 1024):
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def _entry_dir(self, file_hash):
+        return os.path.join(self.cache_root, file_hash)
+
+    def get(self, file_hash, output_dir, markdown_name):
+        """命中时把缓存的markdown和图片还原到output_dir，返回markdown路径，未命中返回None"""
+        entry_dir = self._entry_dir(file_hash)
+        cached_markdown = os.path.join(entry_dir, self.MARKDOWN_NAME)
+        if not os.path.exists(cached_markdown):
+            return None
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            for name in os.listdir(entry_dir):
+                if name == self.MARKDOWN_NAME:
+                    continue
+                shutil.copy(os.path.join(entry_dir, name), output_dir)
+            markdown_file = os.path.join(output_dir, markdown_name)
+            shutil.copy(cached_markdown, markdown_file)
+            # 更新mtime，淘汰时按最近使用时间排序
+            os.utime(entry_dir, None)
+            insert_logger.info(f"pdf parse cache hit: {file_hash} -> {markdown_file}")
+            return markdown_file
+        except Exception:
+            insert_logger.warning(f"pdf parse cache read error: {file_hash}, {traceback.format_exc()}")
+            return None
+
+    def put(self, file_hash, markdown_file):
+        """把解析结果所在目录（markdown+jpg图片）写入缓存，先写临时目录再rename，保证并发写入时条目完整"""
+        entry_dir = self._entry_dir(file_hash)
+        if os.path.exists(entry_dir):
+            return
+        tmp_dir = os.path.join(self.cache_root, f'.tmp_{uuid.uuid4().hex}')
+        try:
+            os.makedirs(tmp_dir)
+            markdown_dir = os.path.dirname(markdown_file)
+            for name in os.listdir(markdown_dir):
+                if name.endswith('.jpg'):
+                    shutil.copy(os.path.join(markdown_dir, name), tmp_dir)
+            shutil.copy(markdown_file, os.path.join(tmp_dir, self.MARKDOWN_NAME))
+            os.rename(tmp_dir, entry_dir)
+            insert_logger.info(f"pdf parse cache put: {file_hash}")
+        except Exception:
+            # 其他worker已经写入了同一个条目，或磁盘异常，都不影响本次解析结果
+            insert_logger.warning(f"pdf parse cache write error: {file_hash}, {traceback.format_exc()}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_root):
+            entry_dir = os.path.join(self.cache_root, name)
+            if name.startswith('.tmp_') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+            except FileNotFoundError:
+                continue
+            total_size += size
+        if total_size <= self.max_size:
+            return
+        # 最久未使用的先淘汰
+        entries.sort()
+        for _, size, entry_dir in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            insert_logger.info(f"pdf parse cache evict: {entry_dir}, size: {size}")
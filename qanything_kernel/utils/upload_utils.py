@@ -0,0 +1,111 @@
+from qanything_kernel.configs.model_config import UPLOAD_WORKERS
+from qanything_kernel.utils.general_utils import fast_estimate_file_char_count
+from concurrent.futures import ThreadPoolExecutor
+from sanic.headers import parse_content_header
+import urllib.parse
+import asyncio
+
+# 上传文件的写盘、字符数估算在线程池中执行，不阻塞事件循环
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+
+
+async def run_in_upload_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(upload_executor, func, *args)
+
+
+async def estimate_file_chars(file_locations):
+    """并发估算多个文件的字符数，PDF等需要完整打开文件的格式不会阻塞事件循环"""
+    return await asyncio.gather(*[run_in_upload_pool(fast_estimate_file_char_count, file_location)
+                                  for file_location in file_locations])
+
+
+class MultipartStreamParser:
+    """
+    增量解析multipart/form-data请求体，请求体按块送入feed，文件内容边到达边交给调用方写盘，不在内存中保留整个文件。
+    feed返回事件列表：
+        ('part', name, filename)  新的表单项开始，filename为None时是普通字段
+        ('data', bytes)           当前表单项的一段内容
+        ('end',)                  当前表单项结束
+    """
+    MAX_HEADER_SIZE = 16 * 1024
+
+    def __init__(self, content_type):
+        _, options = parse_content_header(content_type or '')
+        boundary = options.get('boundary')
+        if not boundary:
+            raise ValueError(f'invalid multipart content-type: {content_type}')
+        self.first_delimiter = b'--' + boundary.encode()
+        self.delimiter = b'\r\n--' + boundary.encode()
+        self.buffer = bytearray()
+        self.state = 'preamble'
+
+    @property
+    def finished(self):
+        return self.state == 'done'
+
+    @staticmethod
+    def parse_part_headers(raw_headers):
+        name, filename = None, None
+        for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip().lower() != 'content-disposition':
+                continue
+            _, options = parse_content_header(value.strip())
+            name = options.get('name')
+            filename = options.get('filename')
+            # RFC 5987编码的文件名，形如 UTF-8''%E6%96%87%E4%BB%B6.pdf
+            encoded_filename = options.get('filename*')
+            if encoded_filename:
+                charset, _, quoted = encoded_filename.partition("''")
+                filename = urllib.parse.unquote(quoted, encoding=charset or 'utf-8')
+        return name, filename
+
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        while True:
+            if self.state == 'preamble':
+                idx = self.buffer.find(self.first_delimiter)
+                if idx < 0:
+                    del self.buffer[:max(0, len(self.buffer) - len(self.first_delimiter))]
+                    break
+                del self.buffer[:idx + len(self.first_delimiter)]
+                self.state = 'delimiter'
+            elif self.state == 'delimiter':
+                if len(self.buffer) < 2:
+                    break
+                if self.buffer[:2] == b'--':
+                    self.state = 'done'
+                    self.buffer.clear()
+                    break
+                if self.buffer[:2] != b'\r\n':
+                    raise ValueError('invalid multipart body: bad boundary line')
+                del self.buffer[:2]
+                self.state = 'headers'
+            elif self.state == 'headers':
+                idx = self.buffer.find(b'\r\n\r\n')
+                if idx < 0:
+                    if len(self.buffer) > self.MAX_HEADER_SIZE:
+                        raise ValueError('invalid multipart body: part headers too large')
+                    break
+                name, filename = self.parse_part_headers(bytes(self.buffer[:idx]))
+                del self.buffer[:idx + 4]
+                events.append(('part', name, filename))
+                self.state = 'body'
+            elif self.state == 'body':
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    # 末尾可能是被截断的分隔符，保留到下一块再判断
+                    safe = len(self.buffer) - len(self.delimiter) + 1
+                    if safe > 0:
+                        events.append(('data', bytes(self.buffer[:safe])))
+                        del self.buffer[:safe]
+                    break
+                if idx:
+                    events.append(('data', bytes(self.buffer[:idx])))
+                del self.buffer[:idx + len(self.delimiter)]
+                events.append(('end',))
+                self.state = 'delimiter'
+            else:
+                break
+        return events
@@ -0,0 +1,132 @@
+import sys
+import os
+
+# 将项目根目录添加到sys.path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from qanything_kernel.connector.database.mysql import mysql_client
+import argparse
+import random
+import time
+
+# 用法：python scripts/benchmark_list_users.py [--database qanything_bench] [--users 10000] [--page_limit 100]
+# 在独立的数据库中生成模拟的用户、部门、用户组、知识库和授权数据，
+# 对比list_users逐个用户查询（N+1）与批量加载两种方式的查询次数和耗时，并检查两者结果一致
+parser = argparse.ArgumentParser()
+parser.add_argument('--database', type=str, default='qanything_bench', help='benchmark database, will be filled with fake data')
+parser.add_argument('--users', type=int, default=10000, help='number of fake users')
+parser.add_argument('--depts', type=int, default=100, help='number of fake departments')
+parser.add_argument('--groups', type=int, default=500, help='number of fake user groups')
+parser.add_argument('--kbs', type=int, default=5000, help='number of fake knowledge bases')
+parser.add_argument('--groups_per_user', type=int, default=3, help='groups each user joins')
+parser.add_argument('--grants_per_user', type=int, default=3, help='kbs directly granted to each user')
+parser.add_argument('--page_limit', type=int, default=0, help='users per page, 0 means all users')
+parser.add_argument('--batch_size', type=int, default=1000, help='rows per insert statement')
+args = parser.parse_args()
+
+
+class CountingManager(mysql_client.KnowledgeBaseManager):
+    """统计执行的SQL条数"""
+    query_count = 0
+
+    def execute_query_(self, query, params, commit=False, fetch=False, check=False, user_dict=False):
+        self.query_count += 1
+        return super().execute_query_(query, params, commit=commit, fetch=fetch, check=check, user_dict=user_dict)
+
+
+def bulk_insert(manager, table, columns, rows):
+    for i in range(0, len(rows), args.batch_size):
+        batch = rows[i:i + args.batch_size]
+        placeholders = ','.join(['(' + ','.join(['%s'] * len(columns)) + ')'] * len(batch))
+        query = f"INSERT IGNORE INTO {table} ({','.join(columns)}) VALUES {placeholders}"
+        manager.execute_query_(query, [v for row in batch for v in row], commit=True)
+
+
+def prepare_data(manager):
+    count = manager.execute_query_("SELECT COUNT(*) FROM User WHERE user_id LIKE 'bench_user_%'", (), fetch=True)
+    if count and count[0][0] >= args.users:
+        print(f"reuse existing fake data in {args.database}")
+        return
+    start = time.perf_counter()
+    random.seed(0)
+    dept_ids = [f'bench_dept_{i}' for i in range(args.depts)]
+    group_ids = [f'bench_group_{i}' for i in range(args.groups)]
+    user_ids = [f'bench_user_{i}' for i in range(args.users)]
+    kb_ids = [f'bench_kb_{i}' for i in range(args.kbs)]
+    bulk_insert(manager, 'Department', ['dept_id', 'dept_name'], [(d, d) for d in dept_ids])
+    bulk_insert(manager, 'UserGroup', ['group_id', 'group_name'], [(g, g) for g in group_ids])
+    bulk_insert(manager, 'User', ['user_id', 'user_name', 'dept_id', 'email', 'password'],
+                [(u, u, random.choice(dept_ids), f'{u}@bench.local', '') for u in user_ids])
+    bulk_insert(manager, 'KnowledgeBase', ['kb_id', 'user_id', 'kb_name'],
+                [(k, random.choice(user_ids), k) for k in kb_ids])
+    bulk_insert(manager, 'GroupMember', ['group_id', 'user_id'],
+                [(g, u) for u in user_ids for g in random.sample(group_ids, args.groups_per_user)])
+    grants = [(k, u, 'user', random.choice(['read', 'write', 'admin']), 'bench_user_0')
+              for u in user_ids for k in random.sample(kb_ids, args.grants_per_user)]
+    grants += [(k, g, 'group', 'read', 'bench_user_0') for g in group_ids for k in random.sample(kb_ids, 2)]
+    grants += [(k, d, 'department', 'read', 'bench_user_0') for d in dept_ids for k in random.sample(kb_ids, 2)]
+    bulk_insert(manager, 'KnowledgeBaseAccess', ['kb_id', 'subject_id', 'subject_type', 'permission_type',
+                                                 'granted_by'], grants)
+    print(f"fake data prepared in {time.perf_counter() - start:.2f}s")
+
+
+def load_per_user(manager, user_ids):
+    """改造前list_users的查询方式：每个用户分别查询用户组、拥有的知识库和被授权的知识库"""
+    result = {}
+    for user_id in user_ids:
+        groups = manager.execute_query_("""
+            SELECT g.group_id, g.group_name, gm.creation_time FROM GroupMember gm
+            JOIN UserGroup g ON gm.group_id = g.group_id
+            WHERE gm.user_id = %s ORDER BY gm.creation_time DESC
+        """, (user_id,), fetch=True)
+        owned_kbs = manager.execute_query_("""
+            SELECT kb_id, kb_name, latest_insert_time FROM KnowledgeBase
+            WHERE user_id = %s AND deleted = 0 ORDER BY latest_insert_time DESC
+        """, (user_id,), fetch=True)
+        kb_access = manager.execute_query_("""
+            SELECT kb.kb_id, kb.kb_name, kba.permission_type, kba.granted_by, u.user_name, kba.granted_at
+            FROM KnowledgeBaseAccess kba
+            JOIN KnowledgeBase kb ON kba.kb_id = kb.kb_id
+            LEFT JOIN User u ON kba.granted_by = u.user_id
+            WHERE kba.subject_type = 'user' AND kba.subject_id = %s AND kb.deleted = 0
+            ORDER BY kba.granted_at DESC
+        """, (user_id,), fetch=True)
+        result[user_id] = (sorted(groups), sorted(owned_kbs), sorted(kb_access))
+    return result
+
+
+def load_batched(manager, user_ids):
+    groups = manager.get_groups_by_user_ids(user_ids)
+    owned_kbs = manager.get_owned_kbs_by_user_ids(user_ids)
+    kb_access = manager.get_kb_access_by_subject_ids('user', user_ids)
+    return {user_id: (sorted(groups[user_id]), sorted(owned_kbs[user_id]), sorted(kb_access[user_id]))
+            for user_id in user_ids}
+
+
+def main():
+    mysql_client.MYSQL_DATABASE_LOCAL = args.database
+    manager = CountingManager()
+    prepare_data(manager)
+
+    query = "SELECT user_id FROM User WHERE user_id LIKE 'bench_user_%' ORDER BY creation_time DESC, id DESC"
+    if args.page_limit:
+        query += f" LIMIT {args.page_limit}"
+    user_ids = [row[0] for row in manager.execute_query_(query, (), fetch=True)]
+    print(f"users per page: {len(user_ids)}")
+
+    costs = {}
+    results = {}
+    for name, loader in (('per-user (N+1)', load_per_user), ('batched', load_batched)):
+        manager.query_count = 0
+        start = time.perf_counter()
+        results[name] = loader(manager, user_ids)
+        costs[name] = time.perf_counter() - start
+        print(f"{name}: {manager.query_count} queries, {costs[name]:.3f}s")
+
+    assert results['per-user (N+1)'] == results['batched'], "batched loaders return different listings"
+    print(f"speedup: {costs['per-user (N+1)'] / max(costs['batched'], 1e-9):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
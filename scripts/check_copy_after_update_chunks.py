@@ -0,0 +1,93 @@
+import requests
+import argparse
+import json
+import time
+import uuid
+import sys
+
+# 用法：python scripts/check_copy_after_update_chunks.py 文件.pdf [--host 0.0.0.0:8777] [--user_id zzp]
+# 上传文件并等待入库完成，用update_chunks修改第一个分块后把文件复制到另一个知识库，
+# 检查源文件的chunks_number随修改变化、复制出的文件直接复制了修改后的内容（没有重新解析丢失修改）
+parser = argparse.ArgumentParser()
+parser.add_argument('file', type=str, help='file to upload')
+parser.add_argument('--host', type=str, default='0.0.0.0:8777', help='qanything server')
+parser.add_argument('--user_id', type=str, default='zzp', help='user_id')
+parser.add_argument('--timeout', type=int, default=600, help='seconds to wait for a file to be green')
+args = parser.parse_args()
+
+base_url = f"http://{args.host}/api/local_doc_qa"
+
+
+def post(path, data):
+    response = requests.post(f"{base_url}/{path}", json=data)
+    res = response.json()
+    if res.get('code') != 200:
+        print(f"{path} failed: {response.text}")
+        sys.exit(1)
+    return res
+
+
+def new_kb(kb_name):
+    return post('new_knowledge_base', {"user_id": args.user_id, "kb_name": kb_name})['data']['kb_id']
+
+
+def get_file(kb_id, file_id):
+    return post('list_files', {"user_id": args.user_id, "kb_id": kb_id, "file_id": file_id})['data']['details'][0]
+
+
+def wait_green(kb_id, file_id):
+    start = time.time()
+    while time.time() - start < args.timeout:
+        file = get_file(kb_id, file_id)
+        if file['status'] == 'green':
+            return file
+        if file['status'] == 'red':
+            print(f"file {file_id} failed: {file['msg']}")
+            sys.exit(1)
+        time.sleep(2)
+    print(f"file {file_id} is not green after {args.timeout}s")
+    sys.exit(1)
+
+
+def get_chunks(kb_id, file_id):
+    return post('get_doc_completed', {"user_id": args.user_id, "kb_id": kb_id, "file_id": file_id,
+                                      "page_id": 1, "page_limit": 100})['chunks']
+
+
+def main():
+    src_kb_id = new_kb('copy_after_update_src')
+    dst_kb_id = new_kb('copy_after_update_dst')
+    with open(args.file, 'rb') as f:
+        response = requests.post(f"{base_url}/upload_files", files=[("files", f)],
+                                 data={"user_id": args.user_id, "kb_id": src_kb_id})
+    file_id = response.json()['data'][0]['file_id']
+    src_file = wait_green(src_kb_id, file_id)
+
+    marker = f"手动修改后的内容 {uuid.uuid4().hex}"
+    chunk = get_chunks(src_kb_id, file_id)[0]
+    res = post('update_chunks', {"user_id": args.user_id, "kb_id": src_kb_id, "doc_id": chunk['chunk_id'],
+                                 "update_content": marker})
+    time_record = res.get('time_record', {})
+    expected_chunks = src_file['chunks_number'] + time_record.get('added_chunks', 0) - \
+        time_record.get('deleted_chunks', 0)
+    edited_file = get_file(src_kb_id, file_id)
+    print(f"update_chunks: {time_record}, chunks_number {src_file['chunks_number']} -> {edited_file['chunks_number']}")
+    if time_record and edited_file['chunks_number'] != expected_chunks:
+        print(f"chunks_number not updated, expected {expected_chunks}")
+        sys.exit(1)
+
+    copied = post('copy_files', {"user_id": args.user_id, "kb_id": src_kb_id, "target_kb_id": dst_kb_id,
+                                 "file_ids": [file_id]})['data'][0]
+    copied_file = wait_green(dst_kb_id, copied['file_id'])
+    msg = json.loads(copied_file['msg']) if copied_file['msg'] else {}
+    if msg.get('dedup_source') != file_id:
+        print(f"copied file was re-parsed instead of cloned: {copied_file['msg']}")
+        sys.exit(1)
+    if not any(marker in chunk['page_content'] for chunk in get_chunks(dst_kb_id, copied['file_id'])):
+        print("edited content is missing in the copied file")
+        sys.exit(1)
+    print(f"ok: {file_id} -> {copied['file_id']}, chunks_number {copied_file['chunks_number']}")
+
+
+if __name__ == '__main__':
+    main()
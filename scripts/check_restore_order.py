@@ -0,0 +1,118 @@
+import sys
+import os
+
+# 将项目根目录添加到sys.path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from qanything_kernel.dependent_server.pdf_parser_server.pdf_to_markdown.core.vision.recognizer import Recognizer
+from qanything_kernel.dependent_server.pdf_parser_server.pdf_to_markdown.core.parser.pdf_parser import HuParser
+import argparse
+import random
+import time
+
+# 用法：python scripts/check_restore_order.py [--rounds 2000] [--max_boxes 60] [--seed 0] [--bench_boxes 2000]
+# 用随机生成的box（top/x0大量重复、部分box缺少R/C）对比Recognizer.sort_Y/X/C/R_firstly、HuParser.sort_X_by_page
+# 与原先逐轮冒泡修正实现的输出是否完全一致，并对比两者在一页较多box时的耗时
+parser = argparse.ArgumentParser()
+parser.add_argument('--rounds', type=int, default=2000, help='random cases per function')
+parser.add_argument('--max_boxes', type=int, default=60, help='max boxes per random case')
+parser.add_argument('--seed', type=int, default=0, help='random seed')
+parser.add_argument('--bench_boxes', type=int, default=2000, help='boxes in the timing case, 0 to skip')
+args = parser.parse_args()
+
+
+def bubble_restore(arr, need_swap):
+    """原实现：每一轮从i扫到0修正相邻对"""
+    for i in range(len(arr) - 1):
+        for j in range(i, -1, -1):
+            if need_swap(arr[j], arr[j + 1]):
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+
+def old_sort_Y_firstly(arr, threashold):
+    arr = sorted(arr, key=lambda r: (r["top"], r["x0"]))
+    return bubble_restore(arr, lambda a, b: abs(b["top"] - a["top"]) < threashold and b["x0"] < a["x0"])
+
+
+def old_sort_X_firstly(arr, threashold):
+    arr = sorted(arr, key=lambda r: (r["x0"], r["top"]))
+    return bubble_restore(arr, lambda a, b: abs(b["x0"] - a["x0"]) < threashold and b["top"] < a["top"])
+
+
+def old_sort_C_firstly(arr, thr=0):
+    arr = old_sort_X_firstly(arr, thr)
+    return bubble_restore(arr, lambda a, b: "C" in a and "C" in b and (
+            b["C"] < a["C"] or (b["C"] == a["C"] and b["top"] < a["top"])))
+
+
+def old_sort_R_firstly(arr, thr=0):
+    arr = old_sort_Y_firstly(arr, thr)
+    return bubble_restore(arr, lambda a, b: "R" in a and "R" in b and (
+            b["R"] < a["R"] or (b["R"] == a["R"] and b["x0"] < a["x0"])))
+
+
+def old_sort_X_by_page(arr, threashold):
+    arr = sorted(arr, key=lambda r: (r["page_number"], r["x0"], r["top"]))
+    return bubble_restore(arr, lambda a, b: abs(b["x0"] - a["x0"]) < threashold and b["top"] < a["top"]
+                          and b["page_number"] == a["page_number"])
+
+
+CASES = [
+    ('sort_Y_firstly', old_sort_Y_firstly, Recognizer.sort_Y_firstly),
+    ('sort_X_firstly', old_sort_X_firstly, Recognizer.sort_X_firstly),
+    ('sort_C_firstly', old_sort_C_firstly, Recognizer.sort_C_firstly),
+    ('sort_R_firstly', old_sort_R_firstly, Recognizer.sort_R_firstly),
+    ('sort_X_by_page', old_sort_X_by_page, HuParser.sort_X_by_page),
+]
+
+
+def random_boxes(rng, n):
+    # 坐标取值范围小，制造大量相等的top/x0
+    span = rng.choice([5, 50, 1000])
+    boxes = []
+    for idx in range(n):
+        box = {"idx": idx, "top": rng.randint(0, span), "x0": rng.randint(0, span), "page_number": rng.randint(1, 3)}
+        if rng.random() < 0.8:
+            box["R"] = rng.randint(0, 5)
+        if rng.random() < 0.8:
+            box["C"] = rng.randint(0, 5)
+        boxes.append(box)
+    return boxes
+
+
+def order(arr):
+    return [box["idx"] for box in arr]
+
+
+def main():
+    rng = random.Random(args.seed)
+    failed = 0
+    for name, old, new in CASES:
+        for _ in range(args.rounds):
+            boxes = random_boxes(rng, rng.randint(0, args.max_boxes))
+            threashold = rng.choice([0, 1, 3, 10, 100, 1000])
+            expected, actual = order(old(list(boxes), threashold)), order(new(list(boxes), threashold))
+            if expected != actual:
+                failed += 1
+                print(f"{name} mismatch, threashold {threashold}: {boxes}")
+                break
+        print(f"{name}: {'ok' if not failed else 'FAILED'}")
+    if args.bench_boxes:
+        # 一页中行内少量乱序的典型情况
+        boxes = [{"idx": idx, "top": idx // 10 * 12 + rng.randint(0, 2), "x0": idx % 10 * 50 + rng.randint(0, 5),
+                  "page_number": 1} for idx in range(args.bench_boxes)]
+        for name, old, new in CASES[:2]:
+            start = time.perf_counter()
+            old(list(boxes), 5)
+            old_cost = time.perf_counter() - start
+            start = time.perf_counter()
+            new(list(boxes), 5)
+            new_cost = time.perf_counter() - start
+            print(f"{name} {args.bench_boxes} boxes: old {old_cost:.3f}s, new {new_cost:.3f}s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
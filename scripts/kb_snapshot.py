@@ -0,0 +1,50 @@
+import sys
+import os
+
+# 将项目根目录添加到sys.path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from qanything_kernel.connector.database.mysql.mysql_client import KnowledgeBaseManager
+from qanything_kernel.core.retriever.vectorstore import VectorStoreMilvusClient
+from qanything_kernel.core.retriever.elasticsearchstore import StoreElasticSearchClient
+from qanything_kernel.core.kb_snapshot import KbSnapshot
+import argparse
+import json
+
+# 用法：
+#   导出：python scripts/kb_snapshot.py export --kb_id KBxxx --output kb.tar [--skip_files]
+#   导入：python scripts/kb_snapshot.py import --input kb.tar [--kb_id KBxxx] [--user_id zzp] [--kb_name name] [--new_ids]
+# 导出知识库的文件记录、父文档、向量、ES记录、图片和原始文件为一个快照包，在其他环境（或同一环境）中导入，
+# 导入时直接写入快照中的向量，不重新解析和embedding
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest='command', required=True)
+export_parser = subparsers.add_parser('export', help='export a knowledge base to a snapshot')
+export_parser.add_argument('--kb_id', type=str, required=True, help='knowledge base to export')
+export_parser.add_argument('--output', type=str, required=True, help='snapshot path')
+export_parser.add_argument('--skip_files', action='store_true', help='do not include original uploaded files')
+export_parser.add_argument('--batch_size', type=int, default=1000, help='rows per batch')
+import_parser = subparsers.add_parser('import', help='import a snapshot as a new knowledge base')
+import_parser.add_argument('--input', type=str, required=True, help='snapshot path')
+import_parser.add_argument('--kb_id', type=str, default=None, help='kb_id of the new knowledge base')
+import_parser.add_argument('--user_id', type=str, default=None, help='owner of the new knowledge base')
+import_parser.add_argument('--kb_name', type=str, default=None, help='name of the new knowledge base')
+import_parser.add_argument('--new_ids', action='store_true', help='generate new kb_id and file_ids')
+import_parser.add_argument('--batch_size', type=int, default=1000, help='rows per batch')
+args = parser.parse_args()
+
+
+def main():
+    snapshot = KbSnapshot(KnowledgeBaseManager(), VectorStoreMilvusClient(), StoreElasticSearchClient(),
+                          batch_size=args.batch_size)
+    if args.command == 'export':
+        manifest = snapshot.export_kb(args.kb_id, args.output, include_files=not args.skip_files)
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    else:
+        kb_id = snapshot.import_kb(args.input, kb_id=args.kb_id, user_id=args.user_id, kb_name=args.kb_name,
+                                   new_ids=args.new_ids)
+        print(f"imported as {kb_id}")
+
+
+if __name__ == '__main__':
+    main()